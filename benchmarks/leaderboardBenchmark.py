@@ -0,0 +1,104 @@
+"""
+Benchmark for the relative leaderboard engine in playerTrackerData.
+
+Fills a scratch database with synthetic data (see :mod:`benchmarks.syntheticData`) and compares the rollup based
+:func:`playerTrackerData.get_gain_leaderboard` with the previous min/max scan over player_tracking.
+
+Usage: ``python -m benchmarks.leaderboardBenchmark [--players N] [--snapshots M] [--db PATH]``
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import syntheticData
+from common.storage import manager, playerTrackerData
+from common.types.enums import PlayerStatsIdentifier
+from common.utils.tableBuilder import TableBuilder
+
+# The warcount query before the daily rollups were introduced.
+_RAW_WARCOUNT_SQL = """
+    SELECT row_number() over () as rank, uuid, wars FROM (
+        SELECT a.uuid as uuid, wars_max - wars_min as wars
+        FROM (
+            SELECT uuid, max(wars) as wars_max
+            FROM player_tracking
+            INDEXED BY wars_idx
+            WHERE wars > 0
+            AND record_time >= ?
+            AND record_time <= ?
+            GROUP BY uuid
+        ) as a
+        JOIN (
+            SELECT uuid, min(wars) as wars_min
+            FROM player_tracking
+            INDEXED BY wars_idx
+            WHERE wars > 0
+            AND record_time >= ?
+            AND record_time <= ?
+            GROUP BY uuid
+        ) as b
+        ON a.uuid = b.uuid AND a.wars_max > b.wars_min
+        ORDER BY wars DESC
+        LIMIT 100
+    )
+"""
+
+
+async def _time(f, *args, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        await f(*args)
+        t = time.perf_counter() - t
+        best = t if best is None else min(best, t)
+    return best
+
+
+async def _raw_warcount(t_from: datetime, t_to: datetime):
+    cur = await manager.get_read_cursor()
+    res = await cur.execute(_RAW_WARCOUNT_SQL, (t_from, t_to, t_from, t_to))
+    return await res.fetchall()
+
+
+async def _engine(stat: PlayerStatsIdentifier, t_from: datetime, t_to: datetime):
+    # bypass the alru cache so every run hits the database
+    return await playerTrackerData.get_gain_leaderboard.__wrapped__(stat, t_from, t_to)
+
+
+async def run(players: int, snapshots: int, path: str):
+    print(f"Generating about {players * snapshots} snapshots ({players} players x {snapshots})...")
+    t = time.perf_counter()
+    await syntheticData.fill(path, players, snapshots)
+    print(f"Generated data and backfilled rollups in {time.perf_counter() - t:.2f}s")
+
+    table = TableBuilder.from_str('l  l  r')
+    table.add_row("Query", "Timeframe", "Best of 3 (s)")
+    table.add_seperator_row()
+    for days in (7, 30, 90):
+        t_to = syntheticData.END
+        t_from = t_to - timedelta(days=days)
+        table.add_row("wars (raw scan)", f"{days} days", f"{await _time(_raw_warcount, t_from, t_to):.4f}")
+        for stat in (PlayerStatsIdentifier.WARS, PlayerStatsIdentifier.PLAYTIME, PlayerStatsIdentifier.KILLED_MOBS):
+            table.add_row(f"{stat} (rollup)", f"{days} days", f"{await _time(_engine, stat, t_from, t_to):.4f}")
+    for stat in (PlayerStatsIdentifier.WARS, PlayerStatsIdentifier.PLAYTIME):
+        table.add_row(f"{stat} (latest)", "all time", f"{await _time(_engine, stat, None, None):.4f}")
+
+    print(table.build())
+    await manager.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=20000)
+    parser.add_argument("--snapshots", type=int, default=100)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "niabot_leaderboard_benchmark.db"))
+    args = parser.parse_args()
+
+    asyncio.run(run(args.players, args.snapshots, args.db))
+
+
+if __name__ == "__main__":
+    main()
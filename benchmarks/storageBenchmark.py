@@ -0,0 +1,283 @@
+"""
+Benchmark for the public functions of the storage modules.
+
+Fills a scratch database with synthetic data (see :mod:`benchmarks.syntheticData`) for every requested size and times
+every public read and write function of playerTrackerData, playtimeData, usernameData and guildMemberLogData on it.
+Caches are bypassed, so every call hits the database. Each function is called with different players on every
+repetition and the median is reported.
+
+The report can be saved as JSON and compared against a previous report. Functions that got slower than the threshold
+are listed and the exit status is 1, so the benchmark can guard against regressions.
+
+Usage: ``python -m benchmarks.storageBenchmark [--sizes 1000x50,5000x100] [--repeat N] [--output FILE]
+[--compare FILE] [--threshold RATIO] [--db PATH]``
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from datetime import timedelta
+
+from benchmarks import syntheticData
+from common.storage import guildMemberLogData, manager, playerTrackerData, playtimeData, usernameData
+from common.types.enums import LogEntryType, PlayerStatsIdentifier
+from common.types.wynncraft import WynncraftGuild
+from common.utils.tableBuilder import TableBuilder
+
+# Changes below this many seconds are treated as noise when comparing reports.
+_NOISE_FLOOR = 0.001
+
+
+def _clear_caches():
+    # functions can call other cached functions, so clear every cache instead of calling the wrapped functions
+    for f in vars(playerTrackerData).values():
+        if hasattr(f, "cache_clear"):
+            f.cache_clear()
+
+
+def _player(d: syntheticData.Dataset, rng: random.Random) -> str:
+    return rng.choice(d.uuids)
+
+
+def _guild(d: syntheticData.Dataset, rng: random.Random) -> str:
+    return rng.choice([name for name, uuids in d.members.items() if len(uuids) > 0])
+
+
+def _day(d: syntheticData.Dataset, rng: random.Random):
+    return d.start + timedelta(days=rng.randrange((d.end - d.start).days))
+
+
+def _new_records(d: syntheticData.Dataset, rng: random.Random, count: int) -> list[tuple]:
+    t = d.end + timedelta(seconds=rng.randrange(10 ** 8))
+    rows = []
+    for uuid in rng.sample(d.uuids, min(count, len(d.uuids))):
+        row = list(next(syntheticData.snapshot_rows(1, 4, rng.randrange(10 ** 6))))
+        row[0], row[1], row[6] = t, uuid, t.isoformat()
+        rows.append(tuple(row))
+    return rows
+
+
+async def _flush(rows: list[tuple]):
+    playerTrackerData._record_buffer.extend(rows)
+    await playerTrackerData.flush_records()
+
+
+async def _take(entries: AsyncGenerator, count: int) -> list:
+    taken = []
+    async with contextlib.aclosing(entries):
+        async for entry in entries:
+            taken.append(entry)
+            if len(taken) == count:
+                break
+    return taken
+
+
+# Each case creates the awaitable to time from the dataset and a random generator.
+_Case = Callable[[syntheticData.Dataset, random.Random], Awaitable]
+
+READ_CASES: dict[str, _Case] = {
+    "playerTrackerData.get_stats": lambda d, rng: playerTrackerData.get_stats(
+        _player(d, rng), PlayerStatsIdentifier.WARS),
+    "playerTrackerData.get_stats (range)": lambda d, rng: playerTrackerData.get_stats(
+        _player(d, rng), PlayerStatsIdentifier.WARS, (day := _day(d, rng)), day + timedelta(days=30)),
+    "playerTrackerData.get_stats_for_guild": lambda d, rng: playerTrackerData.get_stats_for_guild(
+        _guild(d, rng), PlayerStatsIdentifier.WARS, _day(d, rng)),
+    "playerTrackerData.get_stats_for_guild (before)": lambda d, rng: playerTrackerData.get_stats_for_guild(
+        _guild(d, rng), PlayerStatsIdentifier.WARS, d.start, _day(d, rng)),
+    "playerTrackerData.get_playtimes_for_guild": lambda d, rng: playerTrackerData.get_playtimes_for_guild(
+        _guild(d, rng), _day(d, rng)),
+    "playerTrackerData.get_leaderboard": lambda d, rng: playerTrackerData.get_leaderboard(
+        PlayerStatsIdentifier.KILLED_MOBS),
+    "playerTrackerData.get_leaderboard (guild)": lambda d, rng: playerTrackerData.get_leaderboard(
+        PlayerStatsIdentifier.KILLED_MOBS, WynncraftGuild(_guild(d, rng), "")),
+    "playerTrackerData.get_leaderboard (before)": lambda d, rng: playerTrackerData.get_leaderboard(
+        PlayerStatsIdentifier.KILLED_MOBS, None, d.start, _day(d, rng)),
+    "playerTrackerData.get_warcount": lambda d, rng: playerTrackerData.get_warcount(),
+    "playerTrackerData.get_warcount (guild)": lambda d, rng: playerTrackerData.get_warcount(
+        WynncraftGuild(_guild(d, rng), "")),
+    "playerTrackerData.get_warcount_relative": lambda d, rng: playerTrackerData.get_warcount_relative(
+        d.end - timedelta(days=30), d.end),
+    "playerTrackerData.get_gain_leaderboard (7 days)": lambda d, rng: playerTrackerData.get_gain_leaderboard(
+        PlayerStatsIdentifier.PLAYTIME, d.end - timedelta(days=7), d.end),
+    "playerTrackerData.get_gain_leaderboard (90 days)": lambda d, rng: playerTrackerData.get_gain_leaderboard(
+        PlayerStatsIdentifier.PLAYTIME, d.end - timedelta(days=90), d.end),
+    "playerTrackerData.get_gain_leaderboard (guild)": lambda d, rng: playerTrackerData.get_gain_leaderboard(
+        PlayerStatsIdentifier.WARS, d.end - timedelta(days=30), d.end, WynncraftGuild(_guild(d, rng), "")),
+    "playerTrackerData.get_history": lambda d, rng: playerTrackerData.get_history(
+        PlayerStatsIdentifier.WARS, _player(d, rng)),
+    "playerTrackerData.get_daily_history": lambda d, rng: playerTrackerData.get_daily_history(
+        PlayerStatsIdentifier.WARS, _player(d, rng)),
+    "playerTrackerData.get_tracked_uuids": lambda d, rng: playerTrackerData.get_tracked_uuids(
+        _player(d, rng), 100),
+    "playtimeData.get_playtime": lambda d, rng: playtimeData.get_playtime(
+        _player(d, rng), _day(d, rng).date()),
+    "playtimeData.get_all_playtimes": lambda d, rng: playtimeData.get_all_playtimes(_player(d, rng)),
+    "playtimeData.get_first_date_after": lambda d, rng: playtimeData.get_first_date_after(_day(d, rng).date()),
+    "playtimeData.get_first_date_after_from_uuid": lambda d, rng: playtimeData.get_first_date_after_from_uuid(
+        _day(d, rng).date(), _player(d, rng)),
+    "usernameData.get_players": lambda d, rng: usernameData.get_players(
+        uuids=rng.sample(d.uuids, min(50, len(d.uuids)))),
+    "usernameData.get_player (uuid)": lambda d, rng: usernameData.get_player(uuid=_player(d, rng)),
+    "usernameData.get_player (username)": lambda d, rng: usernameData.get_player(
+        username=syntheticData.username_of(rng.randrange(d.players))),
+    "usernameData.find_players": lambda d, rng: usernameData.find_players(
+        syntheticData.username_of(rng.randrange(d.players))[:-1]),
+    "guildMemberLogData.get_logs": lambda d, rng: guildMemberLogData.get_logs(),
+    "guildMemberLogData.get_logs (uuid)": lambda d, rng: guildMemberLogData.get_logs(uuids=[_player(d, rng)]),
+    "guildMemberLogData.get_logs (range)": lambda d, rng: guildMemberLogData.get_logs(
+        after=(day := _day(d, rng)), before=day + timedelta(days=7)),
+    "guildMemberLogData.get_logs (type)": lambda d, rng: guildMemberLogData.get_logs(
+        entry_types=[LogEntryType.MEMBER_NAME_CHANGE]),
+    "guildMemberLogData.iter_logs (first 25)": lambda d, rng: _take(guildMemberLogData.iter_logs(
+        after=d.start, newest_first=True, chunk_size=25), 25),
+    "guildMemberLogData.count_logs (range)": lambda d, rng: guildMemberLogData.count_logs(
+        after=(day := _day(d, rng)), before=day + timedelta(days=30)),
+}
+
+# Run after the reads since they change the data.
+WRITE_CASES: dict[str, _Case] = {
+    "playerTrackerData.flush_records (500)": lambda d, rng: _flush(_new_records(d, rng, 500)),
+    "playerTrackerData.downsample_snapshots (50)": lambda d, rng: playerTrackerData.downsample_snapshots(
+        rng.sample(d.uuids, min(50, len(d.uuids))), d.end - timedelta(days=28), d.end - timedelta(days=90)),
+    "playtimeData.set_playtime": lambda d, rng: playtimeData.set_playtime(
+        _player(d, rng), _day(d, rng).date(), rng.randrange(600)),
+    "usernameData.update": lambda d, rng: usernameData.update(
+        _player(d, rng), f"renamed{rng.randrange(10 ** 9)}"),
+    "usernameData.update_many (200)": lambda d, rng: usernameData.update_many(
+        (uuid, f"renamed{rng.randrange(10 ** 9)}") for uuid in rng.sample(d.uuids, min(200, len(d.uuids)))),
+    "guildMemberLogData.log": lambda d, rng: guildMemberLogData.log(
+        LogEntryType.MEMBER_JOIN, "benchmark", _player(d, rng)),
+}
+
+
+async def _time(case: _Case, dataset: syntheticData.Dataset, rng: random.Random, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        _clear_caches()
+        awaitable = case(dataset, rng)
+        t = time.perf_counter()
+        await awaitable
+        times.append(time.perf_counter() - t)
+    return statistics.median(times)
+
+
+async def run_size(players: int, snapshots: int, path: str, repeat: int) -> dict[str, float]:
+    """
+    Time all cases on a new synthetic database.
+
+    :return: A dict mapping the case names to their median time in seconds.
+    """
+    t = time.perf_counter()
+    dataset = await syntheticData.fill(path, players, snapshots)
+    await usernameData.load_index()
+    print(f"Generated {players} players x {snapshots} snapshots in {time.perf_counter() - t:.2f}s", file=sys.stderr)
+
+    rng = random.Random(0)
+    results = {}
+    try:
+        for name, case in (READ_CASES | WRITE_CASES).items():
+            results[name] = await _time(case, dataset, rng, repeat)
+    finally:
+        await manager.close()
+    return results
+
+
+def _format_time(seconds: float | None) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.2f}"
+
+
+def build_report(report: dict, baseline: dict | None, threshold: float) -> tuple[str, list[str]]:
+    """
+    Format a report as a table and compare it against a baseline report.
+
+    :return: A tuple containing the table and a list of the regressions.
+    """
+    sizes = report["sizes"]
+    regressions = []
+
+    table = TableBuilder.from_str('l' + '  r' * (len(sizes) * (1 if baseline is None else 2)))
+    header = ["Function (ms)"]
+    for size in sizes:
+        header += [size] if baseline is None else [size, "change"]
+    table.add_row(*header)
+    table.add_seperator_row()
+
+    for name, times in report["results"].items():
+        row = [name]
+        for size in sizes:
+            row.append(_format_time(times.get(size)))
+            if baseline is None:
+                continue
+            before = baseline["results"].get(name, {}).get(size)
+            if before is None or times.get(size) is None:
+                row.append("-")
+                continue
+            ratio = times[size] / before if before > 0 else float("inf")
+            row.append(f"x{ratio:.2f}")
+            if ratio > threshold and times[size] - before > _NOISE_FLOOR:
+                regressions.append(f"{name} at {size}: {_format_time(before)}ms -> {_format_time(times[size])}ms")
+        table.add_row(*row)
+
+    return table.build(), regressions
+
+
+def _parse_size(s: str) -> tuple[int, int]:
+    players, snapshots = s.lower().split("x")
+    return int(players), int(snapshots)
+
+
+async def run(sizes: list[str], path: str, repeat: int) -> dict:
+    report = {"repeat": repeat, "sizes": sizes, "results": {}}
+    for size in sizes:
+        players, snapshots = _parse_size(size)
+        for name, t in (await run_size(players, snapshots, path, repeat)).items():
+            report["results"].setdefault(name, {})[size] = t
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000x50,5000x100",
+                        help="comma separated data sizes as PLAYERSxSNAPSHOTS")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="save the report as JSON")
+    parser.add_argument("--compare", help="a report saved with --output to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio at which a function counts as regressed")
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "niabot_storage_benchmark.db"))
+    args = parser.parse_args()
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip() != ""]
+    for size in sizes:
+        _parse_size(size)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+    report = asyncio.run(run(sizes, args.db, args.repeat))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    table, regressions = build_report(report, baseline, args.threshold)
+    print(table)
+
+    if len(regressions) > 0:
+        print(f"\n{len(regressions)} regression(s) above x{args.threshold}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Synthetic data for the storage benchmarks.
+
+Fills a scratch database with players that log on a few times on their active days, guilds with member sets, war
+curves that are steeper for guild members, usernames, daily playtimes and guild member log entries.
+The data only depends on the seed, so databases of the same size are comparable between runs.
+"""
+import os
+import random
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from common.storage import manager, memberSetData, playerTrackerData
+from common.types.enums import LogEntryType
+
+START = datetime(2024, 1, 1)
+DAYS = 180
+END = START + timedelta(days=DAYS)
+
+GUILDS = ("Synthetic Guild", "Benchmark Guild", "Scratch Guild", "Filler Guild", "Sample Guild")
+# Share of players that are in one of the guilds.
+GUILD_SHARE = 0.4
+# Share of players that war at all. Guild members always do.
+WARRING_SHARE = 0.3
+
+_CHUNK_SIZE = 50000
+
+
+@dataclass(frozen=True)
+class Dataset:
+    players: int
+    snapshots: int
+    uuids: tuple[str, ...]
+    members: dict[str, tuple[str, ...]]  # guild name -> member uuids
+    start: datetime = START
+    end: datetime = END
+
+
+def uuid_of(player: int) -> str:
+    return f"{player:032x}"
+
+
+def username_of(player: int) -> str:
+    return f"player{player}"
+
+
+def _player_guilds(players: int, seed: int):
+    # Drawn from a separate generator so the guilds don't depend on the amount of snapshots.
+    rng = random.Random(-seed - 1)
+    for _ in range(players):
+        yield rng.choice(GUILDS) if rng.random() < GUILD_SHARE else None
+
+
+def snapshot_rows(players: int, snapshots: int, seed: int = 0):
+    """
+    Generate player_tracking rows. Every player gets a snapshot whenever they join or leave, so there are roughly
+    `snapshots` rows per player spread over about snapshots / 4 days. Guild members war faster than other players.
+
+    :return: A generator of rows in the column order of playerTrackerData.RECORD_COLUMNS.
+    """
+    rng = random.Random(seed)
+    stat_count = len(playerTrackerData.RECORD_COLUMNS) - 12
+    for p, guild in enumerate(_player_guilds(players, seed)):
+        wars = rng.randrange(0, 5000) if guild is not None or rng.random() < WARRING_SHARE else 0
+        war_rate = rng.random() * (10 if guild is not None else 5) if wars > 0 else 0
+        playtime = rng.random() * 1000
+        stats = [rng.randrange(0, 10000) for _ in range(stat_count)]
+        days = sorted(rng.sample(range(DAYS), min(DAYS, max(1, snapshots // 4))))
+        for day in days:
+            t = START + timedelta(days=day, minutes=rng.randrange(0, 60 * 12))
+            for _ in range(2):
+                for _ in range(2):
+                    # Some snapshots are taken without anything changing and end up as heartbeats.
+                    if rng.random() < 0.7:
+                        wars += int(rng.random() * war_rate)
+                        playtime += rng.random()
+                        stats[rng.randrange(stat_count)] += 1
+                    yield (
+                        t, uuid_of(p), username_of(p), "Player", None, "2020-01-01", t.isoformat(), playtime,
+                        None if guild is None else f"{GUILDS.index(guild):032x}", guild,
+                        None if guild is None else "RECRUIT", wars, *stats
+                    )
+                    t += timedelta(minutes=rng.randrange(10, 120))
+
+
+def guild_members(players: int, seed: int = 0) -> dict[str, tuple[str, ...]]:
+    """
+    Get the guild each player of snapshot_rows is in.
+
+    :return: A dict mapping the guild names to the uuids of their members.
+    """
+    members = {name: [] for name in GUILDS}
+    for player, guild in enumerate(_player_guilds(players, seed)):
+        if guild is not None:
+            members[guild].append(uuid_of(player))
+    return {name: tuple(uuids) for name, uuids in members.items()}
+
+
+async def _insert(sql: str, rows):
+    rows = iter(rows)
+    async with manager.transaction() as cur:
+        while True:
+            chunk = [row for _, row in zip(range(_CHUNK_SIZE), rows)]
+            if len(chunk) == 0:
+                break
+            await cur.executemany(sql, chunk)
+
+
+def _playtime_rows(players: int, seed: int):
+    rng = random.Random(seed)
+    for p in range(players):
+        for day in range(0, DAYS, rng.randrange(1, 8)):
+            yield uuid_of(p), (START + timedelta(days=day)).date(), rng.randrange(0, 600)
+
+
+def _log_rows(members: dict[str, tuple[str, ...]], seed: int):
+    rng = random.Random(seed)
+    for uuids in members.values():
+        for uuid in uuids:
+            t = START + timedelta(minutes=rng.randrange(DAYS * 24 * 60))
+            yield LogEntryType.MEMBER_JOIN.value, f"{uuid} joined the guild.", uuid, t
+            if rng.random() < 0.2:
+                t += timedelta(minutes=rng.randrange(60, 60 * 24 * 30))
+                yield LogEntryType.MEMBER_NAME_CHANGE.value, f"{uuid} changed their name.", uuid, t
+
+
+async def fill(path: str, players: int, snapshots: int, seed: int = 0) -> Dataset:
+    """
+    Create a new database at `path` filled with synthetic data and leave it open in the storage manager.
+    Any existing database at `path` is removed first.
+
+    :param players: The amount of players.
+    :param snapshots: The approximate amount of snapshots per player.
+    :return: A description of the generated data.
+    """
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    await manager.init_database(path, archive_dir=f"{path}.archive")
+    members = guild_members(players, seed)
+
+    await _insert(playerTrackerData._INSERT_RECORD_SQL, snapshot_rows(players, snapshots, seed))
+    await _insert("INSERT INTO minecraft_usernames VALUES (?, ?)",
+                  ((uuid_of(p), username_of(p)) for p in range(players)))
+    await _insert("INSERT INTO playtimes VALUES (?, ?, ?)", _playtime_rows(players, seed))
+    await _insert("INSERT INTO guild_member_log (entry_type, content, uuid, timestamp) VALUES (?, ?, ?, ?)",
+                  _log_rows(members, seed))
+    for name, uuids in members.items():
+        # The cached member set may belong to a previously generated database.
+        memberSetData._member_sets.pop(name.lower(), None)
+        await memberSetData.set_members(name, uuids)
+
+    # Re-run the migrations so player_latest, player_daily and the heartbeats get built from the generated data.
+    cur = await manager.get_cursor()
+    await cur.execute("PRAGMA user_version = 0")
+    await manager.close()
+    await manager.init_database(path, archive_dir=f"{path}.archive")
+
+    return Dataset(
+        players=players,
+        snapshots=snapshots,
+        uuids=tuple(uuid_of(p) for p in range(players)),
+        members=members
+    )
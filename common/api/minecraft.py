@@ -2,6 +2,8 @@ import asyncio
 import os
 from http import HTTPStatus
 
+import aiohttp
+
 from common.types.dataTypes import MinecraftPlayer
 from . import sessionManager, rateLimit
 
@@ -38,32 +40,30 @@ async def get_player(*, uuid: str = None, username: str = None, use_mojang: bool
     headers = {}
 
     if use_mojang:
-        session = sessionManager.get_session(_mojang_api_session_id)
+        session_id = _mojang_api_session_id
         rate_limiter = _mojang_rate_limit
     else:
-        session = sessionManager.get_session(_player_api)
+        session_id = _player_api
         rate_limiter = _ashcon_rate_limit
         # add a user-agent header
         headers["User-Agent"] = f"Email({os.getenv('EMAIL')})"
 
-    with rate_limiter:
-        async with session.get(request, headers=headers) as resp:
-            if resp.status == HTTPStatus.NOT_FOUND:
-                return None
-            if resp.status == HTTPStatus.BAD_REQUEST:
-                return None
-
-            resp.raise_for_status()
+    try:
+        resp = await sessionManager.cached_get(session_id, request, headers=headers, rate_limit=rate_limiter)
+    except aiohttp.ClientResponseError as ex:
+        if ex.status == HTTPStatus.NOT_FOUND or ex.status == HTTPStatus.BAD_REQUEST:
+            return None
+        raise ex
 
-            if resp.status == HTTPStatus.NO_CONTENT:
-                return None
-            json = await resp.json()
+    if resp.status == HTTPStatus.NO_CONTENT:
+        return None
+    json = resp.json()
 
-            if use_mojang:
-                return MinecraftPlayer(json["id"], json["name"])
-            else:
-                data = json["data"]["player"]
-                return MinecraftPlayer(data["id"], data["username"])
+    if use_mojang:
+        return MinecraftPlayer(json["id"], json["name"])
+    else:
+        data = json["data"]["player"]
+        return MinecraftPlayer(data["id"], data["username"])
 
 def calculate_remaining_calls() -> int:
     """
@@ -88,7 +88,7 @@ async def get_players(usernames: list[str]) -> dict[str, MinecraftPlayer]:
     json = '[' + ','.join([f'"{name}"' for name in usernames]) + ']'
 
     session = sessionManager.get_session(_mc_services_api_session_id)
-    with _mc_services_rate_limit:
+    async with _mc_services_rate_limit.acquire():
         async with session.post(f"/minecraft/profile/lookup/bulk/byname", json=json) as resp:
             resp.raise_for_status()
 
@@ -26,7 +26,7 @@ async def get_random_apod() -> APOD:
     :return: The URL of the image.
     """
     session = sessionManager.get_session(_nasa_api_session_id)
-    with _nasa_rate_limit:
+    async with _nasa_rate_limit.acquire(max_wait=10):
         async with session.get("/planetary/apod",
                                params={"api_key": os.getenv('NASA_API_KEY'), "count": 1},
                                timeout=10
@@ -1,10 +1,31 @@
+import asyncio
 import collections
+import contextvars
 import time
+from contextlib import asynccontextmanager, contextmanager
 from http import HTTPStatus
-from threading import Lock
+from typing import AsyncIterator, Iterator
 
 from aiohttp import ClientResponseError
 
+from common.types.enums import RequestPriority
+
+# The priority of the requests made in the current context. Tasks inherit it from the context that created them.
+request_priority: contextvars.ContextVar[RequestPriority] = contextvars.ContextVar(
+    "request_priority", default=RequestPriority.INTERACTIVE)
+
+
+@contextmanager
+def priority(p: RequestPriority) -> Iterator[None]:
+    """
+    Make the requests of the current context, including tasks created in it, use a priority.
+    """
+    token = request_priority.set(p)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
 
 class RateLimitException(Exception):
     pass
@@ -13,37 +34,87 @@ class RateLimitException(Exception):
 class RateLimit:
     def __init__(self, max_calls: int, period: int):
         """
-        A ratelimit checker. Use with 'with RateLimit:'. If amount requests in the specified time were exceeded throws
-        RateLimitException.
+        A ratelimit checker. Use with 'async with rate_limit.acquire() as slot:', which waits until the request can be
+        made without exceeding the specified amount of requests in the specified time.
 
         :param max_calls: The amount of requests allowed
         :param period: The time period in minutes of the ratelimit
         """
         self._max_calls = max_calls
         self._period = period
-        self._calls = collections.deque(maxlen=max_calls)
-        self._lock = Lock()
+        self._calls = collections.deque()
+        # Waiters of each priority are served in order of arrival. The first one waits for the budget while holding
+        # the lock of its priority.
+        self._queues = {p: asyncio.Lock() for p in RequestPriority}
 
-    def __enter__(self):
+    @asynccontextmanager
+    async def acquire(self, cost: int = 1, max_wait: float = None) -> AsyncIterator[float]:
         """
+        Wait until `cost` requests can be made and use them. Waiters of the same priority (see request_priority) are
+        served first come, first served and each one is woken as soon as enough of the budget is free again.
+        Waiters of different priorities don't wait for each other.
+        If the request inside is rejected with TOO_MANY_REQUESTS, the ratelimit is set to full and a
+        RateLimitException is raised.
+        Yields the slot the requests were counted in, which refund() takes to give them back.
+
+        :param cost: The amount of requests to use.
+        :param max_wait: If set, a RateLimitException is raised instead of waiting longer than this many seconds.
         :raises RateLimitException: If the rate limit was exceeded.
-         Also catches NonSuccessExceptions and checks for TOO_MANY_REQUESTS code and sets the rate limit to full if so.
         """
-        with self._lock:
-            if self.calculate_remaining_calls() <= 0:
-                raise RateLimitException(f"Rate limit of {self._max_calls} requests per {self._period}min reached!")
-
-            curr_time = time.time()
-            self._calls.append(curr_time)
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        with self._lock:
-            if exc_type is ClientResponseError and exc_val.status == HTTPStatus.TOO_MANY_REQUESTS:
+        p = request_priority.get()
+        headroom = self._headroom(p)
+        if cost + headroom > self.get_max_calls():
+            raise ValueError(f"Cost {cost} exceeds the rate limit of {self.get_max_calls() - headroom} requests "
+                             f"available to priority {p.name}.")
+
+        deadline = None if max_wait is None else time.monotonic() + max_wait
+        async with self._queues[p]:
+            while self.calculate_remaining_calls() - headroom < cost:
+                wait_time = self._time_until_free(cost + headroom)
+                if deadline is not None and time.monotonic() + wait_time > deadline:
+                    raise RateLimitException(f"Rate limit of {self._max_calls} requests per {self._period}min "
+                                             f"reached!")
+                await asyncio.sleep(wait_time)
+            slot = self._use(cost)
+
+        try:
+            yield slot
+        except ClientResponseError as e:
+            if e.status == HTTPStatus.TOO_MANY_REQUESTS:
                 usage = self.calculate_usage()
                 self._set_full()
                 raise RateLimitException(
-                    f"Rate limited by server! (Request amount: {usage}/{self._max_calls} per {self._period}min)")
-        return False  # re-raise any exceptions
+                    f"Rate limited by server! (Request amount: {usage}/{self._max_calls} per {self._period}min)"
+                ) from e
+            raise e
+
+    def _headroom(self, p: RequestPriority) -> int:
+        # the part of the remaining budget requests of a priority may not use
+        return 0
+
+    def _use(self, cost: int) -> float:
+        curr_time = time.time()
+        self._calls.extend([curr_time] * cost)
+        return curr_time
+
+    def _time_until_free(self, cost: int) -> float:
+        # the time until the call that has to expire for `cost` calls to be free expires
+        i = len(self._calls) - (self.get_max_calls() - cost) - 1
+        return max(self._period * 60 + self._calls[i] - time.time(), 0.0)
+
+    def refund(self, slot: float, cost: int = 1):
+        """
+        Give back requests that were acquired but not counted by the server. Requests that expired already aren't
+        counted anymore and are ignored.
+
+        :param slot: The slot yielded by the acquire() the requests were made in.
+        :param cost: The amount of requests to give back.
+        """
+        for _ in range(cost):
+            try:
+                self._calls.remove(slot)
+            except ValueError:
+                return
 
     def _clear_expired_calls(self):
         curr_time = time.time()
@@ -51,8 +122,7 @@ class RateLimit:
             self._calls.popleft()
 
     def _set_full(self):
-        curr_time = time.time()
-        self._calls.extend([curr_time] * self.calculate_remaining_calls())
+        self._use(self.calculate_remaining_calls())
 
     def calculate_usage(self) -> int:
         """
@@ -65,7 +135,15 @@ class RateLimit:
         """
         Calculates the amount of requests left in the current period. This also clears expired calls.
         """
-        return self.get_max_calls() - self.calculate_usage()
+        return max(self.get_max_calls() - self.calculate_usage(), 0)
+
+    def calculate_available_calls(self, p: RequestPriority = None) -> int:
+        """
+        Calculates the amount of requests left in the current period that requests of a priority may use.
+
+        :param p: The priority. Defaults to the priority of the current context.
+        """
+        return max(self.calculate_remaining_calls() - self._headroom(p or request_priority.get()), 0)
 
     def get_max_calls(self) -> int:
         """
@@ -83,6 +161,6 @@ class RateLimit:
         """
         :return: The time in seconds until the next free request
         """
-        if len(self._calls) == 0:
+        if self.calculate_remaining_calls() > 0:
             return 0
-        return max(self._period * 60 + self._calls[0] - time.time(), 0)
+        return self._time_until_free(1)
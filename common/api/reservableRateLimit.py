@@ -1,31 +1,28 @@
 from common.api.rateLimit import RateLimit
+from common.types.enums import RequestPriority
 
 
 class ReservableRateLimit(RateLimit):
     def __init__(self, max_calls: int, period: int):
         """
-        Subclass of RateLimit which can be (partially) reserved.
+        Subclass of RateLimit of which portions can be reserved for requests of a priority, so lower priority requests
+        can only use the rest.
 
         :param max_calls: The amount of requests allowed
         :param period: The time in minutes for the allowed amount
         """
         super().__init__(max_calls, period)
-        self._reservations: list[RateLimit] = []
+        self._reservations: dict[RequestPriority, int] = {}
 
-    def _set_full(self):
-        for reservation in self._reservations:
-            reservation._set_full()
-        super()._set_full()
-
-    def reserve(self, amount: int) -> RateLimit:
+    def reserve(self, amount: int, priority: RequestPriority = RequestPriority.INTERACTIVE):
         """
-        Reserve a portion of the ratelimit and recieve an ID to identify usages of the reserved ratelimit amount.
+        Reserve a portion of the ratelimit for requests of the specified or a higher priority. Requests of lower
+        priorities wait while no more than the reserved amount is left.
         """
-        if self._max_calls - amount < 0:
+        if sum(self._reservations.values()) + amount >= self._max_calls:
             raise ValueError("Total amount of reservations exceeds ratelimit maximum.")
 
-        self._max_calls -= amount
+        self._reservations[priority] = self._reservations.get(priority, 0) + amount
 
-        r = RateLimit(amount, self._period)
-        self._reservations.append(r)
-        return r
+    def _headroom(self, p: RequestPriority) -> int:
+        return sum(amount for priority, amount in self._reservations.items() if priority < p)
@@ -1,12 +1,55 @@
+import hashlib
+import json
+import os
+import time
+import zlib
+from contextlib import nullcontext
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import Mapping
+
 import aiohttp
+import aiosqlite
 from aiohttp import ClientSession
 from yarl import URL
 
+from common.types.jsonable import JsonType
+
+# The database the response cache is stored in.
+CACHE_PATH = "data/http_cache.db"
+# Cached responses that weren't used for this many seconds are removed.
+CACHE_MAX_IDLE = 7 * 24 * 3600
+# Maximum amount of cached responses. The least recently used ones are removed first.
+CACHE_MAX_ENTRIES = 50000
+# Cache hits only update the used_at of responses that weren't used for this many seconds, so most hits don't write.
+_USED_AT_RESOLUTION = 3600
+# Stored responses between two cleanups of the cache.
+_CLEANUP_INTERVAL = 1000
+
 _sessions: dict[int, ClientSession] = {}
 _session_urls: dict[int, str | URL | None] = {}
 _initialized = False
 _next_id = 0
 
+_cache: aiosqlite.Connection | None = None
+_stores_since_cleanup = 0
+_cache_stats = {"fresh": 0, "not_modified": 0, "miss": 0}
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    status: int
+    # The headers of the received response, or the stored ones if no request was sent.
+    headers: Mapping[str, str]
+    body: bytes
+    # Whether a request was sent. If not, the cached response was still fresh.
+    requested: bool
+    # Whether the server answered that the cached response is still valid.
+    not_modified: bool
+
+    def json(self) -> JsonType:
+        return json.loads(self.body) if len(self.body) > 0 else None
+
 
 def register_session(base_url: str | URL = None) -> int:
     global _next_id
@@ -30,6 +73,39 @@ def get_session(session_id: int) -> ClientSession:
     return _sessions[session_id]
 
 
+async def _open_cache():
+    global _cache
+    os.makedirs(os.path.dirname(CACHE_PATH) or ".", exist_ok=True)
+    _cache = await aiosqlite.connect(CACHE_PATH)
+    _cache.row_factory = aiosqlite.Row
+    await _cache.execute("PRAGMA journal_mode = WAL")
+    await _cache.execute("PRAGMA synchronous = NORMAL")
+    await _cache.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY NOT NULL,
+                    status INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    expires REAL NOT NULL,
+                    used_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS responses_used_at_idx ON responses (used_at);
+            """)
+    await _cleanup_cache()
+
+
+async def _cleanup_cache():
+    await _cache.execute("DELETE FROM responses WHERE used_at < ?", (time.time() - CACHE_MAX_IDLE,))
+    await _cache.execute("""
+                DELETE FROM responses WHERE used_at < (
+                    SELECT used_at FROM responses ORDER BY used_at DESC LIMIT 1 OFFSET ?
+                )
+            """, (CACHE_MAX_ENTRIES - 1,))
+    await _cache.commit()
+
+
 async def init_sessions():
     global _initialized
     if _initialized:
@@ -39,10 +115,126 @@ async def init_sessions():
     for s_id, url in _session_urls.items():
         _sessions[s_id] = aiohttp.ClientSession(url)
 
+    await _open_cache()
+
 
 async def close():
     for session in _sessions.values():
         await session.close()
 
-    global _initialized
+    global _initialized, _cache
     _initialized = False
+
+    if _cache is not None:
+        await _cache.close()
+        _cache = None
+
+
+def _cache_key(session_id: int, url: str, params: Mapping | None, headers: Mapping | None) -> str:
+    # Responses can depend on the API key, so it's part of the key. Only its hash is stored.
+    auth = (headers or {}).get("Authorization", "")
+    key = json.dumps([str(_session_urls[session_id]), url, sorted((params or {}).items()), auth])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _expiry(headers: Mapping[str, str]) -> float | None:
+    # The time until which a response may be used without asking the server, or None if it may not be stored.
+    directives = {}
+    for directive in headers.get("Cache-Control", "").lower().split(","):
+        name, _, value = directive.strip().partition("=")
+        directives[name] = value.strip('"')
+
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    try:
+        max_age = int(directives.get("max-age", 0)) - int(headers.get("Age", 0))
+    except ValueError:
+        max_age = 0
+    return time.time() + max(max_age, 0)
+
+
+async def _store(key: str, status: int, headers: Mapping[str, str], body: bytes, expires: float):
+    global _stores_since_cleanup
+    await _cache.execute("REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (key, status, json.dumps(dict(headers)), zlib.compress(body), headers.get("ETag"),
+                          headers.get("Last-Modified"), expires, time.time()))
+    await _cache.commit()
+
+    _stores_since_cleanup += 1
+    if _stores_since_cleanup >= _CLEANUP_INTERVAL:
+        _stores_since_cleanup = 0
+        await _cleanup_cache()
+
+
+async def cached_get(session_id: int, url: str, *, params: Mapping[str, str] = None, headers: Mapping[str, str] = None,
+                     rate_limit=None, raise_for_status: bool = True, free_not_modified: bool = True) -> CachedResponse:
+    """
+    Send a GET request through the response cache. Responses are stored on disk if the server allows it
+    (Cache-Control) and used without a request until they expire. After that a conditional request is sent with the
+    ETag / Last-Modified of the stored response, and a 304 answer returns the stored body.
+
+    :param session_id: The session to send the request with.
+    :param url: The url of the request.
+    :param params: The request parameters.
+    :param headers: The request headers.
+    :param rate_limit: If set, requests that are sent use the budget of this rate limit.
+    :param raise_for_status: If True, a ClientResponseError is raised for error responses. Responses with
+     TOO_MANY_REQUESTS always raise, so the rate limit notices them.
+    :param free_not_modified: If True, 304 responses are given back to the rate limit since the server doesn't
+     count them.
+    """
+    session = get_session(session_id)
+    key = _cache_key(session_id, url, params, headers)
+
+    entry = None
+    if _cache is not None:
+        res = await _cache.execute("SELECT * FROM responses WHERE key = ?", (key,))
+        entry = await res.fetchone()
+
+    if entry is not None and entry["expires"] > time.time():
+        _cache_stats["fresh"] += 1
+        if entry["used_at"] < time.time() - _USED_AT_RESOLUTION:
+            await _cache.execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+            await _cache.commit()
+        return CachedResponse(entry["status"], json.loads(entry["headers"]), zlib.decompress(entry["body"]), False,
+                              False)
+
+    request_headers = dict(headers or {})
+    if entry is not None and entry["etag"] is not None:
+        request_headers["If-None-Match"] = entry["etag"]
+    if entry is not None and entry["last_modified"] is not None:
+        request_headers["If-Modified-Since"] = entry["last_modified"]
+
+    async with rate_limit.acquire() if rate_limit is not None else nullcontext() as slot:
+        async with session.get(url, params=params, headers=request_headers) as resp:
+            if resp.status == HTTPStatus.NOT_MODIFIED and entry is not None:
+                if free_not_modified and rate_limit is not None:
+                    rate_limit.refund(slot)
+                _cache_stats["not_modified"] += 1
+                await _cache.execute("UPDATE responses SET expires = ?, used_at = ? WHERE key = ?",
+                                     (_expiry(resp.headers) or 0.0, time.time(), key))
+                await _cache.commit()
+                return CachedResponse(entry["status"], resp.headers, zlib.decompress(entry["body"]), True, True)
+
+            if raise_for_status or resp.status == HTTPStatus.TOO_MANY_REQUESTS:
+                resp.raise_for_status()
+            body = await resp.read()
+
+    _cache_stats["miss"] += 1
+    expires = _expiry(resp.headers)
+    cacheable = resp.status == HTTPStatus.OK and expires is not None and (
+        expires > time.time() or "ETag" in resp.headers or "Last-Modified" in resp.headers)
+    if _cache is not None and cacheable:
+        await _store(key, resp.status, resp.headers, body, expires)
+
+    return CachedResponse(resp.status, resp.headers, body, True, False)
+
+
+def cache_stats() -> dict[str, int]:
+    """
+    :return: The amount of requests answered from the cache without a request ("fresh"), answered with 304
+     ("not_modified") and sent without a usable cached response ("miss") since startup.
+    """
+    return dict(_cache_stats)
@@ -0,0 +1,58 @@
+import os
+
+from common.api.wynncraft.v3.wynnRateLimit import WynnRateLimit
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Rate limits of the player routes of all API keys that were used, by key. Each key has its own budget.
+_rate_limits: dict[str, WynnRateLimit] = {}
+
+
+def _pool_keys() -> list[str]:
+    keys = [key.strip() for key in os.getenv('WYNN_API_KEYS', '').split(',') if key.strip() != '']
+    default = os.getenv('WYNN_API_KEY')
+    if default is not None and default not in keys:
+        keys.append(default)
+    return keys
+
+
+# API keys requests without a specific key are spread across. Configured with the comma separated WYNN_API_KEYS
+# environment variable, WYNN_API_KEY is always included.
+_pool: list[str] = _pool_keys()
+
+
+def get_rate_limit(api_key: str | None) -> WynnRateLimit:
+    """
+    Get the rate limit of an API key. The same rate limit is returned for every call with the same key.
+    Requests without a key are sent with WYNN_API_KEY, so None shares the rate limit of WYNN_API_KEY.
+    """
+    api_key = api_key or os.getenv('WYNN_API_KEY')
+    if api_key not in _rate_limits:
+        _rate_limits[api_key] = WynnRateLimit()
+    return _rate_limits[api_key]
+
+
+def pick_key() -> tuple[str | None, WynnRateLimit]:
+    """
+    Pick the key of the pool with the most budget left for the priority of the current context. If the budget of
+    every key is used up, the key that resets first is picked.
+
+    :return: The key and its rate limit. The key is None if no keys are configured.
+    """
+    if len(_pool) == 0:
+        return None, get_rate_limit(None)
+
+    def budget(key: str) -> tuple[int, int]:
+        rate_limit = get_rate_limit(key)
+        return rate_limit.calculate_available_calls(), -rate_limit.get_time_until_reset()
+
+    key = max(_pool, key=budget)
+    return key, get_rate_limit(key)
+
+
+def pool_size() -> int:
+    """
+    :return: The amount of API keys in the pool.
+    """
+    return len(_pool)
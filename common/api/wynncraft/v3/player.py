@@ -4,17 +4,13 @@ import aiohttp.client_exceptions
 from async_lru import alru_cache
 
 import common.utils.misc
-from common.api.wynncraft.v3 import session
-from common.api.wynncraft.v3.wynnRateLimit import WynnRateLimit
+from common.api.wynncraft.v3 import apiKeys, session
 from common.types.enums import PlayerIdentifier
 from common.types.wynncraft import PlayerStats, CharacterShort, AbilityNode
 
 
-_player_rate_limit = WynnRateLimit()
-
-_ratelimits = {
-    None: _player_rate_limit,
-}
+# The rate limit of the player routes for requests without a key, shared with the key pool.
+_player_rate_limit = apiKeys.get_rate_limit(None)
 
 class UnknownPlayerException(Exception):
     pass
@@ -29,18 +25,18 @@ async def stats(uuid: str, api_key: str = None) -> PlayerStats:
     """
     Request public statistical information about a player.
     :param uuid: The uuid of the player to retrieve the stats of.
-    :param api_key: Optional API key for accessing private stats.
+    :param api_key: Optional API key for accessing private stats. If not set, the key of the key pool with the most
+     budget left is used.
     :returns: A Stats object.
     :raises ValueError: if the uuid is not in a valid format.
     :raises UnknownPlayerException: if the player wasn't found.
     """
     uuid = common.utils.misc.format_uuid(uuid, dashed=True)
 
-    if api_key not in _ratelimits:
-        _ratelimits[api_key] = WynnRateLimit()
+    rate_limit = None if api_key is None else apiKeys.get_rate_limit(api_key)
 
     try:
-        data = await session.get(f"/player/{uuid}", fullResult="", rate_limit=_ratelimits[api_key], api_key=api_key)
+        data = await session.get(f"/player/{uuid}", fullResult="", rate_limit=rate_limit, api_key=api_key, pooled=True)
     except aiohttp.client_exceptions.ClientResponseError as ex:
         if ex.status == 404:
             raise UnknownPlayerException(f'Player {uuid} not found.')
@@ -3,7 +3,8 @@ import os
 
 import aiohttp
 
-from common.api import sessionManager
+from common.api import rateLimit, sessionManager
+from common.api.wynncraft.v3 import apiKeys
 from common.api.wynncraft.v3.wynnRateLimit import WynnRateLimit
 from common.types.jsonable import JsonType
 
@@ -15,49 +16,96 @@ _v3_session_id = sessionManager.register_session("https://api.wynncraft.com")
 
 
 
-async def get(url: str, rate_limit=None, api_key=None, tries=0, **params: str) -> JsonType:
+# Requests currently being sent, by url, params and priority. Identical concurrent requests await the same task.
+# Requests of different priorities aren't shared, so a command never waits in the lane of a background request.
+_in_flight: dict[tuple, asyncio.Task] = {}
+_coalesced_requests = 0
+
+
+async def get(url: str, rate_limit=None, api_key=None, pooled=False, **params: str) -> JsonType:
     """
     Send a GET request to the wynncraft API V3. This has a ratelimit of 180 requests per minute.
+    If an identical request (same url, params and priority) is already being sent, its response is shared instead of
+    sending another one. Requests with an api_key are always sent on their own, their response depends on the key.
+    Requests are sent with the priority of the current context (see rateLimit.priority). Background requests can't
+    use the budget reserved for interactive ones.
     :param url: The url of the request. Must start with '/'.
     :param rate_limit: If set, the specified rate limit will be used instead of the shared one.
     :param api_key: Optional API key for accessing private stats.
-    :param tries: The number of times this request has been attempted.
+    :param pooled: If set and no api_key is given, the key of the key pool with the most budget left is used instead
+     of WYNN_API_KEY, together with its rate limit. The key is picked when the request is sent.
     :param params: Additional request parameters.
     :return: the response in json format.
     """
     if rate_limit is None:
         rate_limit = _shared_rate_limit
 
-    if api_key is None:
+    if api_key is not None:
+        return await _get(url, rate_limit, api_key, False, 0, **params)
+    if not pooled:
         api_key = os.getenv('WYNN_API_KEY')
 
+    key = (url, tuple(sorted(params.items())), rateLimit.request_priority.get())
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_get(url, rate_limit, api_key, pooled, 0, **params))
+        _in_flight[key] = task
+        task.add_done_callback(lambda t: _request_done(key, t))
+    else:
+        global _coalesced_requests
+        _coalesced_requests += 1
+
+    # shielded so a cancelled caller doesn't cancel the request for the others
+    return await asyncio.shield(task)
+
+
+def _request_done(key: tuple, task: asyncio.Task):
+    _in_flight.pop(key, None)
+    if not task.cancelled():
+        task.exception()  # retrieved here in case every caller was cancelled
+
+
+async def _get(url: str, rate_limit, api_key: str, pooled: bool, tries: int, **params: str) -> JsonType:
+    if pooled and api_key is None:
+        # picked by the shared request right before it waits for the budget, not by each caller
+        api_key, rate_limit = apiKeys.pick_key()
+
     headers = {
         "Authorization": f"Bearer {api_key}"
     }
 
     try:
-        with rate_limit:
-            session = sessionManager.get_session(_v3_session_id)
-            async with session.get(f"/v3{url}", params=params, raise_for_status=True, headers=headers) as resp:
-                _rl_reset = resp.headers.get("ratelimit-reset")
-                _rl_reset = int(_rl_reset) if _rl_reset else 0
-                if _rl_reset > 0:
-                    rate_limit.set_time_until_reset(_rl_reset)
-
-                remaining = resp.headers.get("ratelimit-remaining")
-                remaining = int(remaining) if remaining else 0
-                rate_limit.set_remaining(remaining)
-
-                return await resp.json()
+        # 304 responses are given back to the rate limit, the ratelimit-remaining header corrects it if they counted
+        resp = await sessionManager.cached_get(_v3_session_id, f"/v3{url}", params=params, headers=headers,
+                                               rate_limit=rate_limit)
     except aiohttp.client_exceptions.ClientResponseError as ex:
         if ex.status == 500:
             if tries >= 1:
                 raise ex
             await asyncio.sleep(0.1)
-            return await get(url, rate_limit=rate_limit, api_key=api_key, tries=tries+1, **params)
+            return await _get(url, rate_limit, api_key, False, tries + 1, **params)
         else:
             raise ex
 
+    if resp.requested:
+        _rl_reset = resp.headers.get("ratelimit-reset")
+        _rl_reset = int(_rl_reset) if _rl_reset else 0
+        if _rl_reset > 0:
+            rate_limit.set_time_until_reset(_rl_reset)
+
+        remaining = resp.headers.get("ratelimit-remaining")
+        if remaining:
+            rate_limit.set_remaining(int(remaining))
+
+    return resp.json()
+
+
+def coalesced_requests() -> int:
+    """
+    :return: The amount of requests that were saved by sharing the response of an identical request in flight.
+    """
+    return _coalesced_requests
+
 
 def calculate_remaining_requests():
     return _shared_rate_limit.calculate_remaining_calls()
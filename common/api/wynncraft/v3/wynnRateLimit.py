@@ -1,45 +1,47 @@
 import math
 import time
-from http import HTTPStatus
+from typing import Final
 
-from aiohttp import ClientResponseError
+from common.api.reservableRateLimit import ReservableRateLimit
+from common.types.enums import RequestPriority
 
-from common.api.rateLimit import RateLimit, RateLimitException
+# Requests per period only interactive requests (commands) may use, so background workers can't starve them.
+INTERACTIVE_RESERVE: Final = 20
 
 
-class WynnRateLimit(RateLimit):
+class WynnRateLimit(ReservableRateLimit):
     def __init__(self):
         """
-        Rate limit checker for the Wynncraft API.
+        Rate limit checker for the Wynncraft API. The API resets the budget at fixed times, which are kept in sync
+        with the ratelimit-remaining and ratelimit-reset headers of its responses.
         """
         super().__init__(120, 1)
+        self.reserve(INTERACTIVE_RESERVE, RequestPriority.INTERACTIVE)
         self._remaining_calls = self._max_calls
-        # the second of the minute at which the rate limit resets
-        self._reset_time = 0
+        # the time at which the rate limit resets next
         self._next_reset = math.ceil(time.time()) + 60
-
-    def __enter__(self):
-        """
-        :raises RateLimitException: If the rate limit was exceeded.
-         Also catches ClientResponseError and checks for TOO_MANY_REQUESTS code and sets the rate limit to full if so.
-        """
-        with self._lock:
-            if self.calculate_remaining_calls() <= 0:
-                raise RateLimitException(f"Rate limit of {self._max_calls} requests per {self._period}min reached!")
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        with self._lock:
-            if exc_type is ClientResponseError and exc_val.status == HTTPStatus.TOO_MANY_REQUESTS:
-                self._set_full()
-                raise RateLimitException(
-                    f"Rate limited by server! (Request amount:"
-                    f" {self._max_calls - self._remaining_calls}/{self._max_calls} per min)")
-        return False  # re-raise any exceptions
+        # counts the resets, requests are only refunded in the period they were made in
+        self._resets = 0
 
     def _check_if_reset(self):
-        if time.time() > self._next_reset:
-            self._next_reset = int(time.time()) + self.get_time_until_reset()
+        if time.time() >= self._next_reset:
+            periods = (time.time() - self._next_reset) // (self._period * 60) + 1
+            self._next_reset += periods * self._period * 60
             self._remaining_calls = self._max_calls
+            self._resets += 1
+
+    def _use(self, cost: int) -> float:
+        self._check_if_reset()
+        self._remaining_calls -= cost
+        return self._resets
+
+    def refund(self, slot: float, cost: int = 1):
+        self._check_if_reset()
+        if slot == self._resets:
+            self._remaining_calls = min(self._remaining_calls + cost, self._max_calls)
+
+    def _time_until_free(self, cost: int) -> float:
+        return max(self._next_reset - time.time(), 0.0)
 
     def _clear_expired_calls(self):
         raise NotImplementedError("This method is not implemented for the Wynncraft API.")
@@ -51,22 +53,21 @@ class WynnRateLimit(RateLimit):
         """
         Updates the remaining calls to the specified amount.
         """
-        with self._lock:
-            if amount < self.calculate_remaining_calls():
-                self._remaining_calls = amount
+        if amount < self.calculate_remaining_calls():
+            self._remaining_calls = amount
 
     def get_time_until_reset(self) -> int:
         """
         :return: The time in seconds until the rate limit resets (in seconds).
         """
-        return math.ceil((self._reset_time - time.time()) % 60)
+        self._check_if_reset()
+        return math.ceil(self._next_reset - time.time())
 
     def set_time_until_reset(self, t: int):
         """
         Sets the time until the rate limit resets (in seconds).
         """
-        with self._lock:
-            self._reset_time = math.ceil((time.time() + t) % 60)
+        self._next_reset = time.time() + t
 
     def get_time_until_next_free(self) -> int:
         """
@@ -87,4 +88,4 @@ class WynnRateLimit(RateLimit):
         Calculates the amount of requests left in the current period.
         """
         self._check_if_reset()
-        return self._remaining_calls
+        return max(self._remaining_calls, 0)
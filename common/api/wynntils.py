@@ -18,14 +18,11 @@ class Guild:
 
 @alru_cache(ttl=600)
 async def get_guilds() -> list[Guild]:
-    session = sessionManager.get_session(_athena_api_session_id)
-    with _athena_rate_limit:
-        async with session.get("/cache/get/guildList") as resp:
-            resp.raise_for_status()
+    resp = await sessionManager.cached_get(_athena_api_session_id, "/cache/get/guildList",
+                                           rate_limit=_athena_rate_limit)
+    json = resp.json()
 
-            json = await resp.json()
-
-            return [Guild(g["_id"], g["prefix"], g.get("color", None)) for g in json]
+    return [Guild(g["_id"], g["prefix"], g.get("color", None)) for g in json]
 
 
 @alru_cache(ttl=600)
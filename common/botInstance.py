@@ -25,7 +25,7 @@ class BotInstance(discord.Client):
         self.bot_id = bot_id
 
         self.config = BotConfig(f'data/bot_configs/{bot_id}.ini')
-        self.server_configs = ServerConfigs(f'data/server_configs/{bot_id}.json')
+        self.server_configs = ServerConfigs(bot_id, f'data/server_configs/{bot_id}.json')
 
         self._tree = app_commands.CommandTree(self)
         self._initialized = False
@@ -76,7 +76,7 @@ class BotInstance(discord.Client):
             common.logging.info("Initializing...")
 
             common.logging.info("Loading server configs...")
-            self.server_configs.load()
+            await self.server_configs.load()
 
             common.logging.info("Subscribing to workers...")
             workers.presenceUpdater.add_client(self)
@@ -3,4 +3,5 @@ from .guildCommand import GuildCommand
 from .playerCommand import PlayerCommand
 from .historyCommand import HistoryCommand
 from .spaceCommand import SpaceCommand
-from .warcountCommand import WarcountCommand
\ No newline at end of file
+from .warcountCommand import WarcountCommand
+from .leaderboardCommand import LeaderboardCommand
\ No newline at end of file
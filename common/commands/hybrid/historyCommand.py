@@ -36,6 +36,9 @@ async def _generate_history_graph(history: list[tuple[str, int | float, str]]):
     return create_chart(dates, values, "Date", "Value")  # TODO y label units
 
 
+_PLAYTIME_ISSUE_DATE = date(2023, 12, 5)
+
+
 class TimeframeDate(date):
     def __new__(cls, timeframe: str, d: date):
         if timeframe == "day":
@@ -75,28 +78,31 @@ def _get_all_timeframe_dates_between(timeframe: str, start: date, end: date):
     return dates
 
 
-async def _generate_relative_history_graph(history: list[tuple[str, int, str]], timeframe: str, playtime: bool):
+async def _generate_relative_history_graph(daily_history: list[tuple[str, int, int]], timeframe: str,
+                                           playtime: bool):
     dates = _get_all_timeframe_dates_between(
         timeframe,
-        datetime.fromisoformat(history[0][0]),
-        datetime.fromisoformat(history[-1][0])
+        date.fromisoformat(daily_history[0][0]),
+        date.fromisoformat(daily_history[-1][0])
     )
     values = [0 for _ in dates]
     i = 0
-    prev_val = history[0][1]
-    prev_d = TimeframeDate.fromisoformat(history[0][0], timeframe)
-    for rec_t, stat, _ in history:
-        while i < len(dates) and not dates[i] == TimeframeDate.fromisoformat(rec_t, timeframe):
+    prev_val = daily_history[0][1]
+    prev_d = TimeframeDate.fromisoformat(daily_history[0][0], timeframe)
+    for day, first, last in daily_history:
+        while i < len(dates) and not dates[i] == TimeframeDate.fromisoformat(day, timeframe):
             i += 1
         if i >= len(dates):
             break
 
         # skip issue with playtimes around that time
-        d = TimeframeDate.fromisoformat(rec_t)
-        if not (playtime and d >= date(2023, 12, 5) >= prev_d):
-            values[i] += stat - prev_val
+        d = TimeframeDate.fromisoformat(day)
+        if not (playtime and d >= _PLAYTIME_ISSUE_DATE >= prev_d):
+            values[i] += first - prev_val
+        if not (playtime and d == _PLAYTIME_ISSUE_DATE):
+            values[i] += last - first
 
-        prev_val = stat
+        prev_val = last
         prev_d = d
 
     return create_chart(dates, values, "Date", "Value")
@@ -111,7 +117,10 @@ async def _create_history_embed(stat: PlayerStatsIdentifier, player: common.util
     )
 
     t = time.time()
-    history = await common.storage.playerTrackerData.get_history(stat, player.uuid)
+    if relative is not None:
+        history = await common.storage.playerTrackerData.get_daily_history(stat, player.uuid)
+    else:
+        history = await common.storage.playerTrackerData.get_history(stat, player.uuid)
     t = time.time() - t
     embed.set_footer(text=f"Query took {t:.2f}s")
 
@@ -1,40 +1,63 @@
 import time
 
 import discord
-from async_lru import alru_cache
+import discord.utils
 from discord import Permissions, Embed
 
-import common.utils.misc
-import common.api.wynncraft.v3.guild
-import common.api.wynncraft.v3.player
-import common.api.wynncraft.v3.types
+import common.botInstance
 import common.storage.playerTrackerData
-import common.storage.usernameData
+import common.storage.seasonLeaderboardData
+import common.utils.command
+import common.utils.misc
 from common.commands import hybridCommand, command
 from common.commands.commandEvent import PrefixedCommandEvent, SlashCommandEvent
 from common.types.enums import PlayerStatsIdentifier
-from common.utils import tableBuilder
-from common.utils import stats_autocomplete
-from common import botConfig
+from common.types.wynncraft import WynncraftGuild
+from common.utils import tableBuilder, minecraftPlayer
+from common.utils.command import Timeframe
 
 
-@alru_cache(ttl=60)
-async def _create_leaderboard_embed(stat: PlayerStatsIdentifier):
+async def _create_leaderboard_embed(stat: PlayerStatsIdentifier, timeframe: Timeframe = None,
+                                    guild: WynncraftGuild = None, color=None):
+    t = time.time()
+    if timeframe is not None and timeframe.season is not None:
+        leaderboard = await common.storage.seasonLeaderboardData.get_leaderboard(
+            timeframe.season,
+            stat,
+            guild=guild,
+            limit=100)
+    else:
+        leaderboard = await common.storage.playerTrackerData.get_gain_leaderboard(
+            stat,
+            t_from=timeframe.start if timeframe is not None else None,
+            t_to=timeframe.end if timeframe is not None else None,
+            guild=guild,
+            limit=100)
+    t = time.time() - t
+
+    guild_str = f'## Guild: {guild.name}\n' if guild else ''
+    timeframe_str = '(all time)' if timeframe is None else f'({timeframe.comment})' if timeframe.comment else f'{timeframe}'
     embed = Embed(
-        description=f"# Top 100 players by {stat}\n"
-                    f"⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯",
-        color=botConfig.DEFAULT_COLOR
+        description=f"# Top 100 players by {stat}\n## {timeframe_str}\n{guild_str}"
+                    f"⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯⎯",
+        color=color,
+        timestamp=discord.utils.utcnow()
     )
 
-    t = time.time()
-    leaderboard = await common.storage.playerTrackerData.get_leaderboard(stat)
-    t = time.time() - t
-    embed.set_footer(text=f"Query took {t:.2f}s")
+    # gains are taken from the daily rollups, so the timeframe is widened to whole days
+    days_note = "Counted in whole UTC days. " if timeframe is not None and timeframe.season is None else ""
+    embed.set_footer(text=f"{days_note}Query took {t:.2f}s")
+
+    if len(leaderboard) == 0:
+        embed.add_field(name="No data found.", value="", inline=False)
+        return embed
 
-    names = {p.uuid: p.name for p in await common.wrappers.minecraftPlayer.get_players(uuids=leaderboard.keys())}
+    names = {p.uuid: p.name for p in await minecraftPlayer.get_players(uuids=[t[1] for t in leaderboard])}
 
-    table_builder = tableBuilder.TableBuilder.from_str('l   r')
-    [table_builder.add_row(names[k], v) for k, v in leaderboard.items()]
+    table_builder = tableBuilder.TableBuilder.from_str('l  l  r')
+    table_builder.add_row("Rank", "Name", "Value")
+    table_builder.add_seperator_row()
+    [table_builder.add_row(rank, names.get(uuid, uuid), value) for rank, uuid, value in leaderboard]
 
     splits = common.utils.misc.split_str(table_builder.build(), 1000, "\n")
     for split in splits:
@@ -44,37 +67,59 @@ async def _create_leaderboard_embed(stat: PlayerStatsIdentifier):
 
 
 class LeaderboardCommand(hybridCommand.HybridCommand):
-    def __init__(self):
+    def __init__(self, bot: common.botInstance.BotInstance):
         super().__init__(
             name="leaderboard",
             aliases=("lb",),
-            params=[hybridCommand.CommandParam(
-                "stat", "The stat to track.",
-                required=True,
-                ptype=discord.AppCommandOptionType.string,
-                autocomplete=stats_autocomplete,
-            )],  # TODO time period & guild
+            params=[
+                hybridCommand.CommandParam(
+                    "stat", "The stat to rank players by.",
+                    required=True,
+                    ptype=discord.AppCommandOptionType.string,
+                    choices=common.utils.command.stats_choices,
+                ),
+                hybridCommand.CommandParam(
+                    "timeframe", "[optional] rank by gain in a timeframe. E.g. '30days', 's23'.",
+                    required=False,
+                    default=None,
+                    ptype=discord.AppCommandOptionType.string,
+                    parser=Timeframe.from_timeframe_str,
+                ),
+                hybridCommand.GuildParam(required=False, default=None),
+            ],
             description="Get the leaderboard for a specified stat.",
             base_perms=Permissions().none(),
-            permission_lvl=command.PermissionLevel.ANYONE
+            permission_lvl=command.PermissionLevel.ANYONE,
+            bot=bot
         )
 
     async def _execute(self, event: PrefixedCommandEvent):
         async with event.waiting():
+            timeframe = None
+            guild = None
             if isinstance(event, PrefixedCommandEvent):
                 if len(event.args) < 2:
                     await event.reply_error("Please specify a stat!")
                     return
 
-                stat_str = event.message.content.split(" ", 1)[1]
+                stat_str = event.args[1]
+                if len(event.args) > 2:
+                    try:
+                        timeframe = Timeframe.from_timeframe_str(event.args[2])
+                    except ValueError as e:
+                        await event.reply_error(str(e))
+                        return
             elif isinstance(event, SlashCommandEvent):
                 stat_str = event.args["stat"]
+                timeframe = event.args.get("timeframe")
+                guild = event.args.get("guild")
 
-            try:
-                stat = PlayerStatsIdentifier(stat_str.lower())
-            except ValueError:
-                await event.reply_error("Invalid stat!")
+            stat_str = stat_str.lower()
+            if stat_str not in (choice.value for choice in common.utils.command.stats_choices):
+                await event.reply_error(f"Invalid stat! Valid stats are: "
+                                        f"{', '.join(choice.value for choice in common.utils.command.stats_choices)}")
                 return
+            stat = PlayerStatsIdentifier(stat_str)
 
-            embed = await _create_leaderboard_embed(stat)
+            embed = await _create_leaderboard_embed(stat, timeframe, guild, color=event.bot.config.DEFAULT_COLOR)
             await event.reply(embed=embed)
@@ -9,12 +9,14 @@ import common.api.wynncraft.v3.guild
 import common.api.wynncraft.v3.player
 import common.botInstance
 import common.storage.playerTrackerData
+import common.storage.seasonLeaderboardData
 import common.storage.usernameData
 import common.utils.command
 import common.utils.misc
 from common.commands import hybridCommand, command
 from common.commands.commandEvent import PrefixedCommandEvent, SlashCommandEvent
 from common.types.constants import seasons
+from common.types.enums import PlayerStatsIdentifier
 from common.types.wynncraft import WynncraftGuild
 from common.utils import tableBuilder, minecraftPlayer
 from common.utils.command import Timeframe
@@ -22,10 +24,19 @@ from common.utils.command import Timeframe
 
 async def _create_warcount_embed(timeframe: Timeframe = None, guild: WynncraftGuild = None, color=None):
     t = time.time()
-    warcounts = (await common.storage.playerTrackerData.get_warcount_relative(
-        t_from=timeframe.start,
-        t_to=timeframe.end,
-        guild=guild))[:100]
+    if timeframe.season is not None:
+        warcounts = await common.storage.seasonLeaderboardData.get_leaderboard(
+            timeframe.season,
+            PlayerStatsIdentifier.WARS,
+            guild=guild,
+            limit=100)
+    else:
+        warcounts = await common.storage.playerTrackerData.get_gain_leaderboard(
+            PlayerStatsIdentifier.WARS,
+            t_from=timeframe.start,
+            t_to=timeframe.end,
+            guild=guild,
+            limit=100)
     t = time.time() - t
 
     guild_str = f'## Guild: {guild.name}\n' if guild else ''
@@ -37,7 +48,9 @@ async def _create_warcount_embed(timeframe: Timeframe = None, guild: WynncraftGu
         timestamp=discord.utils.utcnow()
     )
 
-    embed.set_footer(text=f"Query took {t:.2f}s")
+    # gains are taken from the daily rollups, so the timeframe is widened to whole days
+    days_note = "Counted in whole UTC days. " if timeframe.season is None else ""
+    embed.set_footer(text=f"{days_note}Query took {t:.2f}s")
 
     names = {p.uuid: p.name for p in await minecraftPlayer.get_players(uuids=[t[1] for t in warcounts])}
 
@@ -56,7 +69,7 @@ async def _create_warcount_embed(timeframe: Timeframe = None, guild: WynncraftGu
 def parse_season(season: int):
     if season >= len(seasons) or season < 0:
         raise ValueError(f"Invalid season number: ``{season}``")
-    return Timeframe(seasons[season][0], seasons[season][1], f"season {season}")
+    return Timeframe(seasons[season][0], seasons[season][1], f"season {season}", season)
 
 
 class WarcountCommand(hybridCommand.HybridCommand):
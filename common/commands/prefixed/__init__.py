@@ -1,7 +1,9 @@
+from .backupCommand import BackupCommand
 from .activityCommand import ActivityCommand
 from .configCommand import ConfigCommand
 from .evalCommand import EvalCommand
 from .playtimeCommand import PlaytimeCommand
+from .queryStatsCommand import QueryStatsCommand
 from .seenCommand import SeenCommand
 from .shutdownCommand import ShutdownCommand
 from .strikeCommand import StrikeCommand
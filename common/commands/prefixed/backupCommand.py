@@ -0,0 +1,33 @@
+from datetime import timezone
+
+import discord.utils
+from discord import Permissions
+
+import workers.databaseBackup
+from common.commands import command
+from common.commands.commandEvent import PrefixedCommandEvent
+
+
+class BackupCommand(command.Command):
+    def __init__(self):
+        super().__init__(
+            name="backup",
+            aliases=("bk",),
+            usage=f"backup",
+            description="Show the last database backup and the amount of failed backups since startup.",
+            req_perms=Permissions().none(),
+            permission_lvl=command.PermissionLevel.DEV
+        )
+
+    async def _execute(self, event: PrefixedCommandEvent):
+        b = workers.databaseBackup.get_last_backup()
+        failures = workers.databaseBackup.get_failures()
+        if b is None:
+            await event.reply(f"No backup taken since startup. Failed backups: {failures}")
+            return
+
+        await event.reply(f"Last backup: ``{b.path}`` ({discord.utils.format_dt(b.time.replace(tzinfo=timezone.utc))})\n"
+                          f"Size: {b.size / 1_000_000:.1f}MB, stored: {b.stored_size / 1_000_000:.1f}MB\n"
+                          f"Changed archives copied: {b.archives}\n"
+                          f"Duration: {b.duration:.1f}s\n"
+                          f"Failed backups: {failures}")
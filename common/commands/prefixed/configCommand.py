@@ -109,4 +109,4 @@ class ConfigCommand(command.Command):
                                                                      f"Valid options are: ``prefix``, ``stratrole``, ``memberrole``, ``logchannel``")
                 return
 
-        event.bot.server_configs.save()
+        await event.bot.server_configs.save(server_id)
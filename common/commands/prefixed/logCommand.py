@@ -1,10 +1,10 @@
+import contextlib
 from datetime import timedelta, datetime, timezone
 
 import discord.utils
 from discord import Permissions, Embed
 
 import common.utils.discord
-import common.utils.misc
 from common.commands import command
 from common.commands.commandEvent import PrefixedCommandEvent
 from common import botConfig
@@ -32,7 +32,7 @@ class LogCommand(command.Command):
 
         if len(event.args) == 2:
             timearg = event.args[1]
-            if not timearg.endswith("d") or timearg.endswith("m"):
+            if not (timearg.endswith("d") or timearg.endswith("m")):
                 await common.utils.discord.send_error(event.channel, f"Couldn't parse time ``{timearg}``!")
                 return
 
@@ -66,25 +66,38 @@ class LogCommand(command.Command):
                 return
 
         time = datetime.now(timezone.utc) - td
-        logs = await guildMemberLogData.get_logs(after=time)
+        total = sum((await guildMemberLogData.count_logs(after=time)).values())
 
-        if len(logs) == 0:
+        if total == 0:
             await common.utils.discord.send_info(event.channel,
                                           f"No info entries found since {discord.utils.format_dt(time, style='D')}.")
             return
 
-        text = "```" + \
-               "```$```".join(f"[{entry.timestamp}] {entry.content}" for entry in logs) + \
-               "```"
-
         embed = Embed(
             title=f"Guild Logs since {discord.utils.format_dt(time, style='D')}",
             color=botConfig.DEFAULT_COLOR,
         )
 
-        content = common.utils.misc.split_str(text, 1000, "$")
-        content = [s.replace("$", " ") for s in content]
-        for s in content[:25]:
-            embed.add_field(name="", value=s, inline=False)
+        # Entries are streamed until the embed is full, so old timeframes don't load the entire log.
+        shown = 0
+        field = ""
+        async with contextlib.aclosing(guildMemberLogData.iter_logs(after=time, chunk_size=100)) as entries:
+            async for entry in entries:
+                # the content is cut before the fence is added, so a long entry still closes its code block
+                prefix = f"[{entry.timestamp}] "
+                text = f"```{prefix}{entry.content[:1000 - len(prefix) - 6]}```"
+                if len(field) + len(text) + 1 > 1000 and len(field) > 0:
+                    embed.add_field(name="", value=field, inline=False)
+                    field = ""
+                    if len(embed.fields) == 25:
+                        break
+                field = f"{field} {text}" if len(field) > 0 else text
+                shown += 1
+            else:
+                if len(field) > 0:
+                    embed.add_field(name="", value=field, inline=False)
+
+        if shown < total:
+            embed.set_footer(text=f"Showing {shown} of {total} entries.")
 
         await event.channel.send(embed=embed)
@@ -0,0 +1,68 @@
+from discord import Permissions, Embed
+
+import common.storage.queryStats
+import common.utils.misc
+from common.commands import command
+from common.commands.commandEvent import PrefixedCommandEvent
+from common.utils import tableBuilder
+
+
+class QueryStatsCommand(command.Command):
+    def __init__(self):
+        super().__init__(
+            name="querystats",
+            aliases=("qs",),
+            usage=f"querystats [count|plan <rank>|reset]",
+            description="Show the slowest database statements by total time spent, the query plan of one of them or "
+                        "reset the statistics.",
+            req_perms=Permissions().none(),
+            permission_lvl=command.PermissionLevel.DEV
+        )
+
+    async def _execute(self, event: PrefixedCommandEvent):
+        stats = common.storage.queryStats.get_stats()
+
+        if len(event.args) > 1 and event.args[1] == "reset":
+            common.storage.queryStats.reset()
+            await event.reply("Query statistics reset.")
+            return
+
+        if len(event.args) > 2 and event.args[1] == "plan":
+            if not event.args[2].isdigit() or not 0 < int(event.args[2]) <= len(stats):
+                await event.reply_error("Invalid rank!")
+                return
+            s = stats[int(event.args[2]) - 1]
+            plan = s.last_plan if s.last_plan is not None else "No plan captured. Plans are captured for slow queries."
+            await event.reply(f"```sql\n{s.sql[:1500]}```\n```\n{plan[:400]}```")
+            return
+
+        count = min(int(event.args[1]), 20) if len(event.args) > 1 and event.args[1].isdigit() else 10
+
+        embed = Embed(
+            title="Database statements by total time",
+            description=f"Histogram buckets: ≤{', ≤'.join(f'{b * 1000:g}' for b in common.storage.queryStats.HISTOGRAM_BUCKETS)}, "
+                        f">{common.storage.queryStats.HISTOGRAM_BUCKETS[-1] * 1000:g} ms",
+            color=event.bot.config.DEFAULT_COLOR
+        )
+
+        if len(stats) == 0:
+            embed.add_field(name="No statements recorded.", value="", inline=False)
+            await event.reply(embed=embed)
+            return
+
+        table_builder = tableBuilder.TableBuilder.from_str('r  r  r  r  r  r  l')
+        table_builder.add_row("#", "Calls", "Total s", "Avg ms", "Max ms", "Rows", "Histogram")
+        table_builder.add_seperator_row()
+        for i, s in enumerate(stats[:count]):
+            table_builder.add_row(i + 1, s.calls, f"{s.total_time:.2f}", f"{s.avg_time * 1000:.1f}",
+                                  f"{s.max_time * 1000:.1f}", s.rows, "/".join(str(n) for n in s.histogram))
+
+        splits = common.utils.misc.split_str(table_builder.build(), 1000, "\n")
+        for split in splits:
+            embed.add_field(name="", value=f">>> ```\n{split}```", inline=False)
+
+        statements = "\n".join(f"{i + 1}: {s.sql[:90]}" for i, s in enumerate(stats[:count]))
+        for split in common.utils.misc.split_str(statements, 1000, "\n"):
+            embed.add_field(name="", value=f"```sql\n{split}```", inline=False)
+
+        await event.reply(embed=embed)
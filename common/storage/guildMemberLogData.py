@@ -1,5 +1,6 @@
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
 
 from common.types.enums import LogEntryType
 from . import manager
@@ -19,24 +20,20 @@ class LogEntry:
 
 
 async def log(entry_type: LogEntryType, content: str, uuid: str):
-    con = manager.get_connection()
-    cur = await con.cursor()
-    await cur.execute("""
-            INSERT INTO guild_member_log (entry_type, content, uuid)
-            VALUES (?, ?, ?)
-        """, (entry_type.value, content, uuid))
+    async with manager.transaction() as cur:
+        await cur.execute("""
+                INSERT INTO guild_member_log (entry_type, content, uuid)
+                VALUES (?, ?, ?)
+            """, (entry_type.value, content, uuid))
 
-    await con.commit()
 
+def _utc(t: datetime) -> datetime:
+    # timestamps are stored as naive UTC
+    return t if t.tzinfo is None else t.astimezone(timezone.utc).replace(tzinfo=None)
 
-async def get_logs(*,
-                   log_ids: list[int] | None = None,
-                   entry_types: list[LogEntryType] | None = None,
-                   uuids: list[str] | None = None,
-                   before: datetime | None = None,
-                   after: datetime | None = None):
-    cur = await manager.get_cursor()
 
+def _filter(log_ids: list[int] | None, entry_types: list[LogEntryType] | None, uuids: list[str] | None,
+            before: datetime | None, after: datetime | None) -> tuple[str, list]:
     conditions = []
     parameters = []
     if log_ids is not None:
@@ -50,17 +47,92 @@ async def get_logs(*,
         parameters += [uuid.replace("-", "").lower() for uuid in uuids]
     if before is not None:
         conditions.append(f"timestamp <= ?")
-        parameters.append(before)
+        parameters.append(_utc(before))
     if after is not None:
         conditions.append(f"timestamp >= ?")
-        parameters.append(after)
+        parameters.append(_utc(after))
+
+    return " AND ".join(conditions) if len(conditions) > 0 else "1", parameters
 
-    query = "SELECT * FROM guild_member_log"
-    if len(conditions) > 0:
-        query += " WHERE " + " AND ".join(condition for condition in conditions)
 
-    res = await cur.execute(query, parameters)
+async def get_logs(*,
+                   log_ids: list[int] | None = None,
+                   entry_types: list[LogEntryType] | None = None,
+                   uuids: list[str] | None = None,
+                   before: datetime | None = None,
+                   after: datetime | None = None) -> tuple[LogEntry, ...]:
+    """
+    Get all log entries matching the filters, oldest first. Use :func:`iter_logs` for long time ranges.
+    """
+    condition, parameters = _filter(log_ids, entry_types, uuids, before, after)
+
+    cur = await manager.get_read_cursor()
+    res = await cur.execute(f"""
+                SELECT * FROM guild_member_log
+                WHERE {condition}
+                ORDER BY timestamp, log_id
+            """, parameters)
 
     data = await res.fetchall()
 
     return tuple(LogEntry.make(**{k: row[k] for k in row.keys()}) for row in data)
+
+
+async def iter_logs(*,
+                    log_ids: list[int] | None = None,
+                    entry_types: list[LogEntryType] | None = None,
+                    uuids: list[str] | None = None,
+                    before: datetime | None = None,
+                    after: datetime | None = None,
+                    newest_first: bool = False,
+                    chunk_size: int = 500) -> AsyncIterator[LogEntry]:
+    """
+    Stream the log entries matching the filters. Entries are fetched in chunks of `chunk_size`, each continuing after
+    the last entry of the previous chunk, so memory use doesn't depend on the amount of entries.
+
+    :param newest_first: If True, the newest entries are returned first.
+    :param chunk_size: The amount of entries fetched per query.
+    """
+    condition, parameters = _filter(log_ids, entry_types, uuids, before, after)
+    op, order = ("<", "DESC") if newest_first else (">", "ASC")
+
+    last = None
+    while True:
+        cur = await manager.get_read_cursor()
+        res = await cur.execute(f"""
+                    SELECT * FROM guild_member_log
+                    WHERE {condition}
+                    {"" if last is None else f"AND (timestamp, log_id) {op} (?, ?)"}
+                    ORDER BY timestamp {order}, log_id {order}
+                    LIMIT ?
+                """, parameters + ([] if last is None else list(last)) + [chunk_size])
+        rows = await res.fetchall()
+
+        for row in rows:
+            yield LogEntry.make(**{k: row[k] for k in row.keys()})
+
+        if len(rows) < chunk_size:
+            return
+        last = (rows[-1]["timestamp"], rows[-1]["log_id"])
+
+
+async def count_logs(*,
+                     entry_types: list[LogEntryType] | None = None,
+                     uuids: list[str] | None = None,
+                     before: datetime | None = None,
+                     after: datetime | None = None) -> dict[LogEntryType, int]:
+    """
+    Count the log entries matching the filters.
+
+    :return: A dict mapping the entry types to the amount of matching entries. Types without entries are omitted.
+    """
+    condition, parameters = _filter(None, entry_types, uuids, before, after)
+
+    cur = await manager.get_read_cursor()
+    res = await cur.execute(f"""
+                SELECT entry_type, count(*) as count FROM guild_member_log
+                WHERE {condition}
+                GROUP BY entry_type
+            """, parameters)
+
+    return {LogEntryType(row["entry_type"]): row["count"] for row in await res.fetchall()}
@@ -0,0 +1,250 @@
+import dataclasses
+import hashlib
+import json
+from datetime import datetime
+
+from common.types.wynncraft import GuildStats
+from common.utils.misc import format_uuid
+from . import manager
+
+RANKS = ("owner", "chief", "strategist", "captain", "recruiter", "recruit")
+# Member fields that change without anything happening in the guild. They don't make a snapshot or member change.
+_VOLATILE_MEMBER_FIELDS = ("online", "server")
+
+# Hashes and members of the latest stored snapshot of each guild, by lowercase guild name. The members map the uuids
+# to their rank and their member data without the volatile fields.
+_hashes: dict[str, str] = {}
+_members: dict[str, dict[str, tuple[str, str]]] = {}
+
+
+def _split(stats: GuildStats) -> tuple[dict, list[tuple]]:
+    # The guild stats without the member lists and one (uuid, rank, member json) tuple per member.
+    data = dataclasses.asdict(stats)
+    members = data["members"]
+    data["members"] = {"total": members["total"]}
+    return data, [(uuid.replace("-", "").lower(), rank, m) for rank in RANKS for uuid, m in members[rank].items()]
+
+
+def _stable(member: dict) -> str:
+    return json.dumps({k: v for k, v in member.items() if k not in _VOLATILE_MEMBER_FIELDS}, sort_keys=True)
+
+
+def content_hash(stats: GuildStats) -> str:
+    """
+    Hash the content of guild stats, ignoring who is currently online.
+    """
+    data, members = _split(stats)
+    data.pop("online")
+    members = [(uuid, rank, _stable(m)) for uuid, rank, m in members]
+    return hashlib.sha1(json.dumps([data, sorted(members)], sort_keys=True).encode()).hexdigest()
+
+
+# The latest change of each member of a guild up to a snapshot. Members that left have a NULL rank.
+_MEMBERS_AT_SQL = """
+    SELECT c.* FROM guild_member_changes AS c
+    WHERE c.guild = :guild
+    AND c.record_time = (
+        SELECT max(record_time) FROM guild_member_changes
+        WHERE guild = c.guild
+        AND uuid = c.uuid
+        AND record_time <= :record_time
+    )
+    AND c.rank IS NOT NULL
+"""
+
+
+async def _stored_state(guild_name: str) -> tuple[str | None, dict[str, tuple[str, str]]]:
+    key = guild_name.lower()
+    if key not in _hashes:
+        cur = await manager.get_read_cursor()
+        res = await cur.execute("""
+                    SELECT record_time, hash FROM guild_snapshots
+                    WHERE guild = ?
+                    ORDER BY record_time DESC
+                    LIMIT 1
+                """, (guild_name,))
+        row = await res.fetchone()
+        if row is None:
+            return None, {}
+        res = await cur.execute(_MEMBERS_AT_SQL, {"guild": guild_name, "record_time": row["record_time"]})
+        _members[key] = {m["uuid"]: (m["rank"], _stable(json.loads(m["member"]))) for m in await res.fetchall()}
+        _hashes[key] = row["hash"]
+    return _hashes[key], _members[key]
+
+
+async def store(stats: GuildStats, record_time: datetime = None) -> bool:
+    """
+    Store a snapshot of a guild if its content changed since the last stored snapshot. Only the members that joined,
+    left or changed since then are written.
+
+    :param stats: The current guild stats.
+    :param record_time: The time of the snapshot. Defaults to now.
+    :return: True if a snapshot was stored.
+    """
+    h = content_hash(stats)
+    prev_hash, prev_members = await _stored_state(stats.name)
+    if prev_hash == h:
+        return False
+
+    record_time = record_time or datetime.utcnow()
+    data, members = _split(stats)
+    now_members = {uuid: (rank, _stable(m)) for uuid, rank, m in members}
+    async with manager.transaction() as cur:
+        await cur.execute("INSERT OR REPLACE INTO guild_snapshots VALUES (?, ?, ?, ?)",
+                          (stats.name, record_time, h, json.dumps(data)))
+        await cur.executemany("INSERT OR REPLACE INTO guild_member_changes VALUES (?, ?, ?, ?, ?, ?)",
+                              ((stats.name, uuid, record_time, rank, m["contributed"], json.dumps(m))
+                               for uuid, rank, m in members if prev_members.get(uuid) != now_members[uuid]))
+        await cur.executemany("INSERT OR REPLACE INTO guild_member_changes (guild, uuid, record_time) VALUES (?, ?, ?)",
+                              ((stats.name, uuid, record_time) for uuid in prev_members if uuid not in now_members))
+    _hashes[stats.name.lower()] = h
+    _members[stats.name.lower()] = now_members
+    return True
+
+
+async def get_latest(guild_names: list[str]) -> dict[str, GuildStats]:
+    """
+    Get the latest stored snapshot of guilds.
+
+    :param guild_names: The names of the guilds (case-insensitive).
+    :return: A dict mapping the given guild names to their stats. Guilds without snapshots are omitted.
+    """
+    cur = await manager.get_read_cursor()
+    data = {}
+    for name in guild_names:
+        res = await cur.execute("""
+                    SELECT record_time, stats FROM guild_snapshots
+                    WHERE guild = ?
+                    ORDER BY record_time DESC
+                    LIMIT 1
+                """, (name,))
+        row = await res.fetchone()
+        if row is None:
+            continue
+
+        data[name] = json.loads(row["stats"])
+        data[name]["members"] |= {rank: {} for rank in RANKS}
+        res = await cur.execute(_MEMBERS_AT_SQL, {"guild": name, "record_time": row["record_time"]})
+        for m in await res.fetchall():
+            data[name]["members"][m["rank"]][format_uuid(m["uuid"])] = json.loads(m["member"])
+
+    return {name: GuildStats.from_json(stats) for name, stats in data.items()}
+
+
+async def get_member_counts(guild_name: str, after: datetime = None,
+                            before: datetime = None) -> list[tuple[datetime, int]]:
+    """
+    Get the member count of a guild at every stored snapshot.
+
+    :return: A list of (snapshot time, member count) tuples, oldest first.
+    """
+    after = after or datetime.min
+    before = before or datetime.max
+
+    cur = await manager.get_read_cursor()
+    res = await cur.execute("""
+                SELECT record_time, 1 AS is_snapshot, NULL AS uuid, NULL AS rank FROM guild_snapshots
+                WHERE guild = :guild AND record_time >= :after AND record_time <= :before
+                UNION ALL
+                SELECT record_time, 0 AS is_snapshot, uuid, rank FROM guild_member_changes
+                WHERE guild = :guild AND record_time <= :before
+                ORDER BY record_time, is_snapshot
+            """, {"guild": guild_name, "after": after, "before": before})
+
+    # Changes are sorted before the snapshot they belong to.
+    members = set()
+    counts = []
+    for row in await res.fetchall():
+        if row["is_snapshot"]:
+            counts.append((datetime.fromisoformat(row["record_time"]), len(members)))
+        elif row["rank"] is None:
+            members.discard(row["uuid"])
+        else:
+            members.add(row["uuid"])
+    return counts
+
+
+async def get_contributions(guild_name: str, uuid: str, after: datetime = None,
+                            before: datetime = None) -> list[tuple[datetime, int]]:
+    """
+    Get the guild xp contributed by a member at every stored snapshot it changed while they were part of the guild.
+
+    :return: A list of (snapshot time, contributed xp) tuples, oldest first.
+    """
+    cur = await manager.get_read_cursor()
+    res = await cur.execute("""
+                SELECT record_time, contributed FROM guild_member_changes
+                WHERE guild = ? AND uuid = ? AND record_time >= ? AND record_time <= ?
+                AND rank IS NOT NULL
+                ORDER BY record_time
+            """, (guild_name, uuid.replace("-", "").lower(), after or datetime.min, before or datetime.max))
+
+    contributions = []
+    for row in await res.fetchall():
+        if len(contributions) == 0 or contributions[-1][1] != row["contributed"]:
+            contributions.append((datetime.fromisoformat(row["record_time"]), row["contributed"]))
+    return contributions
+
+
+async def get_guild_names() -> list[str]:
+    """
+    Get the names of all guilds with stored snapshots.
+    """
+    cur = await manager.get_read_cursor()
+    res = await cur.execute("SELECT DISTINCT guild FROM guild_snapshots ORDER BY guild")
+    return [row["guild"] for row in await res.fetchall()]
+
+
+async def downsample_snapshots(guild_name: str, full_before: datetime, daily_before: datetime) -> int:
+    """
+    Thin out old snapshots of a guild in a single transaction, like the player snapshots (see
+    :func:`playerTrackerData.downsample_snapshots`). The member changes of removed snapshots are moved to the next kept
+    snapshot, so the members of every kept snapshot stay the same.
+
+    :param guild_name: The name of the guild.
+    :param full_before: Snapshots after this are kept at full resolution.
+    :param daily_before: Snapshots before this are reduced to one per week.
+    :return: The amount of deleted snapshots.
+    """
+    params = {"guild": guild_name, "full_before": full_before, "daily_before": daily_before}
+
+    async with manager.transaction() as cur:
+        res = await cur.execute(f"""
+                    SELECT record_time, row_number() OVER (
+                        PARTITION BY {manager.RETENTION_PERIOD_SQL} ORDER BY record_time DESC
+                    ) AS rn
+                    FROM guild_snapshots
+                    WHERE guild = :guild
+                    AND record_time < :full_before
+                    ORDER BY record_time DESC
+                """, params)
+
+        # The last snapshot of every period is kept, so each removed snapshot has a kept one after it.
+        removed = []
+        kept = None
+        for row in await res.fetchall():
+            if row["rn"] == 1:
+                kept = row["record_time"]
+            else:
+                removed.append((row["record_time"], kept))
+        if len(removed) == 0:
+            return 0
+
+        await cur.executemany("""
+                    UPDATE guild_member_changes SET record_time = :kept
+                    WHERE guild = :guild
+                    AND record_time = :removed
+                    AND NOT EXISTS (
+                        SELECT 1 FROM guild_member_changes AS c
+                        WHERE c.guild = guild_member_changes.guild
+                        AND c.uuid = guild_member_changes.uuid
+                        AND c.record_time > :removed
+                        AND c.record_time <= :kept
+                    )
+                """, ({"guild": guild_name, "removed": t, "kept": k} for t, k in removed))
+        await cur.executemany("DELETE FROM guild_member_changes WHERE guild = ? AND record_time = ?",
+                              ((guild_name, t) for t, _ in removed))
+        await cur.executemany("DELETE FROM guild_snapshots WHERE guild = ? AND record_time = ?",
+                              ((guild_name, t) for t, _ in removed))
+
+    return len(removed)
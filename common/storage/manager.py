@@ -1,16 +1,254 @@
+import asyncio
+import itertools
+import json
+import os
+import sqlite3
+import time
+from configparser import ConfigParser
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Final, AsyncIterator
+
 import aiosqlite
 import common.types.enums
+from common.storage import queryStats
+
+_config = ConfigParser()
+if os.path.exists('database_config.ini'):
+    _config.read('database_config.ini')
+else:
+    _config.add_section('DATABASE')
+    _config.set('DATABASE', 'READ_POOL_SIZE', '4')
+    _config.set('DATABASE', 'WAL_AUTOCHECKPOINT', '1000')
+    _config.set('DATABASE', 'CHECKPOINT_INTERVAL', '300')
+    _config.set('DATABASE', 'CHECKPOINT_MODE', 'PASSIVE')
+    _config.set('DATABASE', 'ARCHIVE_AFTER_MONTHS', '3')
+    _config.set('DATABASE', 'SLOW_QUERY_THRESHOLD', '0.5')
+    _config.set('DATABASE', 'BACKUP_INTERVAL', '24')
+    _config.set('DATABASE', 'BACKUP_DIR', '')
+    _config.set('DATABASE', 'BACKUP_KEEP', '7')
+    _config.set('DATABASE', 'BACKUP_COMPRESS', 'True')
+
+# Number of read-only connections used for queries.
+READ_POOL_SIZE: Final = _config.getint('DATABASE', 'READ_POOL_SIZE')
+# Size of the WAL in pages after which a commit triggers an automatic checkpoint. 0 disables automatic checkpoints.
+WAL_AUTOCHECKPOINT: Final = _config.getint('DATABASE', 'WAL_AUTOCHECKPOINT')
+# Seconds between checkpoints run by the checkpoint worker. 0 disables the worker.
+CHECKPOINT_INTERVAL: Final = _config.getint('DATABASE', 'CHECKPOINT_INTERVAL')
+# One of PASSIVE, FULL, RESTART or TRUNCATE. See https://www.sqlite.org/pragma.html#pragma_wal_checkpoint
+CHECKPOINT_MODE: Final = _config.get('DATABASE', 'CHECKPOINT_MODE').upper()
+# Number of full months of player snapshots kept in the main database before they are moved to the monthly archive
+# databases. 0 disables archiving.
+ARCHIVE_AFTER_MONTHS: Final = _config.getint('DATABASE', 'ARCHIVE_AFTER_MONTHS')
+# Statements taking longer than this many seconds are logged with their query plan.
+SLOW_QUERY_THRESHOLD: Final = _config.getfloat('DATABASE', 'SLOW_QUERY_THRESHOLD')
+# Hours between backups taken by the backup worker. 0 disables the worker.
+BACKUP_INTERVAL: Final = _config.getfloat('DATABASE', 'BACKUP_INTERVAL')
+# Directory the backups are written to. Defaults to a backups directory next to the database file.
+BACKUP_DIR: Final = _config.get('DATABASE', 'BACKUP_DIR')
+# Number of backups kept. Older ones are deleted after a new backup was taken.
+BACKUP_KEEP: Final = _config.getint('DATABASE', 'BACKUP_KEEP')
+# Whether backups are gzip compressed.
+BACKUP_COMPRESS: Final = _config.getboolean('DATABASE', 'BACKUP_COMPRESS')
 
 _con: aiosqlite.Connection = None
+_readers: list[aiosqlite.Connection] = []
+_reader_cycle: itertools.cycle = None
+_write_lock = asyncio.Lock()
+_path: str = None
+_archive_dir: str = None
+_archived_months: list[date] = []
+_archives: dict[date, aiosqlite.Connection] = {}
+# Months whose snapshots are being moved to their archive right now.
+_archiving: set[date] = set()
+
+# Players whose snapshots are moved to an archive per transaction, and the pause between two transactions.
+ARCHIVE_BATCH_SIZE: Final = 200
+ARCHIVE_BATCH_DELAY: Final = 0.1  # seconds
+
+# Pages copied per step of a backup, and the pause between two steps.
+BACKUP_STEP_PAGES: Final = 1024
+BACKUP_STEP_DELAY: Final = 0.01  # seconds
+
+# Columns shared by player_tracking and player_latest.
+PLAYER_STATS_COLUMNS = (
+    ("record_time", "DATE NOT NULL"),
+    ("uuid", "TEXT NOT NULL COLLATE NOCASE"),
+    ("username", "TEXT NOT NULL COLLATE NOCASE"),
+    ("rank", "TEXT"),
+    ("support_rank", "TEXT"),
+    ("first_join", "DATE"),
+    ("last_join", "DATE"),
+    ("playtime", "REAL"),
+    ("guild_uuid", "TEXT"),
+    ("guild_name", "TEXT"),
+    ("guild_rank", "TEXT"),
+    ("wars", "INTEGER"),
+    ("total_levels", "INTEGER"),
+    ("killed_mobs", "INTEGER"),
+    ("chests_found", "INTEGER"),
+    ("dungeons_total", "INTEGER"),
+    ("dungeons_ds", "INTEGER"),
+    ("dungeons_ip", "INTEGER"),
+    ("dungeons_ls", "INTEGER"),
+    ("dungeons_uc", "INTEGER"),
+    ("dungeons_ss", "INTEGER"),
+    ("dungeons_ib", "INTEGER"),
+    ("dungeons_gg", "INTEGER"),
+    ("dungeons_ur", "INTEGER"),
+    ("dungeons_cds", "INTEGER"),
+    ("dungeons_cip", "INTEGER"),
+    ("dungeons_cls", "INTEGER"),
+    ("dungeons_css", "INTEGER"),
+    ("dungeons_cuc", "INTEGER"),
+    ("dungeons_cgg", "INTEGER"),
+    ("dungeons_cur", "INTEGER"),
+    ("dungeons_cib", "INTEGER"),
+    ("dungeons_ff", "INTEGER"),
+    ("dungeons_eo", "INTEGER"),
+    ("dungeons_ts", "INTEGER"),
+    ("raids_total", "INTEGER"),
+    ("raids_notg", "INTEGER"),
+    ("raids_nol", "INTEGER"),
+    ("raids_tcc", "INTEGER"),
+    ("raids_tna", "INTEGER"),
+    ("completed_quests", "INTEGER"),
+    ("pvp_kills", "INTEGER"),
+    ("pvp_deaths", "INTEGER"),
+)
+
+# Stat columns rolled up into player_daily. Each one is stored as <stat>_first and <stat>_last.
+DAILY_STATS = tuple(name for name, _ in PLAYER_STATS_COLUMNS if name not in ("record_time", "uuid"))
+
+# Columns stored for snapshots that only differ from the previous snapshot of the player in these columns.
+HEARTBEAT_COLUMNS = ("record_time", "uuid", "last_join")
+
+# Rows of player_tracking and player_heartbeats combined. Heartbeats take the other columns from the preceding
+# player_tracking row of the player.
+_PLAYER_SNAPSHOTS_VIEW = f"""
+    SELECT {', '.join(name for name, _ in PLAYER_STATS_COLUMNS)} FROM player_tracking
+    UNION ALL
+    SELECT {', '.join(f'h.{name}' if name in HEARTBEAT_COLUMNS else f't.{name}' for name, _ in PLAYER_STATS_COLUMNS)}
+    FROM player_heartbeats AS h
+    JOIN player_tracking AS t
+    ON t.uuid = h.uuid AND t.record_time = (
+        SELECT max(record_time) FROM player_tracking
+        WHERE uuid = h.uuid
+        AND record_time < h.record_time
+    )
+"""
+
+_DAILY_STATS_COLUMNS = tuple(
+    (f"{name}_{suffix}", definition.split(" ")[0])
+    for name, definition in PLAYER_STATS_COLUMNS if name in DAILY_STATS
+    for suffix in ("first", "last")
+)
+
+
+def _column_defs(columns) -> str:
+    return "".join(f"{name} {definition},\n" for name, definition in columns)
+
+
+# One-shot data migrations. Each entry is run exactly once, in order, on databases with a lower user_version.
+_MIGRATIONS = [
+    # 1: backfill player_latest from existing player_tracking data
+    """
+    INSERT OR REPLACE INTO player_latest
+    SELECT a.* FROM player_tracking AS a
+    JOIN (
+        SELECT uuid, max(record_time) AS t
+        FROM player_tracking
+        GROUP BY uuid
+    ) AS b
+    ON a.uuid = b.uuid AND a.record_time = b.t;
+    """,
+    # 2: backfill player_daily from existing player_tracking data
+    f"""
+    INSERT OR REPLACE INTO player_daily
+    SELECT uuid, day, first_time, last_time, {', '.join(name for name, _ in _DAILY_STATS_COLUMNS)}
+    FROM (
+        SELECT
+            uuid,
+            date(record_time) AS day,
+            first_value(record_time) OVER w AS first_time,
+            last_value(record_time) OVER w AS last_time,
+            {', '.join(f"first_value({c}) OVER w AS {c}_first, last_value({c}) OVER w AS {c}_last" for c in DAILY_STATS)},
+            row_number() OVER (PARTITION BY uuid, date(record_time) ORDER BY record_time) AS rn
+        FROM player_tracking
+        WINDOW w AS (
+            PARTITION BY uuid, date(record_time)
+            ORDER BY record_time
+            ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+        )
+    )
+    WHERE rn = 1;
+    """,
+    # 3: move existing snapshots that only repeat the previous one into player_heartbeats
+    f"""
+    INSERT OR IGNORE INTO player_heartbeats ({', '.join(HEARTBEAT_COLUMNS)})
+    SELECT {', '.join(HEARTBEAT_COLUMNS)} FROM (
+        SELECT
+            {', '.join(HEARTBEAT_COLUMNS)},
+            {' AND '.join(f'{name} IS lag({name}) OVER w' for name, _ in PLAYER_STATS_COLUMNS
+                          if name not in HEARTBEAT_COLUMNS)} AS unchanged
+        FROM player_tracking
+        WINDOW w AS (PARTITION BY uuid ORDER BY record_time)
+    )
+    WHERE unchanged;
+    DELETE FROM player_tracking
+    WHERE EXISTS (
+        SELECT 1 FROM player_heartbeats AS h
+        WHERE h.uuid = player_tracking.uuid
+        AND h.record_time = player_tracking.record_time
+    );
+    """,
+]
+
+
+# Period a snapshot older than :full_before is kept for by the retention worker: its day, or its week (ending on
+# sunday) before :daily_before. Weeks are prefixed so they don't share a partition with the day their sunday falls on.
+RETENTION_PERIOD_SQL = """
+    CASE WHEN record_time < :daily_before THEN 'W' || date(record_time, 'weekday 0') ELSE date(record_time) END
+"""
+
+
+def _unfreeze_trigger(event: str) -> str:
+    # Backfilled daily rollups of a frozen season invalidate its leaderboards.
+    return f"""
+        CREATE TRIGGER IF NOT EXISTS player_daily_{event.lower()}_unfreeze AFTER {event} ON player_daily
+        WHEN NEW.day <= (SELECT max(last_day) FROM frozen_seasons)
+        BEGIN
+            DELETE FROM frozen_seasons WHERE NEW.day BETWEEN first_day AND last_day;
+        END;
+    """
 
 
-async def init_database():
-    global _con
+async def init_database(path: str = "./data/NiaBot.db", archive_dir: str = None):
+    """
+    Open the database and create or migrate the schema.
+    The database is put into WAL mode so the read-only connections can query it while the writer is busy.
+
+    :param path: The path of the database file.
+    :param archive_dir: The directory of the monthly player snapshot archives. Defaults to an archive directory next
+                        to the database file.
+    """
+    global _con, _reader_cycle, _path, _archive_dir, _archived_months
     if _con is not None:
         raise RuntimeError("init_database() was already called")
-    _con = await aiosqlite.connect("./data/NiaBot.db")
+    _path = os.path.abspath(path)
+    _archive_dir = os.path.abspath(archive_dir or os.path.join(os.path.dirname(_path), "archive"))
+    _archived_months = sorted(
+        datetime.strptime(f, "player_tracking_%Y_%m.db").date()
+        for f in os.listdir(_archive_dir) if f.startswith("player_tracking_") and f.endswith(".db")
+    ) if os.path.isdir(_archive_dir) else []
+
+    _con = await aiosqlite.connect(path)
     _con.row_factory = aiosqlite.Row
 
+    await _con.execute("PRAGMA journal_mode = WAL")
+    await _con.execute("PRAGMA synchronous = NORMAL")
+    await _con.execute(f"PRAGMA wal_autocheckpoint = {WAL_AUTOCHECKPOINT}")
+
     cur = await _con.cursor()
     await cur.executescript(f"""
                     CREATE TABLE IF NOT EXISTS playtimes (
@@ -19,6 +257,12 @@ async def init_database():
                         playtime INTEGER NOT NULL,
                         PRIMARY KEY (uuid, day)
                     );
+                    CREATE TABLE IF NOT EXISTS private_members (
+                        guild TEXT NOT NULL COLLATE NOCASE,
+                        stat TEXT NOT NULL,
+                        uuid TEXT NOT NULL COLLATE NOCASE,
+                        PRIMARY KEY (guild, stat, uuid)
+                    ) WITHOUT ROWID;
                     CREATE TABLE IF NOT EXISTS strikes (
                         strike_id INTEGER PRIMARY KEY,
                         user_id INTEGER NOT NULL,
@@ -27,6 +271,12 @@ async def init_database():
                         reason TEXT NOT NULL,
                         pardoned INTEGER NOT NULL
                     );
+                    CREATE TABLE IF NOT EXISTS server_configs (
+                        bot_id TEXT NOT NULL,
+                        server_id INTEGER NOT NULL,
+                        config TEXT NOT NULL,
+                        PRIMARY KEY (bot_id, server_id)
+                    ) WITHOUT ROWID;
                     CREATE TABLE IF NOT EXISTS minecraft_usernames (
                         uuid TEXT PRIMARY KEY NOT NULL COLLATE NOCASE,
                         name TEXT UNIQUE NOT NULL COLLATE NOCASE
@@ -38,74 +288,443 @@ async def init_database():
                         uuid TEXT NOT NULL COLLATE NOCASE,
                         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
                     );
+                    CREATE INDEX IF NOT EXISTS guild_member_log_timestamp_idx ON guild_member_log (timestamp);
+                    CREATE INDEX IF NOT EXISTS guild_member_log_uuid_idx ON guild_member_log (uuid, timestamp);
+                    CREATE INDEX IF NOT EXISTS guild_member_log_type_idx ON guild_member_log (entry_type, timestamp);
                     CREATE TABLE IF NOT EXISTS player_tracking (
+                        {_column_defs(PLAYER_STATS_COLUMNS)}
+                        PRIMARY KEY (uuid, record_time)
+                    );
+                    CREATE INDEX IF NOT EXISTS wars_idx ON player_tracking (uuid, record_time, wars) WHERE wars > 0;
+                    CREATE TABLE IF NOT EXISTS player_daily (
+                        uuid TEXT NOT NULL COLLATE NOCASE,
+                        day DATE NOT NULL,
+                        first_time DATE NOT NULL,
+                        last_time DATE NOT NULL,
+                        {_column_defs(_DAILY_STATS_COLUMNS)}
+                        PRIMARY KEY (uuid, day)
+                    );
+                    CREATE INDEX IF NOT EXISTS player_daily_day_idx ON player_daily (day);
+                    CREATE TABLE IF NOT EXISTS player_latest (
+                        {_column_defs(PLAYER_STATS_COLUMNS)}
+                        PRIMARY KEY (uuid)
+                    );
+                    CREATE TABLE IF NOT EXISTS player_heartbeats (
                         record_time DATE NOT NULL,
                         uuid TEXT NOT NULL COLLATE NOCASE,
-                        username TEXT NOT NULL COLLATE NOCASE,
-                        rank TEXT,
-                        support_rank TEXT,
-                        first_join DATE,
                         last_join DATE,
-                        playtime REAL,
-                        guild_uuid TEXT,
-                        guild_name TEXT,
-                        guild_rank TEXT,
-                        wars INTEGER,
-                        total_levels INTEGER,
-                        killed_mobs INTEGER,
-                        chests_found INTEGER,
-                        dungeons_total INTEGER,
-                        dungeons_ds	INTEGER,
-                        dungeons_ip INTEGER,
-                        dungeons_ls INTEGER,
-                        dungeons_uc INTEGER,
-                        dungeons_ss INTEGER,
-                        dungeons_ib INTEGER,
-                        dungeons_gg INTEGER,
-                        dungeons_ur INTEGER,
-                        dungeons_cds INTEGER,
-                        dungeons_cip INTEGER,
-                        dungeons_cls INTEGER,
-                        dungeons_css INTEGER,
-                        dungeons_cuc INTEGER,
-                        dungeons_cgg INTEGER,
-                        dungeons_cur INTEGER,
-                        dungeons_cib INTEGER,
-                        dungeons_ff INTEGER,
-                        dungeons_eo INTEGER,
-                        dungeons_ts INTEGER,
-                        raids_total INTEGER,
-                        raids_notg INTEGER,
-                        raids_nol INTEGER,
-                        raids_tcc INTEGER,
-                        raids_tna INTEGER,
-                        completed_quests INTEGER,
-                        pvp_kills INTEGER,
-                        pvp_deaths INTEGER,
                         PRIMARY KEY (uuid, record_time)
-                    );
-                    CREATE INDEX IF NOT EXISTS wars_idx ON player_tracking (uuid, record_time, wars) WHERE wars > 0;
+                    ) WITHOUT ROWID;
+                    CREATE VIEW IF NOT EXISTS player_snapshots AS {_PLAYER_SNAPSHOTS_VIEW};
+                    CREATE TABLE IF NOT EXISTS guild_member_sets (
+                        guild TEXT NOT NULL COLLATE NOCASE,
+                        uuid TEXT NOT NULL COLLATE NOCASE,
+                        PRIMARY KEY (guild, uuid)
+                    ) WITHOUT ROWID;
+                    CREATE TABLE IF NOT EXISTS guild_snapshots (
+                        guild TEXT NOT NULL COLLATE NOCASE,
+                        record_time DATETIME NOT NULL,
+                        hash TEXT NOT NULL,
+                        stats TEXT NOT NULL,
+                        PRIMARY KEY (guild, record_time)
+                    ) WITHOUT ROWID;
+                    CREATE TABLE IF NOT EXISTS guild_member_changes (
+                        guild TEXT NOT NULL COLLATE NOCASE,
+                        uuid TEXT NOT NULL COLLATE NOCASE,
+                        record_time DATETIME NOT NULL,
+                        rank TEXT,
+                        contributed INTEGER,
+                        member TEXT,
+                        PRIMARY KEY (guild, uuid, record_time)
+                    ) WITHOUT ROWID;
+                    CREATE INDEX IF NOT EXISTS guild_member_changes_time_idx
+                        ON guild_member_changes (guild, record_time);
+                    CREATE TABLE IF NOT EXISTS season_leaderboards (
+                        season INTEGER NOT NULL,
+                        stat TEXT NOT NULL,
+                        rank INTEGER NOT NULL,
+                        uuid TEXT NOT NULL COLLATE NOCASE,
+                        value NOT NULL,
+                        PRIMARY KEY (season, stat, rank)
+                    ) WITHOUT ROWID;
+                    CREATE TABLE IF NOT EXISTS frozen_seasons (
+                        season INTEGER NOT NULL,
+                        stat TEXT NOT NULL,
+                        first_day DATE NOT NULL,
+                        last_day DATE NOT NULL,
+                        frozen_at DATETIME,  -- NULL while the leaderboard is being computed
+                        PRIMARY KEY (season, stat)
+                    ) WITHOUT ROWID;
+                    {_unfreeze_trigger("INSERT")}
+                    {_unfreeze_trigger("UPDATE")}
     """)
 
+    await _migrate(cur)
+
+    for _ in range(max(1, READ_POOL_SIZE)):
+        reader = await aiosqlite.connect(f"file:{_path}?mode=ro", uri=True)
+        reader.row_factory = aiosqlite.Row
+        await reader.execute("PRAGMA query_only = 1")
+        _readers.append(reader)
+    _reader_cycle = itertools.cycle(_readers)
+
+
+async def _migrate(cur: aiosqlite.Cursor):
+    """
+    Run all migrations that haven't been applied to the database yet. The schema version is stored in user_version.
+    """
+    res = await cur.execute("PRAGMA user_version")
+    version = (await res.fetchone())[0]
+
+    for i in range(version, len(_MIGRATIONS)):
+        await cur.executescript(f"""
+                    BEGIN;
+                    {_MIGRATIONS[i]}
+                    PRAGMA user_version = {i + 1};
+                    COMMIT;
+        """)
+
 
 def get_connection() -> aiosqlite.Connection:
+    """
+    Returns the writer connection.
+    """
     if _con is None:
         raise RuntimeError("call init_database() first")
     return _con
 
 
-async def get_cursor() -> aiosqlite.Cursor:
+async def _cursor(con: aiosqlite.Connection) -> queryStats.InstrumentedCursor:
+    return queryStats.InstrumentedCursor(await con.cursor(), con, SLOW_QUERY_THRESHOLD)
+
+
+async def get_cursor() -> queryStats.InstrumentedCursor:
+    """
+    Creates and returns a cursor object on the writer connection.
+    Prefer get_read_cursor() for queries and transaction() for writes.
+    """
+    if _con is None:
+        raise RuntimeError("call init_database() first")
+    return await _cursor(_con)
+
+
+async def get_read_cursor() -> queryStats.InstrumentedCursor:
+    """
+    Creates and returns a cursor object on one of the read-only connections.
+    Queries on these run in parallel with each other and with writes. They see the last committed state.
+    """
+    if _reader_cycle is None:
+        raise RuntimeError("call init_database() first")
+    return await _cursor(next(_reader_cycle))
+
+
+@asynccontextmanager
+async def transaction() -> AsyncIterator[queryStats.InstrumentedCursor]:
+    """
+    Run writes in a transaction on the writer connection.
+    The transaction is committed when the block exits and rolled back if it raises.
+    Only one transaction runs at a time so writes of different tasks don't end up in each other's commits.
+
+    :return: A cursor on the writer connection.
+    """
+    if _con is None:
+        raise RuntimeError("call init_database() first")
+    async with _write_lock:
+        cur = await _cursor(_con)
+        try:
+            yield cur
+        except BaseException:
+            await _con.rollback()
+            raise
+        await _con.commit()
+
+
+async def checkpoint(mode: str = CHECKPOINT_MODE) -> tuple[int, int, int]:
     """
-    Creates and returns a cursor object.
+    Copy the content of the WAL back into the database file.
+
+    :param mode: One of PASSIVE, FULL, RESTART or TRUNCATE.
+    :return: A tuple containing whether the checkpoint was blocked (0 or 1), the size of the WAL in pages and the
+             number of pages that were checkpointed.
+    """
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"Invalid checkpoint mode {mode}")
+    async with _write_lock:
+        cur = await get_cursor()
+        res = await cur.execute(f"PRAGMA wal_checkpoint({mode})")
+        return tuple(await res.fetchone())
+
+
+def get_path() -> str:
+    """
+    Returns the absolute path of the database file.
+    """
+    if _path is None:
+        raise RuntimeError("call init_database() first")
+    return _path
+
+
+def _paged_backup(source: str, path: str, snapshot: bool):
+    # Runs in a thread. Copies BACKUP_STEP_PAGES pages at a time with SQLite's online backup API.
+    src = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    dst = sqlite3.connect(path)
+    try:
+        if snapshot:
+            # An open read transaction pins the WAL snapshot, so commits of other connections don't restart the copy.
+            src.execute("BEGIN")
+            src.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+        src.backup(dst, pages=BACKUP_STEP_PAGES, progress=lambda *_: time.sleep(BACKUP_STEP_DELAY))
+    finally:
+        dst.close()
+        src.close()
+
+
+async def backup(path: str):
+    """
+    Write a consistent copy of the database to a file while it stays in use.
+    The copy is made with SQLite's online backup API on a separate connection in a thread, BACKUP_STEP_PAGES pages at
+    a time with a pause of BACKUP_STEP_DELAY in between. It holds a read transaction until it is done, so it copies a
+    single WAL snapshot and neither the writer nor the read pool waits for it. Checkpoints can't move past that
+    snapshot in the meantime, so the WAL grows by the writes made during the copy.
+
+    :param path: The path of the copy. Must not exist yet.
+    """
+    if _con is None:
+        raise RuntimeError("call init_database() first")
+    await asyncio.to_thread(_paged_backup, _path, path, True)
+
+
+async def backup_archive(month: date, path: str):
+    """
+    Write a consistent copy of the archive database of a month to a file, the same way as :func:`backup`.
+    Archives don't use WAL, so no read transaction is held between the steps, which would block archiving. If the
+    archive is written during the copy, SQLite starts the copy over. Use :func:`is_archiving` to skip months that are
+    being archived.
+
+    :param month: The first day of an archived month.
+    :param path: The path of the copy. Must not exist yet.
     """
     if _con is None:
         raise RuntimeError("call init_database() first")
-    return await _con.cursor()
+    await asyncio.to_thread(_paged_backup, get_archive_path(month), path, False)
+
+
+def is_archiving(month: date) -> bool:
+    """
+    :return: Whether the snapshots of a month are being moved to its archive right now.
+    """
+    return month in _archiving
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def get_archive_path(month: date) -> str:
+    """
+    Returns the absolute path of the archive database of a month.
+
+    :param month: The first day of the month.
+    """
+    if _archive_dir is None:
+        raise RuntimeError("call init_database() first")
+    return os.path.join(_archive_dir, f"player_tracking_{month:%Y_%m}.db")
+
+
+def get_archived_months(after: datetime = None, before: datetime = None) -> list[date]:
+    """
+    Get the months of player snapshots that were moved to archive databases.
+
+    :param after: If set, only months ending after this are returned.
+    :param before: If set, only months starting before this are returned.
+    :return: The first days of the months in ascending order.
+    """
+    return [
+        month for month in _archived_months
+        if (after is None or datetime.combine(_next_month(month), datetime.min.time()) > after)
+        and (before is None or datetime.combine(month, datetime.min.time()) <= before)
+    ]
+
+
+async def get_archive_cursor(month: date) -> queryStats.InstrumentedCursor:
+    """
+    Creates and returns a cursor on the archive database of a month. The connection is opened read-only on first use.
+    The main database is attached to it as `hot`, so queries written for the main database (using player_snapshots)
+    can run on it unchanged and only see the snapshots of that month.
+
+    :param month: The first day of an archived month.
+    """
+    if _con is None:
+        raise RuntimeError("call init_database() first")
+    if month not in _archives:
+        con = await aiosqlite.connect(f"file:{get_archive_path(month)}?mode=ro", uri=True)
+        con.row_factory = aiosqlite.Row
+        await con.execute(f"ATTACH DATABASE 'file:{_path}?mode=ro' AS hot")
+        await con.execute("PRAGMA query_only = 1")
+        if month in _archives:
+            await con.close()
+        else:
+            _archives[month] = con
+    return await _cursor(_archives[month])
+
+
+async def archive_month(month: date) -> int:
+    """
+    Move the player snapshots of a month to its archive database. The archive only contains full rows, heartbeats
+    are stored as the snapshot they stand for.
+    The snapshots are moved ARCHIVE_BATCH_SIZE players at a time, each batch in its own short transaction, so
+    buffered records can be flushed in between. Queries read the archive from the first batch on.
+
+    :param month: The first day of the month.
+    :return: The amount of archived snapshots.
+    """
+    if _con is None:
+        raise RuntimeError("call init_database() first")
+    os.makedirs(_archive_dir, exist_ok=True)
+
+    _archiving.add(month)
+    try:
+        return await _archive_month(month)
+    finally:
+        _archiving.discard(month)
+
+
+async def _archive_month(month: date) -> int:
+    global _archived_months
+    start = datetime.combine(month, datetime.min.time())
+    end = datetime.combine(_next_month(month), datetime.min.time())
+
+    async with _attached_archive(month) as cur:
+        await cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS archive.player_tracking (
+                    {_column_defs(PLAYER_STATS_COLUMNS)}
+                    PRIMARY KEY (uuid, record_time)
+                )
+            """)
+        await cur.execute(f"CREATE VIEW IF NOT EXISTS archive.player_snapshots AS SELECT * FROM player_tracking")
+
+    if month not in _archived_months:
+        _archived_months = sorted(_archived_months + [month])
+
+    archived = 0
+    after = ""
+    while True:
+        cur = await get_read_cursor()
+        res = await cur.execute("""
+                SELECT DISTINCT uuid FROM player_tracking
+                WHERE uuid > ?
+                ORDER BY uuid
+                LIMIT ?
+            """, (after, ARCHIVE_BATCH_SIZE))
+        uuids = [row['uuid'] for row in await res.fetchall()]
+        if len(uuids) == 0:
+            return archived
+
+        archived += await _archive_players(month, json.dumps(uuids), start, end)
+        after = uuids[-1]
+        await asyncio.sleep(ARCHIVE_BATCH_DELAY)
+
+
+@asynccontextmanager
+async def _attached_archive(month: date) -> AsyncIterator[queryStats.InstrumentedCursor]:
+    # A transaction on the writer connection with the archive database of a month attached as `archive`.
+    async with _write_lock:
+        cur = await _cursor(_con)
+        await cur.execute("ATTACH DATABASE ? AS archive", (get_archive_path(month),))
+        try:
+            yield cur
+            await _con.commit()
+        except BaseException:
+            await _con.rollback()
+            raise
+        finally:
+            await cur.execute("DETACH DATABASE archive")
+
+
+async def _archive_players(month: date, uuids: str, start: datetime, end: datetime) -> int:
+    # Move the snapshots of some players (a JSON array of uuids) between start and end to the archive of a month.
+    columns = ', '.join(name for name, _ in PLAYER_STATS_COLUMNS)
+    params = {"uuids": uuids, "start": start, "end": end}
+
+    async with _attached_archive(month) as cur:
+        await cur.execute(f"""
+                INSERT OR IGNORE INTO archive.player_tracking ({columns})
+                SELECT {columns} FROM main.player_snapshots
+                WHERE uuid IN (SELECT value FROM json_each(:uuids))
+                AND record_time >= :start
+                AND record_time < :end
+            """, params)
+        archived = cur.rowcount
+        # Heartbeats after the month that are reconstructed from a row of the month become full rows.
+        await cur.execute(f"""
+                INSERT OR IGNORE INTO main.player_tracking ({columns})
+                SELECT {columns} FROM main.player_snapshots AS s
+                WHERE uuid IN (SELECT value FROM json_each(:uuids))
+                AND record_time >= :end
+                AND EXISTS (
+                    SELECT 1 FROM main.player_heartbeats AS h
+                    WHERE h.uuid = s.uuid AND h.record_time = s.record_time
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM main.player_tracking AS t
+                    WHERE t.uuid = s.uuid AND t.record_time >= :end AND t.record_time < s.record_time
+                )
+            """, params)
+        await cur.execute("""
+                DELETE FROM main.player_heartbeats
+                WHERE uuid IN (SELECT value FROM json_each(:uuids))
+                AND (
+                    (record_time >= :start AND record_time < :end)
+                    OR EXISTS (
+                        SELECT 1 FROM main.player_tracking AS t
+                        WHERE t.uuid = player_heartbeats.uuid AND t.record_time = player_heartbeats.record_time
+                    )
+                )
+            """, params)
+        await cur.execute("""
+                DELETE FROM main.player_tracking
+                WHERE uuid IN (SELECT value FROM json_each(:uuids))
+                AND record_time >= :start
+                AND record_time < :end
+            """, params)
+
+    return archived
+
+
+async def archive_old_months() -> int:
+    """
+    Move all player snapshots older than ARCHIVE_AFTER_MONTHS full months to the archive databases.
+
+    :return: The amount of archived snapshots.
+    """
+    if ARCHIVE_AFTER_MONTHS <= 0:
+        return 0
+
+    today = datetime.utcnow().date()
+    cutoff = date(today.year, today.month, 1)
+    for _ in range(ARCHIVE_AFTER_MONTHS):
+        cutoff = date(cutoff.year - (cutoff.month == 1), (cutoff.month - 2) % 12 + 1, 1)
+
+    archived = 0
+    cur = await get_read_cursor()
+    while True:
+        res = await cur.execute("SELECT min(record_time) FROM player_snapshots")
+        oldest = (await res.fetchone())[0]
+        if oldest is None or datetime.fromisoformat(oldest).date() >= cutoff:
+            return archived
+        archived += await archive_month(datetime.fromisoformat(oldest).date().replace(day=1))
 
 
 async def close():
-    global _con
+    global _con, _reader_cycle
     if _con is None:
         raise RuntimeError("call init_database() first")
+    for reader in _readers:
+        await reader.close()
+    _readers.clear()
+    for archive in _archives.values():
+        await archive.close()
+    _archives.clear()
+    _reader_cycle = None
     await _con.close()
     _con = None
@@ -0,0 +1,79 @@
+import json
+import time
+from collections.abc import Iterable
+
+from common.api.wynncraft.v3 import guild as guild_api
+from . import manager, queryCache
+
+# Subquery selecting the members of a guild. Use it as `uuid IN ({MEMBERS_SQL})` with the guild name as parameter
+# instead of binding every member uuid.
+MEMBERS_SQL = "SELECT uuid FROM guild_member_sets WHERE guild = ?"
+# Subquery selecting the uuids of a JSON array, for guilds without a stored member set.
+_UUIDS_SQL = "SELECT value FROM json_each(?)"
+
+# Seconds after which a stored member set that wasn't updated by the guild updater isn't used anymore.
+MAX_AGE = 600
+
+_member_sets: dict[str, frozenset[str]] = {}
+_updated_at: dict[str, float] = {}
+# The guild names the member sets are stored under, by lowercase name.
+_stored_names: dict[str, str] = {}
+
+
+async def set_members(guild_name: str, uuids: Iterable[str]):
+    """
+    Store the members of a guild. Only the difference to the previously stored set is written.
+
+    :param guild_name: The name of the guild.
+    :param uuids: The uuids of all current members.
+    """
+    key = guild_name.lower()
+    members = frozenset(uuid.replace("-", "").lower() for uuid in uuids)
+    prev = _member_sets.get(key)
+
+    if prev != members:
+        async with manager.transaction() as cur:
+            if prev is None:
+                await cur.execute("DELETE FROM guild_member_sets WHERE guild = ?", (guild_name,))
+                added, removed = members, ()
+            else:
+                added, removed = members - prev, prev - members
+            await cur.executemany("DELETE FROM guild_member_sets WHERE guild = ? AND uuid = ?",
+                                  ((guild_name, uuid) for uuid in removed))
+            await cur.executemany("INSERT OR IGNORE INTO guild_member_sets VALUES (?, ?)",
+                                  ((guild_name, uuid) for uuid in added))
+        queryCache.bump(guilds=(guild_name,))
+
+    _member_sets[key] = members
+    _updated_at[key] = time.monotonic()
+    _stored_names[key] = guild_name
+
+
+def guilds_of(uuids: Iterable[str]) -> set[str]:
+    """
+    Get the stored guilds any of the players is a member of.
+
+    :param uuids: The uuids of the players.
+    :return: A set containing the lowercase guild names.
+    """
+    uuids = {uuid.replace("-", "").lower() for uuid in uuids}
+    return {key for key, members in _member_sets.items() if not members.isdisjoint(uuids)}
+
+
+async def load(guild_name: str) -> tuple[str, tuple]:
+    """
+    Get a subquery selecting the members of a guild. The stored member set is used if the guild updater updated it
+    in the last MAX_AGE seconds, otherwise the members are fetched from the API and bound as a single JSON parameter.
+    Nothing is written, storing member sets is left to the guild updater.
+
+    :param guild_name: The name of the guild.
+    :return: A tuple containing the subquery and its parameters. Use it as `uuid IN ({subquery})`.
+    :raises guild_api.UnknownGuildException: If the guild doesn't exist.
+    """
+    key = guild_name.lower()
+    if key in _member_sets and time.monotonic() - _updated_at[key] <= MAX_AGE:
+        return MEMBERS_SQL, (_stored_names[key],)
+
+    guild_stats = await guild_api.stats(name=guild_name)
+    uuids = [uuid.replace("-", "").lower() for uuid in guild_stats.members.all.keys()]
+    return _UUIDS_SQL, (json.dumps(uuids),)
@@ -1,15 +1,145 @@
-from datetime import datetime
-
-from async_lru import alru_cache
-
+import asyncio
+import dataclasses
+import json
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+
+import common.logging
 from common.api.wynncraft.v3 import guild as guild_api
-import common.types.wynncraft
-from common.storage import manager
+from common.storage import manager, memberSetData, queryCache, queryStats
 from common.types.enums import PlayerStatsIdentifier
 from common.types.wynncraft import PlayerStats, WynncraftGuild
 
+# Columns of the player_tracking table in insertion order.
+RECORD_COLUMNS = tuple(name for name, _ in manager.PLAYER_STATS_COLUMNS)
+
+_INSERT_RECORD_SQL = f"""
+    INSERT OR IGNORE INTO player_tracking ({', '.join(RECORD_COLUMNS)})
+    VALUES ({', '.join('?' for _ in RECORD_COLUMNS)})
+"""
+
+_INSERT_HEARTBEAT_SQL = f"""
+    INSERT OR IGNORE INTO player_heartbeats ({', '.join(manager.HEARTBEAT_COLUMNS)})
+    VALUES ({', '.join('?' for _ in manager.HEARTBEAT_COLUMNS)})
+"""
+
+_HEARTBEAT_INDICES = tuple(RECORD_COLUMNS.index(c) for c in manager.HEARTBEAT_COLUMNS)
+_COMPARED_INDICES = tuple(i for i in range(len(RECORD_COLUMNS)) if i not in _HEARTBEAT_INDICES)
+
+# Keeps player_latest at the newest record of each player, even if records arrive out of order.
+_UPSERT_LATEST_SQL = f"""
+    INSERT INTO player_latest ({', '.join(RECORD_COLUMNS)})
+    VALUES ({', '.join('?' for _ in RECORD_COLUMNS)})
+    ON CONFLICT (uuid) DO UPDATE SET
+    {', '.join(f'{c} = excluded.{c}' for c in RECORD_COLUMNS if c != 'uuid')}
+    WHERE excluded.record_time >= player_latest.record_time
+"""
+
+# Folds a record into the first/last values of its day in player_daily. SET expressions see the old row values.
+_UPSERT_DAILY_SQL = f"""
+    INSERT INTO player_daily (
+        uuid, day, first_time, last_time,
+        {', '.join(f'{c}_first' for c in manager.DAILY_STATS)},
+        {', '.join(f'{c}_last' for c in manager.DAILY_STATS)}
+    )
+    VALUES (?, date(?), ?, ?, {', '.join('?' for _ in manager.DAILY_STATS * 2)})
+    ON CONFLICT (uuid, day) DO UPDATE SET
+    first_time = min(first_time, excluded.first_time),
+    last_time = max(last_time, excluded.last_time),
+    {', '.join(f'{c}_first = iif(excluded.first_time < first_time, excluded.{c}_first, {c}_first)'
+               for c in manager.DAILY_STATS)},
+    {', '.join(f'{c}_last = iif(excluded.last_time >= last_time, excluded.{c}_last, {c}_last)'
+               for c in manager.DAILY_STATS)}
+"""
+
+MAX_BUFFERED_RECORDS = 500
+MAX_BUFFER_AGE = 15  # seconds
+# The most records kept while flushes fail. The oldest records are dropped beyond it.
+MAX_BACKLOG = 20 * MAX_BUFFERED_RECORDS
+
+
+@dataclass
+class RecordBufferStats:
+    backlog: int = 0
+    backlog_age: float = 0.0  # seconds since the oldest buffered record was queued
+    flushes: int = 0
+    failed_flushes: int = 0
+    dropped_records: int = 0  # records that couldn't be written on their own or didn't fit in the backlog
+    flushed_records: int = 0
+    flushed_heartbeats: int = 0  # flushed records that only repeated the previous snapshot of the player
+    last_flush_size: int = 0
+    last_flush_latency: float = 0.0  # seconds
+    max_flush_latency: float = 0.0  # seconds
+
+
+_record_buffer: list[tuple] = []
+_buffered_since: float | None = None
+# After a failed flush, the buffer isn't flushed again before this time (monotonic).
+_retry_at = 0.0
+_buffer_stats = RecordBufferStats()
+_flush_lock = asyncio.Lock()
+
+
+
+async def _member_filter(guild: WynncraftGuild | None) -> tuple[str, tuple]:
+    """
+    Build the condition restricting a query to the members of a guild.
+    :param guild: The guild. If None, the condition matches every player.
+    :return: A tuple containing the condition on the uuid column and its parameters.
+    """
+    if guild is None:
+        return "1", ()
+
+    try:
+        members_sql, members_params = await memberSetData.load(guild.name)
+    except guild_api.UnknownGuildException:
+        raise ValueError(f"Guild {guild.name} not found.")
+    return f"uuid IN ({members_sql})", members_params
+
 
-@alru_cache(ttl=600)
+async def _snapshot_cursors(after: datetime = None, before: datetime = None) -> list[queryStats.InstrumentedCursor]:
+    """
+    Get cursors for every database holding player snapshots of a time range: the main database followed by the
+    overlapping monthly archives.
+    """
+    cursors = [await manager.get_read_cursor()]
+    for month in reversed(manager.get_archived_months(after, before)):
+        cursors.append(await manager.get_archive_cursor(month))
+    return cursors
+
+
+async def _latest_snapshots(stat: str, after: datetime, before: datetime, member_filter: str,
+                            member_params: tuple) -> dict[str, tuple[str, any]]:
+    """
+    Get the last snapshot of each player within a time range, searching the archives as well.
+    :param stat: The column to return.
+    :param member_filter: A condition on the uuid column (see _member_filter).
+    :return: A dict mapping the uuids to the record time and the stat of their last snapshot.
+    """
+    latest = {}
+    for cur in await _snapshot_cursors(after, before):
+        res = await cur.execute(f"""
+                    SELECT a.uuid, a.record_time, {stat} as stat FROM
+                    player_snapshots as a
+                    JOIN (
+                        SELECT uuid, max(record_time) as t
+                        FROM player_snapshots
+                        WHERE record_time >= ?
+                        AND record_time <= ?
+                        AND {member_filter}
+                        GROUP BY uuid
+                    ) as b
+                    ON a.uuid = b.uuid AND a.record_time = b.t
+                """, (after, before) + member_params)
+        for row in await res.fetchall():
+            if row['uuid'] not in latest or row['record_time'] > latest[row['uuid']][0]:
+                latest[row['uuid']] = (row['record_time'], row['stat'])
+
+    return latest
+
+
+@queryCache.cached(uuid="uuid")
 async def get_stats(uuid: str, stat: PlayerStatsIdentifier, after: datetime = None, before: datetime = None) -> tuple:
     uuid = uuid.replace("-", "").lower()
     if after is None:
@@ -17,227 +147,192 @@ async def get_stats(uuid: str, stat: PlayerStatsIdentifier, after: datetime = No
     if before is None:
         before = datetime.max
 
-    cur = await manager.get_cursor()
-    res = await cur.execute(f"""
-                SELECT {stat} as stat FROM player_tracking
-                WHERE uuid = ?
-                AND record_time >= ?
-                AND record_time <= ?
-                ORDER BY record_time
-            """, (uuid, after, before))
+    rows = []
+    for cur in await _snapshot_cursors(after, before):
+        res = await cur.execute(f"""
+                    SELECT record_time, {stat} as stat FROM player_snapshots
+                    WHERE uuid = ?
+                    AND record_time >= ?
+                    AND record_time <= ?
+                """, (uuid, after, before))
+        rows += await res.fetchall()
 
-    return tuple(row['stat'] for row in await res.fetchall())
+    return tuple(row['stat'] for row in sorted(rows, key=lambda row: row['record_time']))
 
-@alru_cache(ttl=600)
+@queryCache.cached(guild="guild_name")
 async def get_stats_for_guild(guild_name: str, stat: PlayerStatsIdentifier, after: datetime = None, before: datetime = None) -> dict:
     if after is None:
         after = datetime.min
-    if before is None:
-        before = datetime.max
 
-    uuids = None
     try:
-        guild_stats = await guild_api.stats(name=guild_name)
-        uuids = tuple(uuid.replace("-", "").lower() for uuid in guild_stats.members.all.keys())
+        members_sql, members_params = await memberSetData.load(guild_name)
     except guild_api.UnknownGuildException:
         raise ValueError(f"Guild {guild_name} not found.")
 
-    params = (after, before) +  (uuids if uuids is not None else ())
+    if before is not None:
+        latest = await _latest_snapshots(stat, after, before, f"uuid IN ({members_sql})", members_params)
+        return {uuid: value for uuid, (_, value) in latest.items()}
 
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute(f"""
-                SELECT a.uuid, {stat} as stat FROM
-                player_tracking as a
-                JOIN (
-                    SELECT uuid, max(record_time) as t
-                    FROM player_tracking
-                    WHERE record_time >= ?
-                    AND record_time <= ?
-                    {f"AND uuid IN ({', '.join('?' for _ in uuids)})" if uuids is not None else ""}
-                    GROUP BY uuid
-                ) as b
-                ON a.uuid = b.uuid AND a.record_time = b.t
-            """, params)
+                SELECT uuid, {stat} as stat FROM player_latest
+                WHERE record_time >= ?
+                AND uuid IN ({members_sql})
+            """, (after,) + members_params)
 
     return {row['uuid']: row['stat'] for row in await res.fetchall()}
 
-@alru_cache(ttl=600)
+@queryCache.cached(guild="guild_name")
 async def get_playtimes_for_guild(guild_name: str, after: datetime = None) -> dict:
     if after is None:
         after = datetime.min
 
     try:
-        guild_stats = await guild_api.stats(name=guild_name)
-        uuids = tuple(uuid.replace("-", "").lower() for uuid in guild_stats.members.all.keys())
+        members_sql, members_params = await memberSetData.load(guild_name)
     except guild_api.UnknownGuildException:
         raise ValueError(f"Guild {guild_name} not found.")
 
-    if uuids is None:
-        return {}
-
-    params = uuids + (after, ) + uuids
+    member_filter = f"uuid IN ({members_sql})"
 
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute(f"""
-                SELECT 
-                    a.uuid, 
-                    a.playtime - COALESCE(b.playtime, 0) AS playtime 
-                FROM
-                    (SELECT a1.uuid, a1.playtime
-                     FROM player_tracking as a1
-                     JOIN (
-                         SELECT uuid, MAX(record_time) AS t
-                         FROM player_tracking
-                         WHERE uuid IN {f"({', '.join('?' for _ in uuids)})"}
-                         GROUP BY uuid
-                     ) as a2
-                     ON a1.uuid = a2.uuid AND a1.record_time = a2.t
-                    ) AS a
-                LEFT JOIN 
-                    (SELECT b1.uuid, b1.playtime
-                     FROM player_tracking as b1
-                     INNER JOIN (
-                         SELECT uuid, MAX(record_time) AS t
-                         FROM player_tracking
-                         WHERE record_time <= ?
-                         AND uuid IN {f"({', '.join('?' for _ in uuids)})"}
-                         GROUP BY uuid
-                     ) as b2
-                     ON b1.uuid = b2.uuid AND b1.record_time = b2.t
-                    ) AS b
-                ON a.uuid = b.uuid;
-            """, params)
-
-    return {row['uuid']: row['playtime'] for row in await res.fetchall()}
-
-
-@alru_cache(ttl=600)
+                SELECT uuid, playtime
+                FROM player_latest
+                WHERE {member_filter}
+            """, members_params)
+    playtimes = {row['uuid']: row['playtime'] for row in await res.fetchall()}
+
+    previous = await _latest_snapshots(PlayerStatsIdentifier.PLAYTIME, datetime.min, after, member_filter, members_params)
+
+    return {uuid: playtime - (previous.get(uuid, (None, None))[1] or 0) for uuid, playtime in playtimes.items()}
+
+
+@queryCache.cached(guild="guild", stat="stat")
 async def get_leaderboard(stat: PlayerStatsIdentifier, guild: WynncraftGuild = None, after: datetime = None,
                           before: datetime = None) -> dict[str, tuple]:
     if after is None:
         after = datetime.min
-    if before is None:
-        before = datetime.max
 
-    uuids = None
-    if guild is not None:
-        try:
-            guild_stats: common.types.wynncraft.GuildStats = await guild_api.stats(
-                name=guild.name)
-            uuids = tuple(uuid.replace("-", "").lower() for uuid in guild_stats.members.all.keys())
-        except guild_api.UnknownGuildException:
-            raise ValueError(f"Guild {guild.name} not found.")
+    member_filter, member_params = await _member_filter(guild)
 
-    params = (after, before) + (uuids if uuids is not None else ())
+    if before is not None:
+        latest = await _latest_snapshots(stat, after, before, member_filter, member_params)
+        top = sorted(((uuid, value) for uuid, (_, value) in latest.items() if value is not None),
+                     key=lambda t: t[1], reverse=True)[:100]
+        return dict(top)
 
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute(f"""
-                SELECT a.uuid, {stat} as stat FROM
-                player_tracking as a
-                JOIN (SELECT uuid, max(record_time) as t
-                    FROM player_tracking
-                    WHERE record_time >= ?
-                    AND record_time <= ?
-                    {f"AND uuid IN ({', '.join('?' for _ in uuids)})" if uuids is not None else ""}
-                    GROUP BY uuid) as b
-                ON a.uuid = b.uuid AND a.record_time = b.t
+                SELECT uuid, {stat} as stat FROM player_latest
+                WHERE record_time >= ?
+                AND {member_filter}
                 ORDER BY stat DESC
                 LIMIT 100;
-            """, params)
+            """, (after,) + member_params)
 
     return {row['uuid']: row['stat'] for row in await res.fetchall()}
 
 
-@alru_cache(ttl=600)
+@queryCache.cached(guild="guild", columns=(PlayerStatsIdentifier.WARS,))
 async def get_warcount(guild: WynncraftGuild = None) -> list[
     tuple[int, str, int]]:
     """
-    Get the warcount leaderboard.
+    Get the warcount leaderboard. Snapshots can be archived or thinned out, so the counts are taken from the newest
+    snapshot of each player.
     :param guild: The guild to get the warcount leaderboard for. If None, the global leaderboard is returned.
     :return: A list of tuples containing the rank, uuid and warcount of the players.
     """
-    uuids = None
-    if guild is not None:
-        try:
-            guild_stats = await guild_api.stats(name=guild.name)
-            uuids = tuple(uuid.replace("-", "").lower() for uuid in guild_stats.members.all.keys())
-        except guild_api.UnknownGuildException:
-            raise ValueError(f"Guild {guild.name} not found.")
+    member_filter, member_params = await _member_filter(guild)
 
-    params = (uuids if uuids is not None else ())
-
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute(f"""
                 SELECT row_number() over () as rank, uuid, wars
                 FROM (
-                    SELECT uuid, max(wars) as wars
-                    FROM player_tracking
-                    INDEXED BY wars_idx
+                    SELECT uuid, wars
+                    FROM player_latest
                     WHERE wars > 0
-                    {f"AND uuid IN ({', '.join('?' for _ in uuids)})" if uuids is not None else ""}
-                    GROUP BY uuid
+                    AND {member_filter}
                     ORDER BY wars DESC
                 )
-            """, params)
+            """, member_params)
 
     return [(row['rank'], row['uuid'], row['wars']) for row in await res.fetchall()]
 
 
-@alru_cache(ttl=600)
+@queryCache.cached(guild="guild", columns=(PlayerStatsIdentifier.WARS,), days=True)
 async def get_warcount_relative(t_from: datetime, t_to: datetime, guild: WynncraftGuild = None) -> list[
     tuple[int, str, int]]:
     """
-    Get the realtive warcount leaderboard between two dates.
+    Get the realtive warcount leaderboard between two dates. Computed from the daily rollups, so the range covers
+    whole UTC days: from the start of the day of t_from to the end of the day of t_to. A range of the last 7 days
+    therefore covers 8 days.
     :param t_from: The start of the time range to get the leaderboard for.
     :param t_to: The end of the time range to get the leaderboard for.
     :param guild: The guild to get the warcount leaderboard for. If None, the global leaderboard is returned.
     :return: A list of tuples containing the rank, uuid and warcount of the players.
     """
-    uuids = None
-    if guild is not None:
-        try:
-            guild_stats = await guild_api.stats(name=guild.name)
-            uuids = tuple(uuid.replace("-", "").lower() for uuid in guild_stats.members.all.keys())
-        except guild_api.UnknownGuildException:
-            raise ValueError(f"Guild {guild.name} not found.")
+    return await get_gain_leaderboard(PlayerStatsIdentifier.WARS, t_from, t_to, guild=guild, limit=1000)
 
-    params = (t_from, t_to) + (uuids if uuids is not None else ())
-    params = params + params
 
-    cur = await manager.get_cursor()
-    res = await cur.execute(f"""
-                SELECT row_number() over () as rank, uuid, wars FROM (
-                    SELECT a.uuid as uuid, wars_max - wars_min as wars
-                    FROM (
-                        SELECT uuid, max(wars) as wars_max
-                        FROM player_tracking
-                        INDEXED BY wars_idx
-                        WHERE wars > 0
-                        AND record_time >= ?
-                        AND record_time <= ?
-                        {f"AND uuid IN ({', '.join('?' for _ in uuids)})" if uuids is not None else ""}
-                        GROUP BY uuid
-                    ) as a
-                    JOIN (
-                        SELECT uuid, min(wars) as wars_min
-                        FROM player_tracking
-                        INDEXED BY wars_idx
-                        WHERE wars > 0
-                        AND record_time >= ?
-                        AND record_time <= ?
-                        {f"AND uuid IN ({', '.join('?' for _ in uuids)})" if uuids is not None else ""}
-                        GROUP BY uuid
-                    ) as b
-                    ON a.uuid = b.uuid AND a.wars_max > b.wars_min
-                    ORDER BY wars DESC
-                    LIMIT 1000
-                )
-            """, params)
-
-    return [(row['rank'], row['uuid'], row['wars']) for row in await res.fetchall()]
-
-
-@alru_cache(ttl=600)
+@queryCache.cached(guild="guild", stat="stat", days=True)
+async def get_gain_leaderboard(stat: PlayerStatsIdentifier, t_from: datetime = None, t_to: datetime = None,
+                               guild: WynncraftGuild = None, limit: int = 100) -> list[tuple[int, str, int | float]]:
+    """
+    Rank players by how much a cumulative stat (wars, playtime, dungeons, ...) increased between two dates.
+    The increase is the last value inside the range minus the first one, taken from the daily rollups. The range
+    therefore covers whole UTC days: from the start of the day of t_from to the end of the day of t_to, so a range
+    of the last 7 days covers 8 days.
+    If t_from is None the players are ranked by the absolute value of the stat at t_to instead.
+    :param stat: The stat to rank the players by.
+    :param t_from: The start of the time range. If None, absolute values are ranked.
+    :param t_to: The end of the time range. If None, the range is open-ended.
+    :param guild: The guild to get the leaderboard for. If None, the global leaderboard is returned.
+    :param limit: The maximum amount of players to return.
+    :return: A list of tuples containing the rank, uuid and value of the players, sorted by rank.
+    """
+    member_filter, member_params = await _member_filter(guild)
+
+    # ORDER BY ... LIMIT lets SQLite keep only the top `limit` rows in a bounded sorter instead of sorting everything.
+    cur = await manager.get_read_cursor()
+    if t_from is None and t_to is None:
+        res = await cur.execute(f"""
+                    SELECT row_number() over () as rank, uuid, value FROM (
+                        SELECT uuid, {stat} as value
+                        FROM player_latest
+                        WHERE {stat} > 0
+                        AND {member_filter}
+                        ORDER BY value DESC
+                        LIMIT ?
+                    )
+                """, member_params + (limit,))
+    else:
+        # Only the players with daily rollups in the range are read, found through the index on day. Their first and
+        # last day are then looked up with a primary key seek each.
+        day_from = date.min if t_from is None else t_from.date()
+        day_to = date.max if t_to is None else t_to.date()
+        start_value = "0" if t_from is None else f"f.{stat}_first"
+        res = await cur.execute(f"""
+                    SELECT row_number() over () as rank, uuid, value FROM (
+                        SELECT r.uuid, l.{stat}_last - {start_value} as value
+                        FROM (
+                            SELECT uuid, min(day) as first_day, max(day) as last_day
+                            FROM player_daily
+                            WHERE day >= ? AND day <= ?
+                            AND {member_filter}
+                            GROUP BY uuid
+                        ) as r
+                        JOIN player_daily as f ON f.uuid = r.uuid AND f.day = r.first_day
+                        JOIN player_daily as l ON l.uuid = r.uuid AND l.day = r.last_day
+                        WHERE value > 0
+                        ORDER BY value DESC
+                        LIMIT ?
+                    )
+                """, (day_from, day_to) + member_params + (limit,))
+
+    return [(row['rank'], row['uuid'], row['value']) for row in await res.fetchall()]
+
+
+@queryCache.cached(uuid="uuid")
 async def get_history(stat: PlayerStatsIdentifier, uuid: str) -> list[tuple[str, any, str]]:
     """
     Get the history of a specific stat for a player.
@@ -247,119 +342,378 @@ async def get_history(stat: PlayerStatsIdentifier, uuid: str) -> list[tuple[str,
     """
     uuid = uuid.replace("-", "").lower()
 
-    cur = await manager.get_cursor()
+    rows = []
+    for cur in await _snapshot_cursors():
+        res = await cur.execute(f"""
+                    SELECT record_time, {stat} as stat, last_join FROM player_snapshots
+                    WHERE uuid = ?
+                """, (uuid,))
+        rows += await res.fetchall()
+
+    return sorted(((row['record_time'], row['stat'], row['last_join']) for row in rows), key=lambda row: row[0])
+
+
+@queryCache.cached(uuid="uuid")
+async def get_daily_history(stat: PlayerStatsIdentifier, uuid: str, after: datetime = None,
+                            before: datetime = None) -> list[tuple[str, any, any]]:
+    """
+    Get the daily rollup of a specific stat for a player.
+    :param stat: The stat to get the history of.
+    :param uuid: The uuid of the player to get the history for.
+    :param after: If set, only days on or after this date are returned.
+    :param before: If set, only days on or before this date are returned.
+    :return: A list of tuples containing the day, the first and the last value of the stat on that day.
+    """
+    uuid = uuid.replace("-", "").lower()
+    if after is None:
+        after = datetime.min
+    if before is None:
+        before = datetime.max
+
+    cur = await manager.get_read_cursor()
     res = await cur.execute(f"""
-                SELECT record_time, {stat} as stat, last_join FROM player_tracking
+                SELECT day, {stat}_first as first, {stat}_last as last FROM player_daily
                 WHERE uuid = ?
-                ORDER BY record_time
-            """, (uuid,))
+                AND day >= ?
+                AND day <= ?
+                ORDER BY day
+            """, (uuid, after.date(), before.date()))
+
+    return [(row['day'], row['first'], row['last']) for row in await res.fetchall()]
 
-    return [(row['record_time'], row['stat'], row['last_join']) for row in await res.fetchall()]
+
+def _record_row(stats: PlayerStats, record_time: datetime) -> tuple:
+    has_dungeons = stats.globalData.dungeons is not None
+    has_raids = stats.globalData.raids is not None
+
+    return (
+        record_time,
+        stats.uuid.replace("-", "").lower(),
+        stats.username,
+        stats.rank,
+        stats.supportRank,
+        stats.firstJoin,
+        stats.lastJoin,
+        stats.playtime,
+        stats.guild.uuid if stats.guild is not None else None,
+        stats.guild.name if stats.guild is not None else None,
+        stats.guild.rank if stats.guild is not None else None,
+        stats.globalData.wars,
+        stats.globalData.totalLevel,
+        stats.globalData.killedMobs,
+        stats.globalData.chestsFound,
+        stats.globalData.dungeons.total if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Decrepit Sewers', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Infested Pit', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Lost Sanctuary', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Underworld Crypt', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Sand-Swept Tomb', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Ice Barrows', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Galleon\'s Graveyard', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Undergrowth Ruins', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Corrupted Decrepit Sewers', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Corrupted Infested Pit', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Corrupted Lost Sanctuary', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Corrupted Sand-Swept Tomb', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Corrupted Underworld Crypt', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Corrupted Galleon\'s Graveyard',
+                                           0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Corrupted Undergrowth Ruins', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Corrupted Ice Barrows', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Fallen Factory', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Eldritch Outlook', 0) if has_dungeons else 0,
+        stats.globalData.dungeons.list.get('Timelost Sanctum', 0) if has_dungeons else 0,
+        stats.globalData.raids.total if has_raids else 0,
+        stats.globalData.raids.list.get('Nest of the Grootslangs', 0) if has_raids else 0,
+        stats.globalData.raids.list.get('Orphion\'s Nexus of Light', 0) if has_raids else 0,
+        stats.globalData.raids.list.get('The Canyon Colossus', 0) if has_raids else 0,
+        stats.globalData.raids.list.get('The Nameless Anomaly', 0) if has_raids else 0,
+        stats.globalData.completedQuests,
+        stats.globalData.pvp.kills,
+        stats.globalData.pvp.deaths
+    )
+
+
+def _daily_row(row: tuple) -> tuple:
+    record_time, uuid, *values = row
+    return (uuid, record_time, record_time, record_time, *values, *values)
+
+
+async def _split_heartbeats(cur, batch: list[tuple]) -> tuple[list[tuple], list[tuple], set[str]]:
+    """
+    Separate the records that only differ from the previous snapshot of the player in the heartbeat columns.
+    :return: A tuple containing the records to store in full, the heartbeat rows of the other records and the stat
+     columns that changed for any player.
+    """
+    uuids = list({row[1] for row in batch})
+    res = await cur.execute(f"""
+                SELECT {', '.join(RECORD_COLUMNS)} FROM player_latest
+                WHERE uuid IN (SELECT value FROM json_each(?))
+            """, (json.dumps(uuids),))
+    prev_rows = {row['uuid']: (datetime.fromisoformat(row['record_time']), tuple(row))
+                 for row in await res.fetchall()}
+
+    records = []
+    heartbeats = []
+    changed = {"record_time"}
+    for row in sorted(batch, key=lambda r: r[0]):
+        prev_time, prev_row = prev_rows.get(row[1], (None, None))
+        if prev_row is None or row[0] <= prev_time:
+            # a new player or a change of the history
+            changed.update(RECORD_COLUMNS[2:])
+        else:
+            changed.update(RECORD_COLUMNS[i] for i in range(2, len(RECORD_COLUMNS)) if row[i] != prev_row[i])
+
+        if prev_time is not None and row[0] <= prev_time:
+            # Stored heartbeats after this record would be reconstructed from it, so store them in full first.
+            await _materialize_heartbeats(cur, row[1], row[0])
+            records.append(row)
+        elif prev_row is not None and all(row[i] == prev_row[i] for i in _COMPARED_INDICES):
+            heartbeats.append(tuple(row[i] for i in _HEARTBEAT_INDICES))
+            prev_rows[row[1]] = (row[0], row)
+        else:
+            records.append(row)
+            prev_rows[row[1]] = (row[0], row)
+
+    return records, heartbeats, changed
+
+
+async def _materialize_heartbeats(cur, uuid: str, after: datetime):
+    """
+    Replace the heartbeats of a player after a point in time with full player_tracking rows.
+    """
+    await cur.execute(f"""
+                INSERT OR IGNORE INTO player_tracking ({', '.join(RECORD_COLUMNS)})
+                SELECT {', '.join(RECORD_COLUMNS)} FROM player_snapshots
+                WHERE uuid = ?
+                AND record_time > ?
+            """, (uuid, after))
+    await cur.execute("""
+                DELETE FROM player_heartbeats
+                WHERE uuid = ?
+                AND record_time > ?
+            """, (uuid, after))
 
 
 async def add_record(stats: PlayerStats, record_time: datetime = None):
+    """
+    Queue a player snapshot for insertion. Records are buffered in memory and written in a single transaction once
+    either MAX_BUFFERED_RECORDS records are queued or the oldest queued record is older than MAX_BUFFER_AGE seconds
+    (see :func:`flush_due_records`).
+    """
     if record_time is None:
         record_time = datetime.utcnow()
 
-    has_dungeons = stats.globalData.dungeons is not None
-    has_raids = stats.globalData.raids is not None
+    global _buffered_since
+    if len(_record_buffer) == 0:
+        _buffered_since = time.monotonic()
+    _record_buffer.append(_record_row(stats, record_time))
+
+    if len(_record_buffer) >= MAX_BUFFERED_RECORDS and time.monotonic() >= _retry_at:
+        await flush_records()
+
+
+async def _write_batch(batch: list[tuple]) -> tuple[int, set[str]]:
+    """
+    Write records in a single transaction.
+    :return: The amount of records stored as heartbeats and the stat columns that changed.
+    """
+    async with manager.transaction() as cur:
+        records, heartbeats, changed = await _split_heartbeats(cur, batch)
+        await cur.executemany(_INSERT_RECORD_SQL, records)
+        await cur.executemany(_INSERT_HEARTBEAT_SQL, heartbeats)
+        await cur.executemany(_UPSERT_LATEST_SQL, batch)
+        await cur.executemany(_UPSERT_DAILY_SQL, (_daily_row(row) for row in batch))
+    return len(heartbeats), changed
+
+
+def _bump_written(rows: list[tuple], changed: set[str]):
+    uuids = {row[1] for row in rows}
+    queryCache.bump(uuids, memberSetData.guilds_of(uuids) | {row[9] for row in rows if row[9] is not None}, changed)
+
+
+def _requeue(rows: list[tuple]):
+    """
+    Put records back in front of the buffer, dropping the oldest ones beyond MAX_BACKLOG.
+    """
+    global _record_buffer, _buffered_since
+    if len(_record_buffer) == 0:
+        _buffered_since = time.monotonic()
+    _record_buffer = rows + _record_buffer
+
+    dropped = len(_record_buffer) - MAX_BACKLOG
+    if dropped > 0:
+        _record_buffer = _record_buffer[dropped:]
+        _buffer_stats.dropped_records += dropped
+        common.logging.error(f"Dropped the {dropped} oldest buffered player records, the backlog is full.")
 
-    con = manager.get_connection()
-    cur = await manager.get_cursor()
-    await cur.execute(
-        """
-            INSERT INTO player_tracking (
-                record_time,
-                uuid,
-                username,
-                rank,
-                support_rank, 
-                first_join, 
-                last_join, 
-                playtime, 
-                guild_uuid,
-                guild_name, 
-                guild_rank, 
-                wars, 
-                total_levels, 
-                killed_mobs, 
-                chests_found, 
-                dungeons_total, 
-                dungeons_ds, 
-                dungeons_ip, 
-                dungeons_ls, 
-                dungeons_uc, 
-                dungeons_ss, 
-                dungeons_ib, 
-                dungeons_gg,
-                dungeons_ur, 
-                dungeons_cds, 
-                dungeons_cip, 
-                dungeons_cls, 
-                dungeons_css, 
-                dungeons_cuc, 
-                dungeons_cgg, 
-                dungeons_cur, 
-                dungeons_cib, 
-                dungeons_ff, 
-                dungeons_eo, 
-                dungeons_ts, 
-                raids_total, 
-                raids_notg, 
-                raids_nol, 
-                raids_tcc, 
-                raids_tna, 
-                completed_quests, 
-                pvp_kills, 
-                pvp_deaths
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            record_time,
-            stats.uuid.replace("-", "").lower(),
-            stats.username,
-            stats.rank,
-            stats.supportRank,
-            stats.firstJoin,
-            stats.lastJoin,
-            stats.playtime,
-            stats.guild.uuid if stats.guild is not None else None,
-            stats.guild.name if stats.guild is not None else None,
-            stats.guild.rank if stats.guild is not None else None,
-            stats.globalData.wars,
-            stats.globalData.totalLevel,
-            stats.globalData.killedMobs,
-            stats.globalData.chestsFound,
-            stats.globalData.dungeons.total if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Decrepit Sewers', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Infested Pit', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Lost Sanctuary', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Underworld Crypt', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Sand-Swept Tomb', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Ice Barrows', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Galleon\'s Graveyard', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Undergrowth Ruins', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Corrupted Decrepit Sewers', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Corrupted Infested Pit', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Corrupted Lost Sanctuary', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Corrupted Sand-Swept Tomb', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Corrupted Underworld Crypt', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Corrupted Galleon\'s Graveyard',
-                                               0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Corrupted Undergrowth Ruins', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Corrupted Ice Barrows', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Fallen Factory', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Eldritch Outlook', 0) if has_dungeons else 0,
-            stats.globalData.dungeons.list.get('Timelost Sanctum', 0) if has_dungeons else 0,
-            stats.globalData.raids.total if has_raids else 0,
-            stats.globalData.raids.list.get('Nest of the Grootslangs', 0) if has_raids else 0,
-            stats.globalData.raids.list.get('Orphion\'s Nexus of Light', 0) if has_raids else 0,
-            stats.globalData.raids.list.get('The Canyon Colossus', 0) if has_raids else 0,
-            stats.globalData.raids.list.get('The Nameless Anomaly', 0) if has_raids else 0,
-            stats.globalData.completedQuests,
-            stats.globalData.pvp.kills,
-            stats.globalData.pvp.deaths
-        ))
-
-    await con.commit()
+
+async def flush_records():
+    """
+    Write all buffered records to the database in a single transaction.
+    If the transaction fails, the records are retried one at a time and the ones that fail on their own are dropped.
+    If none of them can be written or the flush is cancelled, the records are put back into the buffer and the
+    exception is re-raised. Flushes triggered by add_record() or flush_due_records() then wait MAX_BUFFER_AGE seconds.
+    """
+    async with _flush_lock:
+        global _record_buffer, _buffered_since, _retry_at
+        if len(_record_buffer) == 0:
+            return
+
+        batch = _record_buffer
+        _record_buffer = []
+        _buffered_since = None
+
+        t = time.perf_counter()
+        try:
+            heartbeats, changed = await _write_batch(batch)
+        except Exception as ex:
+            _buffer_stats.failed_flushes += 1
+            common.logging.error(f"Failed to flush {len(batch)} player records, retrying them one at a time.",
+                                 exc_info=ex)
+            heartbeats, changed = 0, set()
+            written = []
+            failed = []
+            for i, row in enumerate(batch):
+                try:
+                    row_heartbeats, row_changed = await _write_batch([row])
+                except Exception as row_ex:
+                    failed.append((row, row_ex))
+                    continue
+                except BaseException:
+                    _bump_written(written, changed)
+                    _requeue([r for r, _ in failed] + batch[i:])
+                    raise
+                written.append(row)
+                heartbeats += row_heartbeats
+                changed |= row_changed
+
+            if len(written) == 0:
+                # Not a bad record, the database itself fails.
+                _requeue(batch)
+                _retry_at = time.monotonic() + MAX_BUFFER_AGE
+                raise ex
+
+            for row, row_ex in failed:
+                common.logging.error(f"Dropped the player record of {row[1]} at {row[0]}.", exc_info=row_ex)
+            _buffer_stats.dropped_records += len(failed)
+            batch = written
+        except BaseException:
+            # Cancellation, so a flush interrupted by a shutdown doesn't lose the batch.
+            _requeue(batch)
+            _buffer_stats.failed_flushes += 1
+            raise
+        t = time.perf_counter() - t
+
+        _bump_written(batch, changed)
+
+        _buffer_stats.flushes += 1
+        _buffer_stats.flushed_records += len(batch)
+        _buffer_stats.flushed_heartbeats += heartbeats
+        _buffer_stats.last_flush_size = len(batch)
+        _buffer_stats.last_flush_latency = t
+        _buffer_stats.max_flush_latency = max(_buffer_stats.max_flush_latency, t)
+
+
+async def flush_due_records():
+    """
+    Flush the record buffer if the oldest buffered record is older than MAX_BUFFER_AGE seconds.
+    """
+    now = time.monotonic()
+    if _buffered_since is not None and now - _buffered_since >= MAX_BUFFER_AGE and now >= _retry_at:
+        await flush_records()
+
+
+def get_buffer_stats() -> RecordBufferStats:
+    """
+    Get the counters of the record write buffer.
+    :return: A copy of the current buffer statistics.
+    """
+    return dataclasses.replace(
+        _buffer_stats,
+        backlog=len(_record_buffer),
+        backlog_age=0.0 if _buffered_since is None else time.monotonic() - _buffered_since
+    )
+
+
+async def get_tracked_uuids(after: str = "", limit: int = 100) -> list[str]:
+    """
+    Get the uuids of tracked players in ascending order. Used to walk over all players in batches.
+    :param after: Only uuids greater than this are returned.
+    :param limit: The maximum amount of uuids to return.
+    :return: A list of uuids.
+    """
+    cur = await manager.get_read_cursor()
+    res = await cur.execute("""
+                SELECT uuid FROM player_latest
+                WHERE uuid > ?
+                ORDER BY uuid
+                LIMIT ?
+            """, (after, limit))
+
+    return [row['uuid'] for row in await res.fetchall()]
+
+
+async def downsample_snapshots(uuids: list[str], full_before: datetime, daily_before: datetime) -> tuple[int, int]:
+    """
+    Thin out old snapshots of some players in a single transaction. Snapshots before full_before are reduced to the
+    last one of each day and snapshots before daily_before to the last one of each week.
+    The daily rollups and player_latest are not affected.
+    :param uuids: The uuids of the players.
+    :param full_before: Snapshots after this are kept at full resolution.
+    :param daily_before: Snapshots before this are reduced to one per week.
+    :return: A tuple containing the amount of deleted snapshots and the amount of freed database pages.
+    """
+    params = {
+        "uuids": json.dumps([uuid.replace("-", "").lower() for uuid in uuids]),
+        "full_before": full_before,
+        "daily_before": daily_before,
+    }
+
+    async with manager.transaction() as cur:
+        res = await cur.execute("PRAGMA freelist_count")
+        free_pages = (await res.fetchone())[0]
+
+        # Kept heartbeats become full rows, as the row they are reconstructed from might get deleted.
+        await cur.execute(f"""
+                    INSERT OR IGNORE INTO player_tracking ({', '.join(RECORD_COLUMNS)})
+                    SELECT {', '.join(RECORD_COLUMNS)} FROM (
+                        SELECT *, row_number() OVER (
+                            PARTITION BY uuid, {manager.RETENTION_PERIOD_SQL} ORDER BY record_time DESC
+                        ) AS rn
+                        FROM player_snapshots
+                        WHERE uuid IN (SELECT value FROM json_each(:uuids))
+                        AND record_time < :full_before
+                    )
+                    WHERE rn = 1
+                """, params)
+        materialized = cur.rowcount
+        await cur.execute("""
+                    DELETE FROM player_heartbeats
+                    WHERE uuid IN (SELECT value FROM json_each(:uuids))
+                    AND record_time < :full_before
+                """, params)
+        heartbeats_deleted = cur.rowcount
+        await cur.execute(f"""
+                    DELETE FROM player_tracking
+                    WHERE (uuid, record_time) IN (
+                        SELECT uuid, record_time FROM (
+                            SELECT uuid, record_time, row_number() OVER (
+                                PARTITION BY uuid, {manager.RETENTION_PERIOD_SQL} ORDER BY record_time DESC
+                            ) AS rn
+                            FROM player_tracking
+                            WHERE uuid IN (SELECT value FROM json_each(:uuids))
+                            AND record_time < :full_before
+                        )
+                        WHERE rn > 1
+                    )
+                """, params)
+        records_deleted = cur.rowcount
+
+        res = await cur.execute("PRAGMA freelist_count")
+        freed_pages = (await res.fetchone())[0] - free_pages
+
+    # the snapshots in ranges of every stat can change
+    queryCache.bump(uuids, memberSetData.guilds_of(uuids), RECORD_COLUMNS[2:])
+
+    return heartbeats_deleted - materialized + records_deleted, freed_pages
@@ -1,6 +1,8 @@
+from collections.abc import Iterable
 from dataclasses import dataclass
 from datetime import date
 
+from common.types.enums import PrivateStat
 from . import manager
 
 
@@ -14,7 +16,7 @@ class Playtime:
 async def get_playtime(uuid: str, day: date) -> Playtime | None:
     uuid = uuid.replace("-", "").lower()
 
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute("""
                 SELECT * FROM playtimes
                 WHERE uuid = ?
@@ -31,7 +33,7 @@ async def get_playtime(uuid: str, day: date) -> Playtime | None:
 async def get_all_playtimes(uuid: str) -> tuple[Playtime]:
     uuid = uuid.replace("-", "").lower()
 
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute("""
                 SELECT * FROM playtimes
                 WHERE uuid = ?
@@ -44,17 +46,56 @@ async def get_all_playtimes(uuid: str) -> tuple[Playtime]:
 async def set_playtime(uuid: str, day: date, playtime: int):
     uuid = uuid.replace("-", "").lower()
 
-    con = manager.get_connection()
-    cur = await manager.get_cursor()
-    await cur.execute("""
-            REPLACE INTO playtimes VALUES (?, ?, ?)
-        """, (uuid, day, playtime))
+    async with manager.transaction() as cur:
+        await cur.execute("""
+                REPLACE INTO playtimes VALUES (?, ?, ?)
+            """, (uuid, day, playtime))
+
+
+async def set_guild_playtimes(guild_name: str, day: date, playtimes: dict[str, int],
+                              private_members: dict[PrivateStat, Iterable[str]] = None):
+    """
+    Store the playtimes of a guild's members and the members that hide some of their stats in a single transaction.
+    The stored private members of the guild are replaced.
+
+    :param guild_name: The name of the guild.
+    :param day: The day of the playtimes.
+    :param playtimes: A dict mapping the uuids of the members to their playtime.
+    :param private_members: The uuids of the members that hide each stat. If None, the stored ones are kept.
+    """
+    async with manager.transaction() as cur:
+        await cur.executemany("""
+                REPLACE INTO playtimes VALUES (?, ?, ?)
+            """, ((uuid.replace("-", "").lower(), day, playtime) for uuid, playtime in playtimes.items()))
+        if private_members is None:
+            return
+        await cur.execute("DELETE FROM private_members WHERE guild = ?", (guild_name,))
+        await cur.executemany("""
+                INSERT OR IGNORE INTO private_members VALUES (?, ?, ?)
+            """, ((guild_name, stat, uuid.replace("-", "").lower())
+                  for stat, uuids in private_members.items() for uuid in uuids))
+
+
+async def get_private_members(stat: PrivateStat) -> dict[str, set[str]]:
+    """
+    Get the members that hide a stat, as stored by the last playtime run of each guild.
+
+    :return: A dict mapping the guild names to the uuids of their members that hide the stat.
+    """
+    cur = await manager.get_read_cursor()
+    res = await cur.execute("""
+                SELECT guild, uuid FROM private_members
+                WHERE stat = ?
+            """, (stat,))
 
-    await con.commit()
+    members = {}
+    for row in await res.fetchall():
+        members.setdefault(row["guild"], set()).add(row["uuid"])
+    return members
 
 
 async def get_first_date_after(date_before: date) -> date | None:
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute("""
                     SELECT min(day) FROM playtimes
                     WHERE day >= ?
@@ -71,7 +112,7 @@ async def get_first_date_after(date_before: date) -> date | None:
 async def get_first_date_after_from_uuid(date_before: date, uuid: str) -> date | None:
     uuid = uuid.replace("-", "").lower()
 
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute("""
                     SELECT min(day) FROM playtimes
                     WHERE uuid = ?
@@ -0,0 +1,179 @@
+import asyncio
+import functools
+import inspect
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+# Width of the buckets time arguments are widened to, so that calls relative to the current time share cache entries.
+TIME_BUCKET = timedelta(minutes=5)
+
+# Arguments holding the start and the end of a time range. Starts are rounded down and ends up, so ranges relative to
+# the current time share entries. A range can therefore include up to one TIME_BUCKET more data on each side.
+_RANGE_STARTS = ("after", "t_from")
+_RANGE_ENDS = ("before", "t_to")
+
+# Data versions. Every write bumps the versions of the players and guilds it affects and of the stats it changes.
+_uuid_versions: dict[str, int] = {}
+_guild_versions: dict[str, int] = {}
+_stat_versions: dict[str, int] = {}
+
+
+@dataclass
+class CacheInfo:
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0  # misses caused by a changed data version or an expired entry
+    maxsize: int = 0
+    currsize: int = 0
+
+
+def _floor(t: datetime, width: timedelta = TIME_BUCKET) -> datetime:
+    return t - (t - datetime.min) % width
+
+
+def _ceil(t: datetime) -> datetime:
+    floor = _floor(t)
+    if floor == t:
+        return t
+    try:
+        return floor + TIME_BUCKET
+    except OverflowError:
+        return t
+
+
+def _guild_key(guild) -> str | None:
+    if guild is None:
+        return None
+    return (guild if isinstance(guild, str) else guild.name).lower()
+
+
+def _version(uuid: str | None, guild, stats: tuple[str, ...]) -> int | tuple[int, ...] | None:
+    if uuid is not None:
+        return _uuid_versions.get(uuid.replace("-", "").lower(), 0)
+    guild = _guild_key(guild)
+    if guild is not None:
+        return _guild_versions.get(guild, 0)
+    if len(stats) > 0:
+        return tuple(_stat_versions.get(stat, 0) for stat in stats)
+    return None
+
+
+def bump(uuids: Iterable[str] = (), guilds: Iterable[str] = (), stats: Iterable[str] = ()):
+    """
+    Invalidate the cached results that depend on the data of some players or guilds, or on some stats of any player.
+
+    :param uuids: The uuids of the players whose data changed.
+    :param guilds: The names of the guilds whose data or members changed.
+    :param stats: The stat columns whose values changed for any player.
+    """
+    for uuid in uuids:
+        uuid = uuid.replace("-", "").lower()
+        _uuid_versions[uuid] = _uuid_versions.get(uuid, 0) + 1
+    for guild in guilds:
+        guild = guild.lower()
+        _guild_versions[guild] = _guild_versions.get(guild, 0) + 1
+    for stat in stats:
+        stat = str(stat)
+        _stat_versions[stat] = _stat_versions.get(stat, 0) + 1
+
+
+def cached(*, uuid: str = None, guild: str = None, stat: str = None, columns: tuple[str, ...] = (), days: bool = False,
+           maxsize: int = 128, ttl: float = 600):
+    """
+    Cache the results of an async query function.
+
+    Entries are invalidated as soon as the data they depend on changes (see :func:`bump`). A function scoped by `uuid`
+    depends on the data of the player passed in that argument, one scoped by `guild` on the data of the guild passed in
+    that argument. Results of calls without a player or guild depend on the stat passed in the `stat` argument and on
+    `columns` for every player, and are invalidated whenever a write changes one of them. Calls with `after` depend on
+    the record times as well. Unscoped results without stats are only refreshed after `ttl` seconds.
+    The starts of time ranges (after, t_from) are rounded down and their ends (before, t_to) up to whole TIME_BUCKETs
+    before the call, so the results can include up to TIME_BUCKET more data on each side.
+    Concurrent calls with the same arguments share one query, which keeps running if the caller that started it is
+    cancelled.
+
+    :param uuid: The name of the argument holding the uuid the result depends on.
+    :param guild: The name of the argument holding the guild (name or WynncraftGuild) the result depends on.
+    :param days: Set if the function only uses the dates of its time range arguments. Both ends are then rounded down
+     to whole days instead, which doesn't change the result.
+    :param stat: The name of the argument holding the stat an unscoped result depends on.
+    :param columns: The stat columns an unscoped result depends on regardless of its arguments.
+    :param maxsize: The maximum amount of cached results. The least recently used ones are evicted first.
+    :param ttl: Seconds after which a result expires regardless of the data version.
+    """
+
+    def decorator(f):
+        signature = inspect.signature(f)
+        entries: OrderedDict[tuple, tuple[int | tuple[int, ...] | None, float, any]] = OrderedDict()
+        pending: dict[tuple, asyncio.Task] = {}
+        info = CacheInfo(maxsize=maxsize)
+
+        @functools.wraps(f)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = bound.arguments
+            for name in _RANGE_STARTS + _RANGE_ENDS:
+                if not isinstance(arguments.get(name), datetime):
+                    continue
+                if days:
+                    arguments[name] = _floor(arguments[name], timedelta(days=1))
+                elif name in _RANGE_STARTS:
+                    arguments[name] = _floor(arguments[name])
+                else:
+                    arguments[name] = _ceil(arguments[name])
+
+            key = tuple(arguments.values())
+            stats = columns + ((str(arguments[stat]),) if stat is not None else ())
+            if len(stats) > 0 and arguments.get("after") is not None:
+                # every new record can move its player into the range
+                stats += ("record_time",)
+            version = _version(arguments[uuid] if uuid is not None else None,
+                               arguments[guild] if guild is not None else None, stats)
+
+            entry = entries.get(key)
+            if entry is not None:
+                if entry[0] == version and time.monotonic() < entry[1]:
+                    entries.move_to_end(key)
+                    info.hits += 1
+                    return entry[2]
+                del entries[key]
+                info.invalidations += 1
+
+            task = pending.get(key)
+            if task is None:
+                info.misses += 1
+                task = pending[key] = asyncio.ensure_future(run(key, version, bound))
+                # don't warn about an exception never being retrieved if every caller was cancelled
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            else:
+                info.hits += 1
+            return await asyncio.shield(task)
+
+        async def run(key: tuple, version, bound: inspect.BoundArguments):
+            try:
+                result = await f(*bound.args, **bound.kwargs)
+            finally:
+                pending.pop(key, None)
+
+            # A write during the query leaves the entry with the old version, so the next call misses.
+            entries[key] = (version, time.monotonic() + ttl, result)
+            if len(entries) > maxsize:
+                entries.popitem(last=False)
+            return result
+
+        def cache_info() -> CacheInfo:
+            return CacheInfo(info.hits, info.misses, info.invalidations, maxsize, len(entries))
+
+        def cache_clear():
+            entries.clear()
+            info.hits = info.misses = info.invalidations = 0
+
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
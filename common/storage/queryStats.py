@@ -0,0 +1,166 @@
+import bisect
+import time
+from dataclasses import dataclass, field
+
+import aiosqlite
+
+import common.logging
+
+# Upper bounds in seconds of the latency histogram buckets. The last bucket counts everything slower.
+HISTOGRAM_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0)
+# Minimum seconds between two query plan captures of the same statement.
+PLAN_CAPTURE_INTERVAL = 600
+
+
+@dataclass
+class QueryStats:
+    sql: str
+    calls: int = 0
+    total_time: float = 0.0  # seconds
+    max_time: float = 0.0  # seconds
+    rows: int = 0
+    slow_calls: int = 0
+    histogram: list[int] = field(default_factory=lambda: [0] * (len(HISTOGRAM_BUCKETS) + 1))
+    last_plan: str | None = None
+
+    @property
+    def avg_time(self) -> float:
+        return self.total_time / self.calls if self.calls > 0 else 0.0
+
+
+# Statements EXPLAIN QUERY PLAN produces a plan for.
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "REPLACE", "UPDATE", "DELETE")
+
+_stats: dict[str, QueryStats] = {}
+_plan_captured_at: dict[str, float] = {}
+
+
+def _normalize(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+def _record(sql: str, elapsed: float, rows: int, slow: bool) -> QueryStats:
+    stats = _stats.get(sql)
+    if stats is None:
+        stats = _stats[sql] = QueryStats(sql)
+    stats.calls += 1
+    stats.total_time += elapsed
+    stats.max_time = max(stats.max_time, elapsed)
+    stats.rows += max(rows, 0)
+    stats.histogram[bisect.bisect_left(HISTOGRAM_BUCKETS, elapsed)] += 1
+    if slow:
+        stats.slow_calls += 1
+    return stats
+
+
+def _format_plan(rows) -> str:
+    depths = {0: -1}
+    lines = []
+    for plan_id, parent, _, detail in rows:
+        depths[plan_id] = depths.get(parent, -1) + 1
+        lines.append(f"{'  ' * depths[plan_id]}{detail}")
+    return "\n".join(lines)
+
+
+def get_stats() -> list[QueryStats]:
+    """
+    Get the collected statistics of all statements.
+
+    :return: A list of statement statistics, sorted by total time spent descending.
+    """
+    return sorted(_stats.values(), key=lambda s: s.total_time, reverse=True)
+
+
+def reset():
+    """
+    Clear all collected statistics.
+    """
+    _stats.clear()
+    _plan_captured_at.clear()
+
+
+class InstrumentedCursor:
+    """
+    Wraps an aiosqlite cursor and records the latency and row count of every statement executed on it.
+    The latency of a query includes fetching its rows. Statements slower than `slow_threshold` seconds are logged
+    together with their query plan.
+    """
+
+    def __init__(self, cursor: aiosqlite.Cursor, connection: aiosqlite.Connection, slow_threshold: float):
+        self._cursor = cursor
+        self._connection = connection
+        self._slow_threshold = slow_threshold
+        self._pending: tuple[str, tuple, float] | None = None
+
+    def __getattr__(self, item):
+        return getattr(self._cursor, item)
+
+    async def execute(self, sql: str, parameters=None) -> "InstrumentedCursor":
+        await self._finish()
+        t = time.perf_counter()
+        await self._cursor.execute(sql, parameters)
+        elapsed = time.perf_counter() - t
+
+        if self._cursor.description is None:
+            await self._complete(sql, parameters, elapsed, self._cursor.rowcount)
+        else:
+            self._pending = (sql, parameters, elapsed)
+        return self
+
+    async def executemany(self, sql: str, parameters) -> "InstrumentedCursor":
+        await self._finish()
+        t = time.perf_counter()
+        await self._cursor.executemany(sql, parameters)
+        await self._complete(sql, None, time.perf_counter() - t, self._cursor.rowcount, explain=False)
+        return self
+
+    async def executescript(self, sql_script: str) -> "InstrumentedCursor":
+        await self._finish()
+        await self._cursor.executescript(sql_script)
+        return self
+
+    async def fetchone(self):
+        t = time.perf_counter()
+        row = await self._cursor.fetchone()
+        await self._finish(time.perf_counter() - t, 0 if row is None else 1)
+        return row
+
+    async def fetchmany(self, size: int = None):
+        t = time.perf_counter()
+        rows = await self._cursor.fetchmany(size)
+        await self._finish(time.perf_counter() - t, len(rows))
+        return rows
+
+    async def fetchall(self):
+        t = time.perf_counter()
+        rows = await self._cursor.fetchall()
+        await self._finish(time.perf_counter() - t, len(rows))
+        return rows
+
+    async def _finish(self, fetch_time: float = 0.0, rows: int = 0):
+        if self._pending is None:
+            return
+        sql, parameters, elapsed = self._pending
+        self._pending = None
+        await self._complete(sql, parameters, elapsed + fetch_time, rows)
+
+    async def _complete(self, sql: str, parameters, elapsed: float, rows: int, explain: bool = True):
+        key = _normalize(sql)
+        slow = elapsed >= self._slow_threshold
+        stats = _record(key, elapsed, rows, slow)
+        if not slow:
+            return
+
+        plan = None
+        now = time.monotonic()
+        explain = explain and key.split(" ", 1)[0].upper() in _EXPLAINABLE
+        if explain and now - _plan_captured_at.get(key, -PLAN_CAPTURE_INTERVAL) >= PLAN_CAPTURE_INTERVAL:
+            _plan_captured_at[key] = now
+            try:
+                res = await self._connection.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ())
+                plan = stats.last_plan = _format_plan(await res.fetchall())
+            except Exception as e:
+                common.logging.debug(f"Failed to capture query plan: {e}")
+
+        common.logging.warning(f"Slow query ({elapsed:.3f}s, {rows} rows): {key}" +
+                               (f"\nQuery plan:\n{plan}" if plan is not None else ""))
@@ -0,0 +1,125 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from common.api.wynncraft.v3 import guild as guild_api
+from common.types.constants import seasons
+from common.types.enums import PlayerStatsIdentifier
+from common.types.wynncraft import WynncraftGuild
+from . import manager, memberSetData, playerTrackerData
+
+# Time after the end of a season until its leaderboards are frozen, so late records of the last day are included.
+FREEZE_DELAY = timedelta(days=1)
+
+_freeze_locks: dict[tuple[int, str], asyncio.Lock] = {}
+
+
+def is_finished(season: int) -> bool:
+    """
+    Check whether a season is over and its leaderboards can be frozen.
+
+    :param season: The season number.
+    """
+    return datetime.utcnow() >= seasons[season][1] + FREEZE_DELAY
+
+
+async def _is_frozen(season: int, stat: PlayerStatsIdentifier) -> bool:
+    cur = await manager.get_read_cursor()
+    res = await cur.execute("""
+                SELECT 1 FROM frozen_seasons
+                WHERE season = ?
+                AND stat = ?
+                AND frozen_at IS NOT NULL
+            """, (season, stat))
+    return await res.fetchone() is not None
+
+
+async def freeze(season: int, stat: PlayerStatsIdentifier):
+    """
+    Compute the full leaderboard of a finished season and store it. Replaces a previously stored leaderboard.
+    If daily rollups of the season get backfilled meanwhile, nothing is stored.
+
+    :param season: The season number.
+    :param stat: The stat to rank the players by.
+    :raises ValueError: If the season isn't finished yet.
+    """
+    if not is_finished(season):
+        raise ValueError(f"Season {season} isn't finished yet.")
+
+    start, end = seasons[season]
+    # Backfilled rollups inside the season delete this row while the leaderboard is computed (see manager), in which
+    # case the result is discarded.
+    async with manager.transaction() as cur:
+        await cur.execute("""
+                    REPLACE INTO frozen_seasons (season, stat, first_day, last_day)
+                    VALUES (?, ?, ?, ?)
+                """, (season, stat, start.date(), end.date()))
+
+    # Bypass the query cache, the complete leaderboard is only needed once.
+    leaderboard = await playerTrackerData.get_gain_leaderboard.__wrapped__(stat, start, end, None, limit=-1)
+
+    async with manager.transaction() as cur:
+        await cur.execute("""
+                    UPDATE frozen_seasons SET frozen_at = CURRENT_TIMESTAMP
+                    WHERE season = ?
+                    AND stat = ?
+                """, (season, stat))
+        if cur.rowcount == 0:
+            return
+        await cur.execute("DELETE FROM season_leaderboards WHERE season = ? AND stat = ?", (season, stat))
+        await cur.executemany("INSERT INTO season_leaderboards VALUES (?, ?, ?, ?, ?)",
+                              ((season, stat, rank, uuid, value) for rank, uuid, value in leaderboard))
+
+
+async def get_leaderboard(season: int, stat: PlayerStatsIdentifier, guild: WynncraftGuild = None,
+                          limit: int = 100) -> list[tuple[int, str, int | float]]:
+    """
+    Get the leaderboard of a season. Leaderboards of finished seasons are computed once and stored. They are only
+    recomputed when daily rollups inside the season get backfilled. Leaderboards of the current season are computed
+    live with :func:`playerTrackerData.get_gain_leaderboard`.
+
+    :param season: The season number.
+    :param stat: The stat to rank the players by.
+    :param guild: The guild to get the leaderboard for. If None, the global leaderboard is returned.
+    :param limit: The maximum amount of players to return.
+    :return: A list of tuples containing the rank, uuid and gain of the players, sorted by rank.
+    :raises ValueError: If the season or guild doesn't exist.
+    """
+    if not 0 <= season < len(seasons):
+        raise ValueError(f"Invalid season number: ``{season}``")
+
+    start, end = seasons[season]
+    if not is_finished(season):
+        return await playerTrackerData.get_gain_leaderboard(stat, start, end, guild, limit)
+
+    if not await _is_frozen(season, stat):
+        async with _freeze_locks.setdefault((season, stat), asyncio.Lock()):
+            if not await _is_frozen(season, stat):
+                await freeze(season, stat)
+        if not await _is_frozen(season, stat):
+            # The season is being backfilled right now.
+            return await playerTrackerData.get_gain_leaderboard(stat, start, end, guild, limit)
+
+    cur = await manager.get_read_cursor()
+    if guild is None:
+        res = await cur.execute("""
+                    SELECT rank, uuid, value FROM season_leaderboards
+                    WHERE season = ?
+                    AND stat = ?
+                    ORDER BY rank
+                    LIMIT ?
+                """, (season, stat, limit))
+    else:
+        try:
+            members_sql, members_params = await memberSetData.load(guild.name)
+        except guild_api.UnknownGuildException:
+            raise ValueError(f"Guild {guild.name} not found.")
+        res = await cur.execute(f"""
+                    SELECT row_number() over (ORDER BY rank) as rank, uuid, value FROM season_leaderboards
+                    WHERE season = ?
+                    AND stat = ?
+                    AND uuid IN ({members_sql})
+                    ORDER BY rank
+                    LIMIT ?
+                """, (season, stat) + members_params + (limit,))
+
+    return [(row['rank'], row['uuid'], row['value']) for row in await res.fetchall()]
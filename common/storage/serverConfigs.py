@@ -3,6 +3,8 @@ import json
 import os.path
 from dataclasses import dataclass
 
+from . import manager
+
 
 @dataclass
 class _Config:
@@ -14,49 +16,52 @@ class _Config:
 
 
 class ServerConfigs:
-    def __init__(self, path: str):
+    def __init__(self, bot_id: str, legacy_path: str = None):
         """
         Class that holds the server configurations for each server a bot instance is in.
-        :param path: The path to the json file where the configurations are stored.
+        The configurations are kept in memory and stored per server in the database, so looking up a config never
+        touches the disk. Servers that were never configured use the default config and aren't stored.
+        :param bot_id: The id of the bot instance the configurations belong to.
+        :param legacy_path: The path to a json file with configurations from older versions. It is imported on the
+                            first load if the bot has no stored configurations yet.
         """
-        self.path = path
+        self.bot_id = bot_id
+        self.legacy_path = legacy_path
         self._server_configs = {}
-        self.loaded = False
 
-    def load(self):
+    async def load(self):
         """
-        Loads the server configurations from the json file.
+        Loads the server configurations from the database.
         """
-        if not os.path.isfile(self.path):
-            return
+        cur = await manager.get_read_cursor()
+        res = await cur.execute("SELECT server_id, config FROM server_configs WHERE bot_id = ?", (self.bot_id,))
+        data = {row["server_id"]: json.loads(row["config"]) for row in await res.fetchall()}
 
-        with open(self.path, mode='r') as f:
-            content = f.read()
+        if len(data) == 0 and self.legacy_path is not None and os.path.isfile(self.legacy_path):
+            with open(self.legacy_path, mode='r') as f:
+                data = {int(server_id): v for server_id, v in json.loads(f.read()).items()}
+            async with manager.transaction() as cur:
+                await cur.executemany("INSERT OR IGNORE INTO server_configs VALUES (?, ?, ?)",
+                                      [(self.bot_id, server_id, json.dumps(v)) for server_id, v in data.items()])
 
-        data = json.loads(content)
-        self._server_configs = {int(server_id): _Config(**v) for server_id, v in data.items()}
-        self.loaded = True
+        fields = {f.name for f in dataclasses.fields(_Config)}
+        self._server_configs = {server_id: _Config(**{k: v for k, v in config.items() if k in fields})
+                                for server_id, config in data.items()}
 
-    def save(self):
+    async def save(self, server_id: int):
         """
-        Saves the server configurations to the json file.
+        Saves the configuration of a server to the database.
         """
-        if not os.path.isfile(self.path):
-            os.makedirs(os.path.dirname(self.path), exist_ok=True)
-
-        with open(self.path, mode='w') as f:
-            f.write(json.dumps({k: dataclasses.asdict(v) for k, v in self._server_configs.items()}, indent=4))
+        async with manager.transaction() as cur:
+            await cur.execute("REPLACE INTO server_configs VALUES (?, ?, ?)",
+                              (self.bot_id, server_id, json.dumps(dataclasses.asdict(self.get(server_id)))))
 
     def get(self, server_id: int) -> _Config:
         """
-        Gets the configuration for a server.
+        Gets the configuration for a server. Changes to it have to be stored with save().
         """
-        if not self.loaded:
-            self.load()
-
         if server_id not in self._server_configs:
             self._server_configs[server_id] = _Config()
-            self.save()
 
         return self._server_configs.get(server_id)
 
@@ -15,7 +15,7 @@ class Strike:
 
 
 async def get_strikes(user_id: int, server_id: int) -> tuple[Strike]:
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute("""
                 SELECT * FROM strikes
                 WHERE user_id = ?
@@ -28,7 +28,7 @@ async def get_strikes(user_id: int, server_id: int) -> tuple[Strike]:
 
 
 async def get_unpardoned_strikes_after(userid: int, server_id: int, day: date) -> tuple[Strike]:
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute("""
                 SELECT * FROM strikes
                 WHERE user_id = ?
@@ -43,7 +43,7 @@ async def get_unpardoned_strikes_after(userid: int, server_id: int, day: date) -
 
 
 async def get_strike_by_id(strike_id: int) -> Strike | None:
-    cur = await manager.get_cursor()
+    cur = await manager.get_read_cursor()
     res = await cur.execute("""
                 SELECT * FROM strikes
                 WHERE strike_id = ?
@@ -57,23 +57,17 @@ async def get_strike_by_id(strike_id: int) -> Strike | None:
 
 
 async def add_strike(user_id: int, server_id: int, strike_date: date, reason: str):
-    con = manager.get_connection()
-    cur = await manager.get_cursor()
-    await cur.execute("""
-            INSERT INTO strikes (user_id, server_id, strike_date, reason, pardoned)
-            VALUES (?, ?, ?, ?, 0)
-        """, (user_id, server_id, strike_date, reason))
-
-    await con.commit()
+    async with manager.transaction() as cur:
+        await cur.execute("""
+                INSERT INTO strikes (user_id, server_id, strike_date, reason, pardoned)
+                VALUES (?, ?, ?, ?, 0)
+            """, (user_id, server_id, strike_date, reason))
 
 
 async def pardon_strike(strike_id: int):
-    con = manager.get_connection()
-    cur = await manager.get_cursor()
-    await cur.execute("""
-            UPDATE strikes
-            SET pardoned = 1
-            WHERE strike_id = ?
-        """, (strike_id,))
-
-    await con.commit()
+    async with manager.transaction() as cur:
+        await cur.execute("""
+                UPDATE strikes
+                SET pardoned = 1
+                WHERE strike_id = ?
+            """, (strike_id,))
@@ -1,6 +1,24 @@
+import json
+from collections.abc import Iterable
+
 from common.types.dataTypes import MinecraftPlayer
+from common.utils.prefixIndex import PrefixIndex
 from . import manager
 
+# Index of all stored players by name. None until load_index is called.
+_index: PrefixIndex | None = None
+
+
+async def load_index():
+    """
+    Load all stored usernames into the in-memory prefix index used by find_players and get_player.
+    """
+    cur = await manager.get_read_cursor()
+    res = await cur.execute("SELECT name, uuid FROM minecraft_usernames")
+
+    global _index
+    _index = PrefixIndex((row["name"], row["uuid"]) for row in await res.fetchall())
+
 
 async def get_players(*, uuids: list[str] = None, usernames: list[str] = None) -> list[MinecraftPlayer]:
     """
@@ -15,7 +33,12 @@ async def get_players(*, uuids: list[str] = None, usernames: list[str] = None) -
 
     uuids = [uuid.replace("-", "").lower() for uuid in uuids]
 
-    cur = await manager.get_cursor()
+    if _index is not None:
+        players = {uuid: _index.get_key(uuid) for uuid in uuids}
+        players.update({entry[1]: entry[0] for entry in map(_index.get, usernames) if entry is not None})
+        return [MinecraftPlayer(uuid, name) for uuid, name in players.items() if name is not None]
+
+    cur = await manager.get_read_cursor()
     res = await cur.execute(f"""
                 SELECT * FROM minecraft_usernames
                 WHERE uuid IN ({', '.join("?" for _ in uuids)})
@@ -42,7 +65,14 @@ async def get_player(*, uuid: str = None, username: str = None) -> MinecraftPlay
     else:
         raise TypeError("Exactly one argument (either uuid or username) must be provided.")
 
-    cur = await manager.get_cursor()
+    if _index is not None:
+        if selector == "name":
+            entry = _index.get(match)
+            return None if entry is None else MinecraftPlayer(entry[1], entry[0])
+        name = _index.get_key(match)
+        return None if name is None else MinecraftPlayer(match, name)
+
+    cur = await manager.get_read_cursor()
     res = await cur.execute(f"""
                 SELECT * FROM minecraft_usernames
                 WHERE {selector} = ?
@@ -55,23 +85,69 @@ async def get_player(*, uuid: str = None, username: str = None) -> MinecraftPlay
     return MinecraftPlayer(data[0]["uuid"], data[0]["name"])
 
 
-async def find_players(s: str) -> list[MinecraftPlayer]:
+async def find_players(s: str, limit: int = 25) -> list[MinecraftPlayer]:
     """
-    Find all players that have a name starting with the specified string.
+    Find players that have a name starting with the specified string (case-insensitive), in alphabetical order.
 
-    :return: A list of all players that were found.
+    :param limit: The maximum amount of players to return.
+    :return: A list of the players that were found.
     """
-    cur = await manager.get_cursor()
+    if _index is not None:
+        return [MinecraftPlayer(uuid, name) for name, uuid in _index.search(s, limit)]
+
+    cur = await manager.get_read_cursor()
     res = await cur.execute(f"""
                 SELECT * FROM minecraft_usernames
                 WHERE name LIKE ?
-                """, (f"{s.lower()}%",))
+                ORDER BY name
+                LIMIT ?
+                """, (f"{s.lower()}%", limit))
 
     data = await res.fetchall()
 
     return [MinecraftPlayer(row["uuid"], row["name"]) for row in data]
 
 
+async def _get_names(uuids: list[str]) -> dict[str, str]:
+    if _index is not None:
+        return {uuid: name for uuid in uuids if (name := _index.get_key(uuid)) is not None}
+
+    cur = await manager.get_read_cursor()
+    res = await cur.execute("""
+                SELECT uuid, name FROM minecraft_usernames
+                WHERE uuid IN (SELECT value FROM json_each(?))
+                """, (json.dumps(uuids),))
+
+    return {row["uuid"]: row["name"] for row in await res.fetchall()}
+
+
+async def update_many(players: Iterable[tuple[str, str]]) -> list[tuple[str, str, str]]:
+    """
+    Update many players in the database in a single transaction. Only players whose name changed or that weren't
+    stored yet are written. If any entries exist with the same uuid or (case-insensitive) username these get replaced.
+
+    :param players: (uuid, username) pairs, e.g. MinecraftPlayers. If a uuid appears more than once the last name is
+     used.
+    :return: A list of (uuid, previous name, new name) tuples of the stored players whose name changed.
+    """
+    names = {uuid.replace("-", "").lower(): name for uuid, name in players}
+    if len(names) == 0:
+        return []
+
+    previous = await _get_names(list(names.keys()))
+    changed = [(uuid, name) for uuid, name in names.items() if previous.get(uuid) != name]
+    if len(changed) > 0:
+        async with manager.transaction() as cur:
+            await cur.executemany("""
+                    REPLACE INTO minecraft_usernames VALUES (?, ?)
+                    """, changed)
+        if _index is not None:
+            for uuid, name in changed:
+                _index.set(name, uuid)
+
+    return [(uuid, previous[uuid], name) for uuid, name in changed if uuid in previous]
+
+
 async def update(uuid: str, username: str) -> MinecraftPlayer | None:
     """
     Update a player in the database. If any entries exist with the same uuid or (case-insensitive) username these get replaced.
@@ -80,15 +156,7 @@ async def update(uuid: str, username: str) -> MinecraftPlayer | None:
     """
     uuid = uuid.replace("-", "").lower()
 
-    con = manager.get_connection()
-    cur = await manager.get_cursor()
-
     prev_p = await get_player(uuid=uuid)
-    if prev_p is None or prev_p.name != username:
-        await cur.execute("""
-                REPLACE INTO minecraft_usernames VALUES (?, ?)
-                """, (uuid, username))
-
-        await con.commit()
+    await update_many(((uuid, username),))
 
     return prev_p
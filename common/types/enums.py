@@ -73,6 +73,19 @@ class LogEntryType(IntEnum):
     MEMBER_NAME_CHANGE = 3
 
 
+class RequestPriority(IntEnum):
+    """
+    Priority of API requests. Lower values are served first.
+    """
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+class PrivateStat(StrEnum):
+    MAIN_ACCESS = "main_access"
+    ONLINE_STATUS = "online_status"
+
+
 class PlayerIdentifier(StrEnum):
     UUID = "uuid"
     USERNAME = "username"
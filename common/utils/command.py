@@ -110,10 +110,11 @@ class Timeframe:
     Represents a timeframe (start and end date and a string representation).
     """
 
-    def __init__(self, start: datetime, end: datetime, comment: str = None):
+    def __init__(self, start: datetime, end: datetime, comment: str = None, season: int = None):
         self.start = start
         self.end = end
         self.comment = comment
+        self.season = season  # the season number if the timeframe is a season
 
     @classmethod
     def from_timeframe_str(cls, timeframe: str):
@@ -148,7 +149,7 @@ class Timeframe:
             season = int(match.group(1))
             if season >= len(seasons):
                 raise ValueError(f"Invalid season number: ``{match.group(1)}``")
-            return cls(seasons[season][0], seasons[season][1], f"season {season}")
+            return cls(seasons[season][0], seasons[season][1], f"season {season}", season)
 
         raise ValueError(f"Invalid timeframe format: ``{timeframe}``")
 
@@ -199,8 +200,8 @@ async def player_autocomplete(
         return []
     return [
                Choice(name=p.name, value=p.name)
-               for p in await common.storage.usernameData.find_players(current)
-           ][0:25]
+               for p in await common.storage.usernameData.find_players(current, limit=25)
+           ]
 
 
 async def guild_autocomplete(
@@ -0,0 +1,86 @@
+import bisect
+
+
+class PrefixIndex:
+    """
+    A case-insensitive index mapping unique keys to values that supports fast prefix searches.
+
+    Keys are kept in a list sorted by their case-folded form, with a parallel list of values, so a prefix search is a
+    binary search followed by a scan over the matching range. Besides the two lists only a dict from values to keys is
+    stored, which holds references to the same string objects.
+    """
+
+    def __init__(self, items=()):
+        """
+        :param items: (key, value) pairs to fill the index with.
+        """
+        items = sorted(items, key=lambda item: item[0].casefold())
+        self._keys: list[str] = [k for k, _ in items]
+        self._values: list[str] = [v for _, v in items]
+        self._key_of: dict[str, str] = {v: k for k, v in items}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _find(self, key: str) -> int | None:
+        i = bisect.bisect_left(self._keys, key.casefold(), key=str.casefold)
+        if i < len(self._keys) and self._keys[i].casefold() == key.casefold():
+            return i
+        return None
+
+    def get(self, key: str) -> tuple[str, str] | None:
+        """
+        Get the entry of a key (case-insensitive).
+
+        :return: The stored key and its value or None if the key isn't indexed.
+        """
+        i = self._find(key)
+        return None if i is None else (self._keys[i], self._values[i])
+
+    def get_key(self, value: str) -> str | None:
+        """
+        Get the key of a value.
+
+        :return: The key or None if the value isn't indexed.
+        """
+        return self._key_of.get(value)
+
+    def set(self, key: str, value: str):
+        """
+        Add an entry. Existing entries with the same (case-insensitive) key or the same value are replaced.
+        """
+        self.remove_key(key)
+        self.remove_value(value)
+        i = bisect.bisect_left(self._keys, key.casefold(), key=str.casefold)
+        self._keys.insert(i, key)
+        self._values.insert(i, value)
+        self._key_of[value] = key
+
+    def remove_key(self, key: str):
+        i = self._find(key)
+        if i is not None:
+            del self._key_of[self._values[i]]
+            del self._keys[i]
+            del self._values[i]
+
+    def remove_value(self, value: str):
+        key = self._key_of.get(value)
+        if key is not None:
+            self.remove_key(key)
+
+    def search(self, prefix: str, limit: int = 25) -> list[tuple[str, str]]:
+        """
+        Find the entries whose key starts with a prefix (case-insensitive), in alphabetical order. An exact match is
+        always first.
+
+        :param prefix: The prefix to search for.
+        :param limit: The maximum amount of entries to return.
+        :return: A list of (key, value) pairs.
+        """
+        prefix = prefix.casefold()
+        start = bisect.bisect_left(self._keys, prefix, key=str.casefold)
+        end = start
+        while end < len(self._keys) and end - start < limit and self._keys[end].casefold().startswith(prefix):
+            end += 1
+
+        return list(zip(self._keys[start:end], self._values[start:end]))
@@ -3,18 +3,24 @@ from datetime import datetime, timezone
 
 from common.botInstance import BotInstance
 
+import common.api.rateLimit
 import common.api.sessionManager
 import common.logging
 import common.storage.manager
 import common.storage.playtimeData
+import common.storage.usernameData
 import workers.guildUpdater
 import workers.playtimeTracker
 import workers.presenceUpdater
 import workers.statTracker
 import workers.usernameUpdater
 import workers.guildIndexer
+import workers.walCheckpointer
+import workers.snapshotRetention
+import workers.databaseBackup
 from common.commands.hybrid import *
 from common.commands.prefixed import *
+from common.types.enums import RequestPriority
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -27,12 +33,15 @@ def add_commands(bot):
         HistoryCommand(bot),
         SpaceCommand(bot),
         WarcountCommand(bot),
+        LeaderboardCommand(bot),
     )
     bot.add_commands(
         ActivityCommand(),
+        BackupCommand(),
         ConfigCommand(),
         EvalCommand(),
         PlaytimeCommand(),
+        QueryStatsCommand(),
         SeenCommand(),
         ShutdownCommand(),
     )
@@ -55,19 +64,29 @@ class MewoBot(BotInstance):
 
 def start_workers():
     common.logging.info("Starting workers...")
-    workers.presenceUpdater.update_presence.start()
-    workers.guildUpdater.guild_updater.start()
-    workers.playtimeTracker.update_playtimes.start()
-    workers.statTracker.start()
-    workers.guildIndexer.update_index.start()
-    common.logging.info("Guild indexer started.")
-
-
-def stop_workers():
+    # Tasks inherit the priority, so requests of the workers only use the budget left over by commands.
+    with common.api.rateLimit.priority(RequestPriority.BACKGROUND):
+        workers.presenceUpdater.update_presence.start()
+        workers.guildUpdater.guild_updater.start()
+        workers.playtimeTracker.update_playtimes.start()
+        workers.statTracker.start()
+        workers.usernameUpdater.start()
+        workers.guildIndexer.update_index.start()
+        common.logging.info("Guild indexer started.")
+        workers.walCheckpointer.start()
+        workers.snapshotRetention.start()
+        workers.databaseBackup.start()
+
+
+async def stop_workers():
     common.logging.info("Stopping workers...")
+    workers.databaseBackup.stop()
+    workers.walCheckpointer.stop()
+    workers.snapshotRetention.stop()
     workers.guildIndexer.update_index.stop()
-    workers.statTracker.stop()
-    workers.playtimeTracker.update_playtimes.stop()
+    await workers.statTracker.stop()
+    await workers.usernameUpdater.stop()
+    await workers.playtimeTracker.stop()
     workers.guildUpdater.guild_updater.stop()
     workers.presenceUpdater.update_presence.stop()
 
@@ -82,6 +101,8 @@ async def main():
         common.logging.info("Booting up...")
 
         await common.storage.manager.init_database()
+        await common.storage.usernameData.load_index()
+        await workers.playtimeTracker.load_private_members()
         await common.api.sessionManager.init_sessions()
 
         async with asyncio.TaskGroup() as tg:
@@ -99,7 +120,8 @@ async def main():
 
             today = datetime.now(timezone.utc).date()
             if (await common.storage.playtimeData.get_first_date_after(today)) is None:
-                await workers.playtimeTracker.update_playtimes()
+                with common.api.rateLimit.priority(RequestPriority.BACKGROUND):
+                    await workers.playtimeTracker.update_playtimes()
 
     except (KeyboardInterrupt, SystemExit, asyncio.CancelledError) as e:
         common.logging.info("Stopped:", e.__class__.__name__)
@@ -107,7 +129,7 @@ async def main():
         common.logging.error(exc_info=e)
     finally:
         common.logging.info("Shutting down...")
-        stop_workers()
+        await stop_workers()
 
         await mewobot.close()
         await niabot.close()
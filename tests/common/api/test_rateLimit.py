@@ -0,0 +1,110 @@
+import asyncio
+import time
+import unittest
+
+from aiohttp import ClientResponseError
+
+from common.api.rateLimit import RateLimit, RateLimitException, priority
+from common.api.wynncraft.v3.wynnRateLimit import INTERACTIVE_RESERVE, WynnRateLimit
+from common.types.enums import RequestPriority
+
+
+class TestRateLimit(unittest.IsolatedAsyncioTestCase):
+    async def test_waits_for_expired_calls(self):
+        rate_limit = RateLimit(2, 0.1 / 60)  # 2 calls per 0.1s
+        t = time.monotonic()
+        for _ in range(5):
+            async with rate_limit.acquire():
+                pass
+        self.assertGreaterEqual(time.monotonic() - t, 0.2)
+
+    async def test_fifo(self):
+        rate_limit = RateLimit(1, 0.05 / 60)
+        order = []
+
+        async def request(i):
+            async with rate_limit.acquire():
+                order.append(i)
+
+        await asyncio.gather(*(request(i) for i in range(5)))
+        self.assertEqual(order, list(range(5)))
+
+    async def test_max_wait(self):
+        rate_limit = RateLimit(1, 1)
+        async with rate_limit.acquire():
+            pass
+        with self.assertRaises(RateLimitException):
+            async with rate_limit.acquire(max_wait=0.1):
+                pass
+
+    async def test_too_many_requests(self):
+        rate_limit = RateLimit(10, 1)
+        with self.assertRaises(RateLimitException):
+            async with rate_limit.acquire():
+                raise ClientResponseError(None, (), status=429)
+        self.assertEqual(rate_limit.calculate_remaining_calls(), 0)
+
+    async def test_refund_own_slot(self):
+        rate_limit = RateLimit(2, 0.2 / 60)
+        async with rate_limit.acquire() as first:
+            pass
+        await asyncio.sleep(0.1)
+        async with rate_limit.acquire():
+            pass
+        rate_limit.refund(first)
+        self.assertEqual(rate_limit.calculate_remaining_calls(), 1)
+
+        # the second call still counts after the first one would have expired
+        await asyncio.sleep(0.15)
+        self.assertEqual(rate_limit.calculate_remaining_calls(), 1)
+        rate_limit.refund(first)
+        self.assertEqual(rate_limit.calculate_remaining_calls(), 1)
+
+    async def test_wynn_refund_in_same_period(self):
+        rate_limit = WynnRateLimit()
+        rate_limit.set_time_until_reset(0.1)
+        async with rate_limit.acquire() as old:
+            pass
+        await asyncio.sleep(0.15)
+        async with rate_limit.acquire() as slot:
+            pass
+        rate_limit.refund(old)
+        self.assertEqual(rate_limit.calculate_remaining_calls(), rate_limit.get_max_calls() - 1)
+        rate_limit.refund(slot)
+        self.assertEqual(rate_limit.calculate_remaining_calls(), rate_limit.get_max_calls())
+
+    async def test_wynn_wakes_at_reset(self):
+        rate_limit = WynnRateLimit()
+        rate_limit.set_remaining(1)
+        rate_limit.set_time_until_reset(0.2)
+        async with rate_limit.acquire():
+            pass
+        t = time.monotonic()
+        async with rate_limit.acquire(5):
+            pass
+        self.assertAlmostEqual(time.monotonic() - t, 0.2, delta=0.05)
+        self.assertEqual(rate_limit.calculate_remaining_calls(), 115)
+
+    async def test_background_leaves_reserve(self):
+        rate_limit = WynnRateLimit()
+        rate_limit.set_time_until_reset(0.2)
+        with priority(RequestPriority.BACKGROUND):
+            for _ in range(rate_limit.get_max_calls() - INTERACTIVE_RESERVE):
+                async with rate_limit.acquire():
+                    pass
+            background = asyncio.create_task(self._acquire(rate_limit))
+        await asyncio.sleep(0.05)
+        self.assertFalse(background.done())
+
+        t = time.monotonic()
+        for _ in range(INTERACTIVE_RESERVE):
+            async with rate_limit.acquire():
+                pass
+        self.assertLess(time.monotonic() - t, 0.05)
+
+        await background
+        self.assertEqual(rate_limit.calculate_remaining_calls(), rate_limit.get_max_calls() - 1)
+
+    async def _acquire(self, rate_limit):
+        async with rate_limit.acquire():
+            pass
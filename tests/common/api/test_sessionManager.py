@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from common.api import rateLimit, sessionManager
+
+
+class TestResponseCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.requests = []
+
+        async def handler(request: web.Request):
+            self.requests.append(request)
+            kind = request.match_info["kind"]
+            if kind == "etag":
+                if request.headers.get("If-None-Match") == '"v1"':
+                    return web.Response(status=304, headers={"ETag": '"v1"'})
+                return web.json_response({"kind": kind}, headers={"ETag": '"v1"'})
+            if kind == "max-age":
+                return web.json_response({"kind": kind}, headers={"Cache-Control": "public, max-age=60"})
+            return web.json_response({"kind": kind}, headers={"Cache-Control": "no-store", "ETag": '"v1"'})
+
+        app = web.Application()
+        app.router.add_get("/{kind}", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self._cache_path = sessionManager.CACHE_PATH
+        sessionManager.CACHE_PATH = os.path.join(self.tmp.name, "http_cache.db")
+        self.session_id = sessionManager.register_session(str(self.server.make_url("/")))
+        await sessionManager.init_sessions()
+
+    async def asyncTearDown(self):
+        await sessionManager.close()
+        sessionManager.CACHE_PATH = self._cache_path
+        await self.server.close()
+        self.tmp.cleanup()
+
+    async def test_conditional_request(self):
+        rate_limit = rateLimit.RateLimit(10, 1)
+        first = await sessionManager.cached_get(self.session_id, "/etag", rate_limit=rate_limit)
+        second = await sessionManager.cached_get(self.session_id, "/etag", rate_limit=rate_limit)
+
+        self.assertEqual(len(self.requests), 2)
+        self.assertEqual(self.requests[1].headers.get("If-None-Match"), '"v1"')
+        self.assertTrue(second.not_modified)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(rate_limit.calculate_remaining_calls(), 9)
+
+    async def test_max_age(self):
+        await sessionManager.cached_get(self.session_id, "/max-age")
+        resp = await sessionManager.cached_get(self.session_id, "/max-age")
+        self.assertEqual(len(self.requests), 1)
+        self.assertFalse(resp.requested)
+        self.assertEqual(resp.json(), {"kind": "max-age"})
+
+    async def test_fresh_hit_updates_used_at_rarely(self):
+        await sessionManager.cached_get(self.session_id, "/max-age")
+        await sessionManager._cache.execute("UPDATE responses SET used_at = 1000")
+        await sessionManager._cache.commit()
+
+        await sessionManager.cached_get(self.session_id, "/max-age")
+        used_at = await self._used_at()
+        self.assertGreater(used_at, 1000)
+
+        await sessionManager.cached_get(self.session_id, "/max-age")
+        self.assertEqual(await self._used_at(), used_at)
+
+    async def _used_at(self) -> float:
+        res = await sessionManager._cache.execute("SELECT used_at FROM responses")
+        return (await res.fetchone())[0]
+
+    async def test_no_store(self):
+        await sessionManager.cached_get(self.session_id, "/no-store")
+        resp = await sessionManager.cached_get(self.session_id, "/no-store")
+        self.assertEqual(len(self.requests), 2)
+        self.assertIsNone(self.requests[1].headers.get("If-None-Match"))
+        self.assertFalse(resp.not_modified)
+
+    async def test_survives_restart(self):
+        await sessionManager.cached_get(self.session_id, "/etag")
+        await sessionManager.close()
+        await sessionManager.init_sessions()
+        resp = await sessionManager.cached_get(self.session_id, "/etag")
+        self.assertTrue(resp.not_modified)
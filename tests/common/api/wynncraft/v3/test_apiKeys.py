@@ -0,0 +1,37 @@
+import os
+import unittest
+
+from common.api.wynncraft.v3 import apiKeys, player
+
+
+class TestApiKeys(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self._pool = apiKeys._pool
+        apiKeys._pool = ["a", "b", "c"]
+
+    def tearDown(self):
+        apiKeys._pool = self._pool
+        for key in ("a", "b", "c"):
+            apiKeys._rate_limits.pop(key, None)
+
+    async def test_spreads_by_remaining_budget(self):
+        used = []
+        for _ in range(6):
+            key, rate_limit = apiKeys.pick_key()
+            async with rate_limit.acquire():
+                used.append(key)
+        self.assertEqual(sorted(used), ["a", "a", "b", "b", "c", "c"])
+
+        apiKeys.get_rate_limit("c").set_remaining(0)
+        self.assertNotEqual(apiKeys.pick_key()[0], "c")
+
+    def test_rate_limit_per_key(self):
+        self.assertIs(apiKeys.get_rate_limit("a"), apiKeys.get_rate_limit("a"))
+        self.assertIsNot(apiKeys.get_rate_limit("a"), apiKeys.get_rate_limit("b"))
+
+    def test_default_key_shares_player_rate_limit(self):
+        self.assertIs(apiKeys.get_rate_limit(None), player._player_rate_limit)
+        self.assertIs(apiKeys.get_rate_limit(os.getenv('WYNN_API_KEY')), player._player_rate_limit)
+
+        apiKeys._pool = []
+        self.assertIs(apiKeys.pick_key()[1], player._player_rate_limit)
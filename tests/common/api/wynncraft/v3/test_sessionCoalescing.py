@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+from common.api.wynncraft.v3 import session
+
+
+class TestSessionCoalescing(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.calls = []
+        self._get = session._get
+
+        async def fake_get(url, rate_limit, api_key, pooled, tries, **params):
+            self.calls.append((url, params, api_key, pooled))
+            await asyncio.sleep(0.01)
+            if url == "/error":
+                raise ValueError()
+            return {"url": url, **params}
+
+        session._get = fake_get
+
+    async def asyncTearDown(self):
+        session._get = self._get
+
+    async def test_identical_requests_share_one_call(self):
+        saved = session.coalesced_requests()
+        results = await asyncio.gather(*(session.get("/guild/Nerfuria") for _ in range(5)))
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(r == {"url": "/guild/Nerfuria"} for r in results))
+        self.assertEqual(session.coalesced_requests() - saved, 4)
+
+        await session.get("/guild/Nerfuria")
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_different_requests_not_shared(self):
+        await asyncio.gather(
+            session.get("/guild/Nerfuria"),
+            session.get("/guild/Nerfuria", identifier="uuid"),
+        )
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_requests_with_key_not_shared(self):
+        await asyncio.gather(
+            session.get("/player/abc"),
+            session.get("/player/abc", api_key="a"),
+            session.get("/player/abc", api_key="a"),
+        )
+        self.assertEqual(len(self.calls), 3)
+
+    async def test_pooled_key_picked_once(self):
+        await asyncio.gather(*(session.get("/player/abc", pooled=True) for _ in range(3)))
+        # the shared request picks the key, the callers don't
+        self.assertEqual(self.calls, [("/player/abc", {}, None, True)])
+
+    async def test_cancelled_caller(self):
+        first = asyncio.create_task(session.get("/player/abc"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(session.get("/player/abc"))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, {"url": "/player/abc"})
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_errors_shared(self):
+        results = await asyncio.gather(*(session.get("/error") for _ in range(3)), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertEqual(len(self.calls), 1)
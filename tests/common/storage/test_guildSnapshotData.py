@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from common.storage import guildSnapshotData, manager
+from common.types.wynncraft import GuildStats
+from common.utils.misc import format_uuid
+
+A = "0000000000000000000000000000000a"
+B = "0000000000000000000000000000000b"
+C = "0000000000000000000000000000000c"
+
+
+def _guild(members: dict[str, tuple[str, int]], online: bool = False) -> GuildStats:
+    member_lists = {rank: {} for rank in guildSnapshotData.RANKS}
+    for uuid, (rank, contributed) in members.items():
+        member_lists[rank][format_uuid(uuid)] = {
+            "username": uuid[-1], "online": online, "server": None, "contributed": contributed,
+            "contributionRank": 1, "joined": "2024-01-01"
+        }
+    return GuildStats.from_json({
+        "uuid": "guild", "name": "Snapshot Guild", "prefix": "SG", "level": 1, "xpPercent": 0, "territories": 0,
+        "wars": 0, "created": "2024-01-01", "members": {"total": len(members)} | member_lists, "online": 0,
+        "banner": {}, "seasonRanks": {}
+    })
+
+
+class TestGuildSnapshotData(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        await manager.init_database(os.path.join(self.tmp.name, "test.db"))
+        guildSnapshotData._hashes.clear()
+        guildSnapshotData._members.clear()
+        self.t = datetime(2024, 5, 1)
+
+    async def asyncTearDown(self):
+        await manager.close()
+        self.tmp.cleanup()
+
+    async def _changes(self) -> int:
+        cur = await manager.get_read_cursor()
+        res = await cur.execute("SELECT count(*) FROM guild_member_changes")
+        return (await res.fetchone())[0]
+
+    async def _store_sequence(self):
+        await guildSnapshotData.store(_guild({A: ("owner", 10), B: ("recruit", 0)}), self.t)
+        await guildSnapshotData.store(_guild({A: ("owner", 20), B: ("recruit", 0)}), self.t + timedelta(hours=1))
+        await guildSnapshotData.store(_guild({A: ("owner", 30), C: ("recruit", 5)}), self.t + timedelta(hours=2))
+
+    async def test_only_changed_members_stored(self):
+        await self._store_sequence()
+        self.assertFalse(await guildSnapshotData.store(_guild({A: ("owner", 30), C: ("recruit", 5)}, online=True),
+                                                       self.t + timedelta(hours=3)))
+
+        # 2 initial members, 1 contribution change, 1 contribution change + 1 join + 1 leave
+        self.assertEqual(await self._changes(), 6)
+        self.assertEqual(await guildSnapshotData.get_member_counts("Snapshot Guild"),
+                         [(self.t, 2), (self.t + timedelta(hours=1), 2), (self.t + timedelta(hours=2), 2)])
+        self.assertEqual(await guildSnapshotData.get_contributions("Snapshot Guild", A),
+                         [(self.t, 10), (self.t + timedelta(hours=1), 20), (self.t + timedelta(hours=2), 30)])
+
+    async def test_latest_after_restart(self):
+        await self._store_sequence()
+        guildSnapshotData._hashes.clear()
+        guildSnapshotData._members.clear()
+
+        latest = (await guildSnapshotData.get_latest(["snapshot guild"]))["snapshot guild"]
+        self.assertEqual(latest, _guild({A: ("owner", 30), C: ("recruit", 5)}))
+        self.assertFalse(await guildSnapshotData.store(latest, self.t + timedelta(hours=3)))
+
+        await guildSnapshotData.store(_guild({A: ("owner", 30), C: ("chief", 5)}), self.t + timedelta(hours=3))
+        self.assertEqual(await self._changes(), 7)
+
+    async def test_downsample_keeps_members(self):
+        members = {A: ("owner", 0)}
+        times = [self.t + timedelta(hours=6 * i) for i in range(12)]
+        for i, t in enumerate(times):
+            # B joins and leaves between two kept snapshots, C joins in one that is removed.
+            if i == 1:
+                members[B] = ("recruit", 0)
+            if i == 2:
+                members.pop(B)
+            if i == 5:
+                members[C] = ("recruit", 0)
+            members[A] = ("owner", i)
+            await guildSnapshotData.store(_guild(members), t)
+        expected = {t: count for t, count in await guildSnapshotData.get_member_counts("Snapshot Guild")}
+
+        deleted = await guildSnapshotData.downsample_snapshots("Snapshot Guild", self.t + timedelta(days=2),
+                                                               self.t - timedelta(days=1))
+
+        counts = await guildSnapshotData.get_member_counts("Snapshot Guild")
+        # the last snapshot of each of the first two days and every snapshot of the third
+        self.assertEqual([t for t, _ in counts], [times[3], times[7]] + times[8:])
+        self.assertEqual(deleted, 6)
+        self.assertEqual(counts, [(t, expected[t]) for t, _ in counts])
+        self.assertEqual(await guildSnapshotData.get_contributions("Snapshot Guild", A),
+                         [(t, times.index(t)) for t, _ in counts])
+        latest = (await guildSnapshotData.get_latest(["Snapshot Guild"]))["Snapshot Guild"]
+        self.assertEqual(set(latest.members.all), {format_uuid(A), format_uuid(C)})
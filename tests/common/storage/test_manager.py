@@ -0,0 +1,52 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from common.storage import manager
+
+
+class TestManager(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        await manager.init_database(os.path.join(self.tmp.name, "test.db"))
+
+    async def asyncTearDown(self):
+        await manager.close()
+        self.tmp.cleanup()
+
+    async def test_wal_mode(self):
+        cur = await manager.get_cursor()
+        res = await cur.execute("PRAGMA journal_mode")
+        self.assertEqual((await res.fetchone())[0], "wal")
+
+    async def test_readers_see_committed_writes(self):
+        async with manager.transaction() as cur:
+            await cur.execute("INSERT INTO minecraft_usernames VALUES ('abc', 'Tester')")
+
+        for _ in range(manager.READ_POOL_SIZE):
+            cur = await manager.get_read_cursor()
+            res = await cur.execute("SELECT name FROM minecraft_usernames WHERE uuid = 'abc'")
+            self.assertEqual((await res.fetchone())["name"], "Tester")
+
+    async def test_transaction_rollback(self):
+        with self.assertRaises(ValueError):
+            async with manager.transaction() as cur:
+                await cur.execute("INSERT INTO minecraft_usernames VALUES ('abc', 'Tester')")
+                raise ValueError()
+
+        cur = await manager.get_read_cursor()
+        res = await cur.execute("SELECT count(*) FROM minecraft_usernames")
+        self.assertEqual((await res.fetchone())[0], 0)
+
+    async def test_readers_are_read_only(self):
+        cur = await manager.get_read_cursor()
+        with self.assertRaises(sqlite3.OperationalError):
+            await cur.execute("INSERT INTO minecraft_usernames VALUES ('abc', 'Tester')")
+
+    async def test_checkpoint(self):
+        async with manager.transaction() as cur:
+            await cur.execute("INSERT INTO minecraft_usernames VALUES ('abc', 'Tester')")
+
+        busy, wal_pages, checkpointed = await manager.checkpoint("TRUNCATE")
+        self.assertEqual(busy, 0)
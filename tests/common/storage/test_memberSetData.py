@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from common.storage import manager, memberSetData
+
+
+def _guild_stats(*uuids):
+    return SimpleNamespace(members=SimpleNamespace(all={uuid: None for uuid in uuids}))
+
+
+class TestMemberSetData(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        await manager.init_database(os.path.join(self.tmp.name, "test.db"))
+        memberSetData._member_sets.clear()
+        memberSetData._updated_at.clear()
+        memberSetData._stored_names.clear()
+
+        self.stats = mock.AsyncMock(return_value=_guild_stats("c-c", "d-d"))
+        patcher = mock.patch.object(memberSetData.guild_api, "stats", self.stats)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await manager.close()
+        self.tmp.cleanup()
+
+    async def _members(self, guild_name: str) -> set[str]:
+        sql, params = await memberSetData.load(guild_name)
+        cur = await manager.get_read_cursor()
+        res = await cur.execute(f"SELECT value FROM json_each('[\"aa\", \"bb\", \"cc\", \"dd\"]') "
+                                f"WHERE value IN ({sql})", params)
+        return {row[0] for row in await res.fetchall()}
+
+    async def _stored(self) -> set[tuple[str, str]]:
+        cur = await manager.get_read_cursor()
+        res = await cur.execute("SELECT guild, uuid FROM guild_member_sets")
+        return {tuple(row) for row in await res.fetchall()}
+
+    async def test_stored_set(self):
+        await memberSetData.set_members("Guild", ["a-a", "B-B"])
+        await memberSetData.set_members("Guild", ["b-b", "c-c"])
+
+        self.assertEqual(await self._stored(), {("Guild", "bb"), ("Guild", "cc")})
+        self.assertEqual(await self._members("guild"), {"bb", "cc"})
+        self.assertEqual(memberSetData.guilds_of(["C-C"]), {"guild"})
+        self.stats.assert_not_called()
+
+    async def test_unstored_set_not_written(self):
+        self.assertEqual(await self._members("Other"), {"cc", "dd"})
+        self.assertEqual(await self._stored(), set())
+        self.stats.assert_awaited_once_with(name="Other")
+
+    async def test_outdated_set_not_used(self):
+        await memberSetData.set_members("Guild", ["a-a"])
+        memberSetData._updated_at["guild"] -= memberSetData.MAX_AGE + 1
+
+        self.assertEqual(await self._members("Guild"), {"cc", "dd"})
+        self.assertEqual(await self._stored(), {("Guild", "aa")})
@@ -1,7 +1,14 @@
 import datetime
+import os
+import sqlite3
+import tempfile
 import unittest
+import unittest.mock
+from types import SimpleNamespace
+
 import tests.test_main
-from common.storage import playerTrackerData
+from common.storage import manager, playerTrackerData, queryCache
+from common.types.enums import PlayerStatsIdentifier
 
 class TestPlayerTrackerData(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
@@ -15,4 +22,201 @@ class TestPlayerTrackerData(unittest.IsolatedAsyncioTestCase):
         playtimes = await playerTrackerData.get_playtimes_for_guild("Cat Cafe", after=after)
 
         self.assertIsInstance(playtimes, dict)
-        print(playtimes)
\ No newline at end of file
+        print(playtimes)
+
+def _stats(uuid: str, wars: int, last_join: str, playtime: float = 1.0) -> SimpleNamespace:
+    return SimpleNamespace(
+        uuid=uuid, username="Tester", rank="Player", supportRank=None, firstJoin="2020-01-01", lastJoin=last_join,
+        playtime=playtime, guild=None,
+        globalData=SimpleNamespace(wars=wars, totalLevel=100, killedMobs=10, chestsFound=5, dungeons=None,
+                                   raids=None, completedQuests=3, pvp=SimpleNamespace(kills=0, deaths=0))
+    )
+
+
+class TestRecordIngest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        await manager.init_database(os.path.join(self.tmp.name, "test.db"))
+        # (record time, wars) of every ingested record, including repeated ones
+        self.raw = []
+
+    async def asyncTearDown(self):
+        await manager.close()
+        self.tmp.cleanup()
+
+    async def _ingest(self, uuid: str, records: list[tuple[datetime.datetime, int]]):
+        for t, wars in records:
+            self.raw.append((t, wars))
+            await playerTrackerData.add_record(_stats(uuid, wars, t.isoformat()), t)
+        await playerTrackerData.flush_records()
+
+    async def _count(self, table: str) -> int:
+        cur = await manager.get_read_cursor()
+        res = await cur.execute(f"SELECT count(*) FROM {table}")
+        return (await res.fetchone())[0]
+
+    def _expected_history(self) -> list[tuple[datetime.datetime, int]]:
+        return sorted(set(self.raw))
+
+    async def _assert_matches_raw(self, uuid: str):
+        history = await playerTrackerData.get_history(PlayerStatsIdentifier.WARS, uuid)
+        self.assertEqual([(datetime.datetime.fromisoformat(t), wars) for t, wars, _ in history],
+                         self._expected_history())
+
+        stats = await playerTrackerData.get_stats(uuid, PlayerStatsIdentifier.WARS)
+        self.assertEqual(stats, tuple(wars for _, wars in self._expected_history()))
+
+        days = {}
+        for t, wars in self._expected_history():
+            first, _ = days.get(t.date(), (wars, None))
+            days[t.date()] = (first, wars)
+        daily = await playerTrackerData.get_daily_history(PlayerStatsIdentifier.WARS, uuid)
+        self.assertEqual([(datetime.date.fromisoformat(day), first, last) for day, first, last in daily],
+                         [(day, first, last) for day, (first, last) in sorted(days.items())])
+
+        cur = await manager.get_read_cursor()
+        res = await cur.execute("SELECT record_time, wars FROM player_latest WHERE uuid = ?", (uuid,))
+        row = await res.fetchone()
+        self.assertEqual((datetime.datetime.fromisoformat(row[0]), row[1]), self._expected_history()[-1])
+
+    async def test_repeated_records_become_heartbeats(self):
+        uuid = "00000000000000000000000000000001"
+        t = datetime.datetime(2024, 5, 1, 10)
+        await self._ingest(uuid, [(t, 1), (t + datetime.timedelta(hours=1), 1), (t + datetime.timedelta(hours=2), 1),
+                                  (t + datetime.timedelta(hours=3), 2)])
+        await self._ingest(uuid, [(t + datetime.timedelta(days=1), 2), (t + datetime.timedelta(hours=3), 2)])
+
+        self.assertEqual(await self._count("player_tracking"), 2)
+        self.assertEqual(await self._count("player_heartbeats"), 3)
+        await self._assert_matches_raw(uuid)
+
+    async def test_flush_bumps_changed_stats(self):
+        uuid = "00000000000000000000000000000005"
+        t = datetime.datetime(2024, 5, 1, 10)
+        await self._ingest(uuid, [(t, 1)])
+        wars = queryCache._stat_versions.get("wars", 0)
+
+        await self._ingest(uuid, [(t + datetime.timedelta(hours=1), 1)])
+        self.assertEqual(queryCache._stat_versions.get("wars", 0), wars)
+        await self._ingest(uuid, [(t + datetime.timedelta(hours=2), 2)])
+        self.assertEqual(queryCache._stat_versions.get("wars", 0), wars + 1)
+
+    async def test_failing_records_are_dropped(self):
+        t = datetime.datetime(2024, 5, 1, 10)
+        dropped = playerTrackerData.get_buffer_stats().dropped_records
+        await playerTrackerData.add_record(_stats("00000000000000000000000000000009", 1, t.isoformat()), t)
+        await playerTrackerData.add_record(_stats("0000000000000000000000000000000a", 1, t.isoformat()), t)
+        # a value sqlite can't bind fails the batch and its own retry
+        bad = playerTrackerData._record_buffer[-1]
+        wars = playerTrackerData.RECORD_COLUMNS.index("wars")
+        playerTrackerData._record_buffer[-1] = bad[:wars] + ([1],) + bad[wars + 1:]
+        await playerTrackerData.flush_records()
+
+        self.assertEqual(await self._count("player_latest"), 1)
+        self.assertEqual(playerTrackerData.get_buffer_stats().backlog, 0)
+        self.assertEqual(playerTrackerData.get_buffer_stats().dropped_records, dropped + 1)
+
+    async def test_backlog_is_capped(self):
+        t = datetime.datetime(2024, 5, 1, 10)
+        with unittest.mock.patch.object(playerTrackerData, "MAX_BACKLOG", 2), \
+                unittest.mock.patch.object(playerTrackerData, "_write_batch", side_effect=sqlite3.OperationalError):
+            for i in range(3):
+                await playerTrackerData.add_record(_stats("0000000000000000000000000000000b", i, t.isoformat()),
+                                                   t + datetime.timedelta(hours=i))
+            with self.assertRaises(sqlite3.OperationalError):
+                await playerTrackerData.flush_records()
+        self.assertEqual([row[0] for row in playerTrackerData._record_buffer],
+                         [t + datetime.timedelta(hours=1), t + datetime.timedelta(hours=2)])
+
+        playerTrackerData._retry_at = 0.0
+        await playerTrackerData.flush_records()
+        self.assertEqual(await self._count("player_tracking"), 2)
+
+    async def test_gain_leaderboard(self):
+        t = datetime.datetime(2024, 5, 1, 10)
+        day = datetime.timedelta(days=1)
+        await self._ingest("00000000000000000000000000000006", [(t - 5 * day, 1), (t, 3), (t + day, 7), (t + 3 * day, 9)])
+        await self._ingest("00000000000000000000000000000007", [(t - 5 * day, 2), (t + 2 * day, 4)])
+        await self._ingest("00000000000000000000000000000008", [(t + day, 5)])
+
+        # whole days: the records on the day of t_from count, the ones after the day of t_to don't
+        leaderboard = await playerTrackerData.get_gain_leaderboard(PlayerStatsIdentifier.WARS, t + datetime.timedelta(
+            hours=5), t + 2 * day)
+        self.assertEqual(leaderboard, [(1, "00000000000000000000000000000006", 4)])
+
+        leaderboard = await playerTrackerData.get_gain_leaderboard(PlayerStatsIdentifier.WARS, None, t + 2 * day)
+        self.assertEqual([row[1:] for row in leaderboard], [("00000000000000000000000000000006", 7),
+                                                              ("00000000000000000000000000000008", 5),
+                                                              ("00000000000000000000000000000007", 4)])
+
+    async def test_out_of_order_records(self):
+        uuid = "00000000000000000000000000000002"
+        t = datetime.datetime(2024, 5, 1, 10)
+        await self._ingest(uuid, [(t, 1), (t + datetime.timedelta(hours=2), 1), (t + datetime.timedelta(days=1), 1)])
+        # Arrives late and changes the values the later heartbeats repeat.
+        await self._ingest(uuid, [(t + datetime.timedelta(hours=1), 5), (t - datetime.timedelta(days=1), 0)])
+
+        await self._assert_matches_raw(uuid)
+
+    async def test_archive_round_trip(self):
+        uuid = "00000000000000000000000000000003"
+        t = datetime.datetime(2024, 1, 30, 10)
+        await self._ingest(uuid, [(t, 1), (t + datetime.timedelta(days=1), 2), (t + datetime.timedelta(days=2), 2),
+                                  (t + datetime.timedelta(days=3), 2), (t + datetime.timedelta(days=4), 3)])
+
+        archived = await manager.archive_month(datetime.date(2024, 1, 1))
+
+        self.assertEqual(archived, 2)
+        self.assertEqual(manager.get_archived_months(), [datetime.date(2024, 1, 1)])
+        cur = await manager.get_read_cursor()
+        res = await cur.execute("SELECT min(record_time) FROM player_snapshots")
+        self.assertEqual(datetime.datetime.fromisoformat((await res.fetchone())[0]), datetime.datetime(2024, 2, 1, 10))
+        await self._assert_matches_raw(uuid)
+        self.assertEqual(await playerTrackerData.get_stats(uuid, PlayerStatsIdentifier.WARS,
+                                                           before=datetime.datetime(2024, 1, 31, 12)), (1, 2))
+
+    async def test_archive_in_batches(self):
+        t = datetime.datetime(2024, 1, 31, 10)
+        uuids = [f"{i:032x}" for i in range(10, 13)]
+        for uuid in uuids:
+            await self._ingest(uuid, [(t, 1), (t + datetime.timedelta(days=1), 1)])
+
+        with unittest.mock.patch.object(manager, "ARCHIVE_BATCH_SIZE", 2), \
+                unittest.mock.patch.object(manager, "ARCHIVE_BATCH_DELAY", 0):
+            archived = await manager.archive_month(datetime.date(2024, 1, 1))
+
+        self.assertEqual(archived, 3)
+        self.assertEqual(await self._count("player_heartbeats"), 0)
+        for uuid in uuids:
+            stats = await playerTrackerData.get_stats(uuid, PlayerStatsIdentifier.WARS)
+            self.assertEqual(stats, (1, 1))
+
+    async def test_downsample_tiers(self):
+        uuid = "00000000000000000000000000000004"
+        # Wednesday, so the sunday of the week around daily_before is kept by the daily tier.
+        daily_before = datetime.datetime(2024, 5, 8, 12)
+        full_before = datetime.datetime(2024, 5, 22, 12)
+        t = datetime.datetime(2024, 4, 15)
+        records = []
+        while t < datetime.datetime(2024, 6, 1):
+            # Every second record only repeats the previous one and is stored as a heartbeat.
+            records.append((t, len(records) // 2))
+            t += datetime.timedelta(hours=5)
+        await self._ingest(uuid, records)
+
+        deleted, _ = await playerTrackerData.downsample_snapshots([uuid], full_before, daily_before)
+
+        kept = {}
+        for t, wars in records:
+            if t >= full_before:
+                key = t
+            elif t >= daily_before:
+                key = t.date()
+            else:
+                key = ("week", t.date() + datetime.timedelta(days=6 - t.weekday()))
+            kept[key] = max(kept.get(key, (t, wars)), (t, wars))
+        history = await playerTrackerData.get_history(PlayerStatsIdentifier.WARS, uuid)
+        self.assertEqual([(datetime.datetime.fromisoformat(t), wars) for t, wars, _ in history], sorted(kept.values()))
+        self.assertEqual(deleted, len(records) - len(kept))
+        daily = await playerTrackerData.get_daily_history(PlayerStatsIdentifier.WARS, uuid)
+        self.assertEqual(len(daily), len({t.date() for t, _ in records}))
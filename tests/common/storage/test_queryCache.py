@@ -0,0 +1,100 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+
+from common.storage import queryCache
+
+
+class TestQueryCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.calls = []
+
+        @queryCache.cached(uuid="uuid", maxsize=2)
+        async def query(uuid: str, after: datetime = None, before: datetime = None):
+            self.calls.append((uuid, after, before))
+            await asyncio.sleep(0)
+            return len(self.calls)
+
+        self.query = query
+
+    async def test_relative_ranges_share_buckets(self):
+        now = datetime(2024, 5, 1, 12, 1, 30)
+        await self.query("a", now - timedelta(days=30), now)
+        await self.query("a", now - timedelta(days=30) + timedelta(seconds=20), now + timedelta(seconds=20))
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.calls[0][1], datetime(2024, 4, 1, 12, 0))
+        self.assertEqual(self.calls[0][2], datetime(2024, 5, 1, 12, 5))
+
+    async def test_day_ranges(self):
+        @queryCache.cached(guild="guild", days=True)
+        async def gains(t_from: datetime, t_to: datetime, guild: str = None):
+            self.calls.append((t_from, t_to))
+            return len(self.calls)
+
+        await gains(datetime(2024, 4, 1, 12, 1), datetime(2024, 5, 1, 12, 1))
+        await gains(datetime(2024, 4, 1, 23, 59), datetime(2024, 5, 1, 0, 0))
+
+        self.assertEqual(self.calls, [(datetime(2024, 4, 1), datetime(2024, 5, 1))])
+
+    async def test_bump_invalidates_scope(self):
+        await self.query("a")
+        await self.query("b")
+        queryCache.bump(uuids=["A"])
+        await self.query("a")
+        await self.query("b")
+
+        self.assertEqual([c[0] for c in self.calls], ["a", "b", "a"])
+
+    async def test_lru_eviction(self):
+        for uuid in ("a", "b", "a", "c", "b"):
+            await self.query(uuid)
+
+        self.assertEqual([c[0] for c in self.calls], ["a", "b", "c", "b"])
+        self.assertEqual(self.query.cache_info().currsize, 2)
+
+    async def test_concurrent_calls_share_query(self):
+        results = await asyncio.gather(*(self.query("a") for _ in range(5)))
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(results, [1] * 5)
+
+    async def test_unscoped_entries_depend_on_stat(self):
+        @queryCache.cached(guild="guild", stat="stat")
+        async def leaderboard(stat: str, guild: str = None, after: datetime = None):
+            self.calls.append((stat, guild, after))
+            return len(self.calls)
+
+        after = datetime(2024, 5, 1)
+        for args in (("wars",), ("playtime",), ("wars", "Guild"), ("wars", None, after)):
+            await leaderboard(*args)
+        queryCache.bump(uuids=["a"], guilds=["other"], stats=["playtime"])
+        for args in (("wars",), ("playtime",), ("wars", "Guild"), ("wars", None, after)):
+            await leaderboard(*args)
+        queryCache.bump(stats=["record_time"])
+        await leaderboard("wars")
+        await leaderboard("wars", None, after)
+
+        self.assertEqual([c[0] for c in self.calls[4:]], ["playtime", "wars"])
+        self.assertEqual(self.calls[-1], ("wars", None, after))
+
+    async def test_cancelled_caller_keeps_shared_query(self):
+        release = asyncio.Event()
+
+        @queryCache.cached()
+        async def query():
+            self.calls.append(None)
+            await release.wait()
+            return len(self.calls)
+
+        first = asyncio.create_task(query())
+        await asyncio.sleep(0)
+        second = asyncio.create_task(query())
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await second, 1)
+        self.assertTrue(first.cancelled())
+        self.assertEqual(query.cache_info().hits, 1)
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+from common.storage import manager, memberSetData, playerTrackerData, seasonLeaderboardData
+from common.types.constants import seasons
+from common.types.enums import PlayerStatsIdentifier
+from common.types.wynncraft import WynncraftGuild
+from tests.common.storage.test_playerTrackerData import _stats
+
+SEASON = 1
+A = "0000000000000000000000000000000a"
+B = "0000000000000000000000000000000b"
+
+
+class TestSeasonLeaderboardData(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        await manager.init_database(os.path.join(self.tmp.name, "test.db"))
+        self.start, self.end = seasons[SEASON]
+
+        await self._ingest(A, self.start + timedelta(hours=1), 10)
+        await self._ingest(A, self.end - timedelta(hours=1), 30)
+        await self._ingest(B, self.start + timedelta(hours=1), 5)
+        await self._ingest(B, self.end - timedelta(hours=1), 6)
+
+    async def asyncTearDown(self):
+        await manager.close()
+        self.tmp.cleanup()
+
+    async def _ingest(self, uuid: str, t, wars: int):
+        await playerTrackerData.add_record(_stats(uuid, wars, t.isoformat()), t)
+        await playerTrackerData.flush_records()
+
+    async def _stored_rows(self) -> int:
+        cur = await manager.get_read_cursor()
+        res = await cur.execute("SELECT count(*) FROM season_leaderboards WHERE season = ?", (SEASON,))
+        return (await res.fetchone())[0]
+
+    async def test_freeze_on_first_read(self):
+        leaderboard = await seasonLeaderboardData.get_leaderboard(SEASON, PlayerStatsIdentifier.WARS)
+
+        self.assertEqual(leaderboard, [(1, A, 20), (2, B, 1)])
+        self.assertTrue(await seasonLeaderboardData._is_frozen(SEASON, PlayerStatsIdentifier.WARS))
+        self.assertEqual(await self._stored_rows(), 2)
+        self.assertEqual(await seasonLeaderboardData.get_leaderboard(SEASON, PlayerStatsIdentifier.WARS, limit=1),
+                         [(1, A, 20)])
+
+    async def test_guild_leaderboard(self):
+        await memberSetData.set_members("Season Guild", [B])
+
+        leaderboard = await seasonLeaderboardData.get_leaderboard(SEASON, PlayerStatsIdentifier.WARS,
+                                                                  guild=WynncraftGuild("Season Guild", "SG", ""))
+
+        self.assertEqual(leaderboard, [(1, B, 1)])
+
+    async def test_backfill_unfreezes(self):
+        await seasonLeaderboardData.get_leaderboard(SEASON, PlayerStatsIdentifier.WARS)
+
+        # B started the season earlier than recorded so far.
+        await self._ingest(B, self.start, 0)
+        self.assertFalse(await seasonLeaderboardData._is_frozen(SEASON, PlayerStatsIdentifier.WARS))
+
+        leaderboard = await seasonLeaderboardData.get_leaderboard(SEASON, PlayerStatsIdentifier.WARS)
+        self.assertEqual(leaderboard, [(1, A, 20), (2, B, 6)])
+        self.assertTrue(await seasonLeaderboardData._is_frozen(SEASON, PlayerStatsIdentifier.WARS))
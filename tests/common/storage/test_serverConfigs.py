@@ -0,0 +1,52 @@
+import json
+import os
+import tempfile
+import unittest
+
+from common.storage import manager
+from common.storage.serverConfigs import ServerConfigs
+
+
+class TestServerConfigs(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        await manager.init_database(os.path.join(self.tmp.name, "test.db"))
+
+    async def asyncTearDown(self):
+        await manager.close()
+        self.tmp.cleanup()
+
+    async def _stored(self):
+        cur = await manager.get_read_cursor()
+        res = await cur.execute("SELECT count(*) FROM server_configs")
+        return (await res.fetchone())[0]
+
+    async def test_new_server_not_stored(self):
+        configs = ServerConfigs("bot")
+        await configs.load()
+        self.assertEqual(configs.get(1).cmd_prefix, ".")
+        self.assertEqual(await self._stored(), 0)
+
+    async def test_save_and_load(self):
+        configs = ServerConfigs("bot")
+        await configs.load()
+        configs.get(1).cmd_prefix = "!"
+        await configs.save(1)
+
+        configs = ServerConfigs("bot")
+        await configs.load()
+        self.assertEqual(configs.get(1).cmd_prefix, "!")
+        other = ServerConfigs("other")
+        await other.load()
+        self.assertEqual(other.get(1).cmd_prefix, ".")
+
+    async def test_legacy_import(self):
+        path = os.path.join(self.tmp.name, "bot.json")
+        with open(path, mode='w') as f:
+            f.write(json.dumps({"1": {"cmd_prefix": "?", "log_channel_id": 5}}))
+
+        configs = ServerConfigs("bot", path)
+        await configs.load()
+        self.assertEqual(configs.get(1).cmd_prefix, "?")
+        self.assertEqual(configs.get(1).log_channel_id, 5)
+        self.assertEqual(await self._stored(), 1)
@@ -0,0 +1,30 @@
+import unittest
+
+from common.utils.prefixIndex import PrefixIndex
+
+
+class TestPrefixIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PrefixIndex([("Notch", "1"), ("notchy", "2"), ("Jeb_", "3"), ("NotchFan123", "4"), ("a", "5")])
+
+    def test_search(self):
+        self.assertEqual(self.index.search("NOTCH"), [("Notch", "1"), ("NotchFan123", "4"), ("notchy", "2")])
+        self.assertEqual(self.index.search("notc", limit=2), [("Notch", "1"), ("NotchFan123", "4")])
+        self.assertEqual(self.index.search("x"), [])
+
+    def test_get(self):
+        self.assertEqual(self.index.get("jeb_"), ("Jeb_", "3"))
+        self.assertEqual(self.index.get_key("3"), "Jeb_")
+        self.assertIsNone(self.index.get("Jeb"))
+
+    def test_set_replaces_key_and_value(self):
+        # a name change
+        self.index.set("Dinnerbone", "3")
+        self.assertIsNone(self.index.get("Jeb_"))
+        self.assertEqual(self.index.get("dinnerbone"), ("Dinnerbone", "3"))
+
+        # a name taken over by another player
+        self.index.set("NOTCH", "6")
+        self.assertIsNone(self.index.get_key("1"))
+        self.assertEqual(self.index.get("notch"), ("NOTCH", "6"))
+        self.assertEqual(len(self.index), 5)
@@ -0,0 +1,158 @@
+import asyncio
+import functools
+import gzip
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Awaitable, Callable
+
+from discord.ext import tasks
+
+import common.logging
+from common.storage import manager
+
+
+@dataclass(frozen=True)
+class BackupStats:
+    path: str
+    time: datetime
+    duration: float  # seconds
+    size: int  # bytes of the database copy
+    stored_size: int  # bytes on disk after compression
+    archives: int  # archive databases that were new or changed and copied as well
+
+
+_last_backup: BackupStats | None = None
+_failures = 0
+
+
+def get_last_backup() -> BackupStats | None:
+    """
+    Get the stats of the last successful backup since the bot started.
+    """
+    return _last_backup
+
+
+def get_failures() -> int:
+    """
+    Get the amount of failed backups since the bot started.
+    """
+    return _failures
+
+
+def _backup_dir() -> str:
+    return manager.BACKUP_DIR or os.path.join(os.path.dirname(manager.get_path()), "backups")
+
+
+def _backup_prefix(path: str = None) -> str:
+    return os.path.splitext(os.path.basename(path or manager.get_path()))[0] + "_"
+
+
+def _list_backups(directory: str, prefix: str = None) -> list[str]:
+    # oldest first, the names contain the backup time
+    if not os.path.isdir(directory):
+        return []
+    prefix = prefix or _backup_prefix()
+    return sorted(f for f in os.listdir(directory)
+                  if f.startswith(prefix) and (f.endswith(".db") or f.endswith(".db.gz")))
+
+
+def _compress(path: str) -> str:
+    with open(path, "rb") as src, gzip.open(f"{path}.gz.tmp", "wb") as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(f"{path}.gz.tmp", f"{path}.gz")
+    os.remove(path)
+    return f"{path}.gz"
+
+
+def _rotate(directory: str, keep: int, prefix: str = None):
+    backups = _list_backups(directory, prefix)
+    for f in backups[:max(len(backups) - keep, 0)]:
+        os.remove(os.path.join(directory, f))
+
+
+def _archive_changed(directory: str, month: date) -> bool:
+    # whether the archive was written after its newest backup was taken
+    backups = _list_backups(directory, _backup_prefix(manager.get_archive_path(month)))
+    return len(backups) == 0 or \
+        os.path.getmtime(manager.get_archive_path(month)) >= os.path.getmtime(os.path.join(directory, backups[-1]))
+
+
+async def _copy(copy: Callable[[str], Awaitable[None]], path: str) -> tuple[str, int]:
+    # writes the copy to a temporary file first and compresses it if enabled
+    # returns the path of the stored file and the size of the uncompressed copy
+    try:
+        await copy(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+    finally:
+        if os.path.exists(f"{path}.tmp"):
+            os.remove(f"{path}.tmp")
+    size = os.path.getsize(path)
+
+    if manager.BACKUP_COMPRESS:
+        path = await asyncio.to_thread(_compress, path)
+    return path, size
+
+
+async def backup() -> BackupStats:
+    """
+    Take a backup of the database, compress it if manager.BACKUP_COMPRESS is set and delete the oldest backups so
+    only manager.BACKUP_KEEP remain. The archive databases that are new or were written since their last backup are
+    copied to the same directory under their own names and rotated the same way. A month that is being archived is
+    copied by the next backup instead. Every copy is written to a temporary file first, so a backup file is never
+    incomplete.
+    """
+    directory = _backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    now = datetime.utcnow()
+    path = os.path.join(directory, f"{_backup_prefix()}{now:%Y-%m-%d_%H-%M-%S}.db")
+
+    t = time.perf_counter()
+    path, size = await _copy(manager.backup, path)
+    stored_size = os.path.getsize(path)
+
+    archives = 0
+    for month in manager.get_archived_months():
+        if not os.path.exists(manager.get_archive_path(month)) or manager.is_archiving(month) \
+                or not _archive_changed(directory, month):
+            continue
+        prefix = _backup_prefix(manager.get_archive_path(month))
+        await _copy(functools.partial(manager.backup_archive, month),
+                    os.path.join(directory, f"{prefix}{now:%Y-%m-%d_%H-%M-%S}.db"))
+        await asyncio.to_thread(_rotate, directory, manager.BACKUP_KEEP, prefix)
+        archives += 1
+    duration = time.perf_counter() - t
+
+    await asyncio.to_thread(_rotate, directory, manager.BACKUP_KEEP)
+
+    return BackupStats(path, now, duration, size, stored_size, archives)
+
+
+@tasks.loop(hours=max(manager.BACKUP_INTERVAL, 1 / 60), reconnect=True)
+async def backup_database():
+    global _last_backup, _failures
+    if _last_backup is None and len(backups := _list_backups(_backup_dir())) > 0:
+        # don't take a new backup on every restart
+        age = time.time() - os.path.getmtime(os.path.join(_backup_dir(), backups[-1]))
+        if age < manager.BACKUP_INTERVAL * 3600:
+            return
+
+    try:
+        _last_backup = await backup()
+        common.logging.info(f"Database backup: wrote {_last_backup.path} "
+                            f"({_last_backup.size / 1_000_000:.1f}MB, {_last_backup.stored_size / 1_000_000:.1f}MB "
+                            f"stored) and {_last_backup.archives} changed archives in {_last_backup.duration:.1f}s.")
+    except Exception as e:
+        _failures += 1
+        common.logging.error("Database backup failed.", exc_info=e)
+
+
+def start():
+    if manager.BACKUP_INTERVAL > 0:
+        backup_database.start()
+
+
+def stop():
+    backup_database.stop()
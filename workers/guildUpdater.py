@@ -1,4 +1,3 @@
-import dataclasses
 import json
 import os
 from collections.abc import Collection
@@ -11,6 +10,7 @@ import common.logging
 import common.logging
 from common.api.wynncraft.v3 import guild
 from common.guildLogger import GuildLogger
+from common.storage import guildSnapshotData, memberSetData
 from common.types.wynncraft import GuildStats
 from common.utils import minecraftPlayer
 from workers import usernameUpdater
@@ -26,31 +26,33 @@ class NameChangeLogger(usernameUpdater.NameChangeSubscriber):
         self.guild_name = guild_name
 
     async def name_changed(self, uuid: str, prev_name: str, new_name: str):
+        await self.names_changed([(uuid, prev_name, new_name)])
+
+    async def names_changed(self, changes: list[tuple[str, str, str]]):
         try:
             g = await guild.stats(name=self.guild_name)
         except Exception as e:
             common.logging.error(f"Name change logger failed to fetch guild data for bot guild {self.guild_name}!", e)
             return
 
-        if format_uuid(uuid, dashed=True) not in g.members.all:
-            return
-
-        await _guild_loggers[self.guild_name].log_member_name_change(uuid, prev_name, new_name)
+        for uuid, prev_name, new_name in changes:
+            if format_uuid(uuid, dashed=True) in g.members.all:
+                await _guild_loggers[self.guild_name].log_member_name_change(uuid, prev_name, new_name)
 
 
-def _load_guilds():
+async def _load_guild(name: str) -> GuildStats | None:
     try:
-        if os.path.exists(f"data/guilds.json"):
+        stored = (await guildSnapshotData.get_latest([name])).get(name)
+        if stored is None and os.path.exists(f"data/guilds.json"):
+            # stats stored by older versions
             with open(f"data/guilds.json", 'r') as _f:
-                global _guilds
-                _guilds = {name: GuildStats.from_json(data) for name, data in json.load(_f).items()}
+                data = {n.lower(): d for n, d in json.load(_f).items()}.get(name.lower())
+            if data is not None:
+                stored = GuildStats.from_json(data)
+        return stored
     except Exception as e:
         common.logging.error("Failed to load stored guild stats.", exc_info=e)
-
-
-def _store_guilds():
-    with open(f"data/guilds.json", "w") as f:
-        json.dump({name: dataclasses.asdict(data) for name, data in _guilds.items()}, f, indent=4)
+        return None
 
 
 async def _get_players(uuids: Collection[str]) -> dict[str, str]:
@@ -88,12 +90,6 @@ def add_guild(name: str, guild_logger: GuildLogger):
 
     usernameUpdater.subscribe(NameChangeLogger(name))
 
-    if _guilds == {}:
-        _load_guilds()
-
-    if name not in _guilds:
-        _guilds[name] = None
-
 
 def remove_guild(name: str):
     """
@@ -124,6 +120,9 @@ async def _update_guild(name: str):
             _active_guilds.remove(name)
             return
 
+        if name not in _guilds:
+            _guilds[name] = await _load_guild(name)
+
         if _guilds[name] is not None:
             joined, left = await _get_member_updates(_guilds[name], guild_now)
 
@@ -134,6 +133,8 @@ async def _update_guild(name: str):
             for uuid, pname in left.items():
                 await guild_logger.log_member_leave(pname, uuid)
 
+        await memberSetData.set_members(name, guild_now.members.all.keys())
+        await guildSnapshotData.store(guild_now)
         _guilds[name] = guild_now
     except common.api.rateLimit.RateLimitException:
         pass
@@ -158,7 +159,5 @@ async def guild_updater():
     if exc_count >= len(_active_guilds):
         raise Exception("All guild updates failed.")
 
-    _store_guilds()
-
 
 guild_updater.add_exception_type(Exception)
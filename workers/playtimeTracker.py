@@ -1,6 +1,7 @@
 import asyncio
 import os
-from datetime import datetime, timezone, time
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone, time
 
 import aiohttp.client_exceptions
 from discord.ext import tasks
@@ -10,7 +11,8 @@ import common.api.wynncraft.v3.session
 import common.api.wynncraft.v3.guild
 import common.api.wynncraft.v3.player
 import common.logging
-from common.storage.playtimeData import set_playtime
+from common.storage import playtimeData
+from common.types.enums import PrivateStat
 from workers.queueWorker import QueueWorker
 from workers.guildUpdater import get_active_guilds
 
@@ -19,43 +21,93 @@ load_dotenv()
 
 _worker = QueueWorker(delay=0.5)
 
-main_access_private_members = {}
-online_status_private_members = {}
+# Seconds until the playtimes of a finished run are stored again if storing them failed.
+STORE_RETRY_DELAY = 300
 
-async def _update_member(uuid: str, guild_name: str):
+main_access_private_members: dict[str, set[str]] = {}
+online_status_private_members: dict[str, set[str]] = {}
+
+
+@dataclass
+class _GuildRun:
+    guild_name: str
+    day: date
+    remaining: int
+    playtimes: dict[str, int] = field(default_factory=dict)
+    private_members: dict[PrivateStat, set[str]] = field(
+        default_factory=lambda: {stat: set() for stat in PrivateStat})
+
+
+# The runs in progress or not stored yet by guild name. A guild is only fetched by one run at a time.
+_runs: dict[str, _GuildRun] = {}
+
+
+async def load_private_members():
+    """
+    Load the private members stored by the last playtime run of each guild.
+    """
+    main_access_private_members.update(await playtimeData.get_private_members(PrivateStat.MAIN_ACCESS))
+    online_status_private_members.update(await playtimeData.get_private_members(PrivateStat.ONLINE_STATUS))
+
+
+async def _store_run(run: _GuildRun):
+    # The run is kept until its playtimes are stored, a failed store is retried after STORE_RETRY_DELAY.
     try:
-        if common.api.wynncraft.v3.player.calculate_remaining_requests() < 10:
-            wait_time = common.api.wynncraft.v3.player.ratelimit_reset_time()
-            await asyncio.sleep(wait_time + 1)
+        await playtimeData.set_guild_playtimes(run.guild_name, run.day, run.playtimes, run.private_members)
+    except Exception as ex:
+        common.logging.error(f"Failed to store the playtimes of {run.guild_name}, retrying in {STORE_RETRY_DELAY}s.",
+                             exc_info=ex)
+        _worker.put_delayed(_store_run, STORE_RETRY_DELAY, run)
+        return
+
+    if _runs.get(run.guild_name) is run:
+        del _runs[run.guild_name]
+
+    main_access_private_members[run.guild_name] = run.private_members[PrivateStat.MAIN_ACCESS]
+    online_status_private_members[run.guild_name] = run.private_members[PrivateStat.ONLINE_STATUS]
+
 
+async def _update_member(uuid: str, run: _GuildRun):
+    try:
         key = None
-        if guild_name == "Nerfuria":
+        if run.guild_name == "Nerfuria":
             key = os.getenv('WYNN_NIA_API_KEY')
 
         stats = await common.api.wynncraft.v3.player.stats(uuid, api_key=key)
 
         if stats.playtime is None:
-            main_access_private_members[guild_name].add(uuid)
+            run.private_members[PrivateStat.MAIN_ACCESS].add(uuid)
         else:
-            await set_playtime(uuid, datetime.now(timezone.utc).date(), int(stats.playtime * 60))
+            run.playtimes[uuid] = int(stats.playtime * 60)
 
         if stats.lastJoin is None:
-            online_status_private_members[guild_name].add(uuid)
+            run.private_members[PrivateStat.ONLINE_STATUS].add(uuid)
     except common.api.wynncraft.v3.player.UnknownPlayerException:
         common.logging.error(f'Failed to fetch stats for guild member with uuid {uuid}')
+    finally:
+        # The results of a guild are written at once after its last member was fetched.
+        run.remaining -= 1
+        if run.remaining == 0:
+            await _store_run(run)
 
 
 async def _update_guild(guild_name: str):
+    if guild_name in _runs:
+        common.logging.info(f"Skipping playtimes of {guild_name}, the run for {_runs[guild_name].day} is in progress "
+                            f"or not stored yet.")
+        return
+
     guild = await common.api.wynncraft.v3.guild.stats(name=guild_name)
 
-    main_access_private_members[guild_name] = set()
-    online_status_private_members[guild_name] = set()
+    members = [uuid.replace('-', '') for uuid in guild.members.all.keys()]
+    if len(members) == 0:
+        return
+    run = _runs[guild_name] = _GuildRun(guild_name, datetime.now(timezone.utc).date(), len(members))
 
-    for i, uuid in enumerate(guild.members.all.keys()):
-        uuid = uuid.replace('-', '')
+    for i, uuid in enumerate(members):
         if (i - 1) % 50 == 0:
             await asyncio.sleep(60)
-        _worker.put(_update_member, uuid, guild_name)
+        _worker.put(_update_member, uuid, run)
 
 
 @tasks.loop(time=time(hour=0, minute=0, tzinfo=timezone.utc), reconnect=True)
@@ -75,3 +127,20 @@ update_playtimes.add_exception_type(
     aiohttp.client_exceptions.ClientError,
     Exception
 )
+
+
+async def stop():
+    """
+    Stop the playtime tracker and store the playtimes of the runs that weren't stored yet. Unfinished runs keep the
+    stored private members of their guilds, as they only checked some of the members.
+    """
+    update_playtimes.cancel()
+    await _worker.stop_gracefully()
+
+    for run in list(_runs.values()):
+        del _runs[run.guild_name]
+        try:
+            await playtimeData.set_guild_playtimes(run.guild_name, run.day, run.playtimes,
+                                                   run.private_members if run.remaining == 0 else None)
+        except Exception as ex:
+            common.logging.error(f"Failed to store the playtimes of {run.guild_name} on shutdown.", exc_info=ex)
@@ -19,18 +19,25 @@ class QueueWorker:
         self._delay = delay
         self._task: asyncio.Task = None
         self._delayed_tasks = set()
+        # Whether a task from the queue is being executed right now.
+        self._busy = False
+        self._stopping = False
 
     async def _worker(self):
-        while True:
+        while not self._stopping:
             try:
                 await asyncio.sleep((2 ** self._error_count) - 1)
                 task, args, kwargs = await self._queue.get()
 
+                self._busy = True
                 try:
                     await discord.utils.maybe_coroutine(task, *args, **kwargs)
                 finally:
+                    self._busy = False
                     self._queue.task_done()
 
+                if self._stopping:
+                    return
                 if self._error_count > 0:
                     self._error_count -= 1
 
@@ -41,6 +48,8 @@ class QueueWorker:
                 common.logging.error(exc_info=ex)
                 if self._error_count < 12:
                     self._error_count += 1
+                if self._stopping:
+                    return
 
     def put(self, f: Callable, *args, **kwargs):
         """
@@ -115,3 +124,29 @@ class QueueWorker:
             self._task.cancel()
         self._error_count = 0
         self._task = None
+
+    async def stop_gracefully(self, timeout: float = 30.0):
+        """
+        Stop the worker and wait until the task it is executing finishes. Queued tasks are not executed.
+
+        :param timeout: The time in seconds after which the executing task is cancelled instead.
+        """
+        worker = self._task
+        if worker is None:
+            return
+
+        self._stopping = True
+        if not self._busy:
+            worker.cancel()
+        try:
+            await asyncio.wait_for(asyncio.shield(worker), timeout)
+        except asyncio.TimeoutError:
+            worker.cancel()
+            await asyncio.gather(worker, return_exceptions=True)
+        except asyncio.CancelledError:
+            if not worker.cancelled():
+                raise
+
+        self._stopping = False
+        self._error_count = 0
+        self._task = None
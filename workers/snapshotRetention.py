@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from discord.ext import tasks
+
+import common.logging
+from common.storage import guildSnapshotData, manager, playerTrackerData
+
+# Snapshots newer than this are kept at full resolution.
+FULL_RESOLUTION_AGE = timedelta(weeks=4)
+# Snapshots newer than this (and older than FULL_RESOLUTION_AGE) are kept at one per player per day. Older ones are
+# kept at one per player per week until they are archived.
+DAILY_RESOLUTION_AGE = timedelta(weeks=8)
+
+# Players processed per transaction. Keeps the writer free for the stat tracker in between.
+BATCH_SIZE = 50
+BATCH_DELAY = 0.5  # seconds
+
+# Whether old months are moved to the archives, see start().
+_archive = True
+
+
+@tasks.loop(hours=12, reconnect=True)
+async def downsample_snapshots():
+    """
+    Thin out old player snapshots in small batches and log how much was removed, then old guild snapshots one guild
+    at a time. Afterwards, months older than manager.ARCHIVE_AFTER_MONTHS are moved to the archive databases unless
+    start() disabled archiving.
+    """
+    now = datetime.utcnow()
+    full_before = now - FULL_RESOLUTION_AGE
+    daily_before = now - DAILY_RESOLUTION_AGE
+
+    cur = await manager.get_read_cursor()
+    res = await cur.execute("PRAGMA page_size")
+    page_size = (await res.fetchone())[0]
+
+    players = 0
+    deleted = 0
+    freed_pages = 0
+    after = ""
+    while len(uuids := await playerTrackerData.get_tracked_uuids(after, BATCH_SIZE)) > 0:
+        try:
+            batch_deleted, batch_freed_pages = await playerTrackerData.downsample_snapshots(
+                uuids, full_before, daily_before)
+        except Exception as e:
+            common.logging.error(f"Failed to downsample snapshots after uuid {after}.", exc_info=e)
+            raise e
+
+        players += len(uuids)
+        deleted += batch_deleted
+        freed_pages += batch_freed_pages
+        after = uuids[-1]
+        await asyncio.sleep(BATCH_DELAY)
+
+    common.logging.info(f"Snapshot retention: removed {deleted} snapshots of {players} players, "
+                        f"freed {freed_pages * page_size / 1_000_000:.1f}MB.")
+
+    guilds = await guildSnapshotData.get_guild_names()
+    deleted = 0
+    for guild_name in guilds:
+        try:
+            deleted += await guildSnapshotData.downsample_snapshots(guild_name, full_before, daily_before)
+        except Exception as e:
+            common.logging.error(f"Failed to downsample snapshots of guild {guild_name}.", exc_info=e)
+            raise e
+        await asyncio.sleep(BATCH_DELAY)
+    common.logging.info(f"Snapshot retention: removed {deleted} snapshots of {len(guilds)} guilds.")
+
+    if not _archive:
+        return
+
+    try:
+        archived = await manager.archive_old_months()
+    except Exception as e:
+        common.logging.error("Failed to archive old snapshots.", exc_info=e)
+        raise e
+    if archived > 0:
+        common.logging.info(f"Snapshot retention: moved {archived} snapshots to the monthly archives.")
+
+
+downsample_snapshots.add_exception_type(Exception)
+
+
+def start():
+    global _archive
+    # Months are archived once they are ARCHIVE_AFTER_MONTHS full months old, so the youngest archived snapshots are
+    # about that many months old. The archives aren't downsampled, so every tier has to be reached before that.
+    _archive = manager.ARCHIVE_AFTER_MONTHS <= 0 or \
+        DAILY_RESOLUTION_AGE < timedelta(days=28 * manager.ARCHIVE_AFTER_MONTHS)
+    if not _archive:
+        common.logging.error(f"Snapshot retention: ARCHIVE_AFTER_MONTHS ({manager.ARCHIVE_AFTER_MONTHS}) would archive "
+                             f"snapshots before they are downsampled to one per week after "
+                             f"{DAILY_RESOLUTION_AGE.days} days. Snapshots won't be archived.")
+    downsample_snapshots.start()
+
+
+def stop():
+    downsample_snapshots.cancel()
@@ -1,4 +1,3 @@
-import asyncio
 import os
 
 import aiohttp.client_exceptions
@@ -30,15 +29,11 @@ _first_update = True
 
 
 async def _record_stats(uuid: str, tries: int, api_key: str=None):
-    if common.api.wynncraft.v3.player.calculate_remaining_requests() < 10:
-        wait_time = common.api.wynncraft.v3.player.ratelimit_reset_time()
-        await asyncio.sleep(wait_time + 1)
-
     stats = None
     try:
         stats = await common.api.wynncraft.v3.player.stats(uuid=uuid, api_key=api_key)
         player = MinecraftPlayer(uuid=stats.uuid, name=stats.username)
-        await workers.usernameUpdater.update_username(player)
+        await workers.usernameUpdater.queue_username(player)
         if stats.globalData is None:
             return # Main access set to private, no stats available.
         await common.storage.playerTrackerData.add_record(stats)
@@ -109,12 +104,34 @@ async def _update_online():
 _update_online.add_exception_type(aiohttp.client_exceptions.ClientError, Exception)
 
 
+@tasks.loop(seconds=5, reconnect=True)
+async def _flush_records():
+    try:
+        await common.storage.playerTrackerData.flush_due_records()
+    except Exception as ex:
+        common.logging.error("Failed to flush buffered player records.", exc_info=ex)
+        raise ex
+
+
+_flush_records.add_exception_type(Exception)
+
+
 def start():
     _update_online.start()
     _worker.start()
+    _flush_records.start()
     common.logging.info("Stat Tracker worker started.")
 
 
-def stop():
-    _worker.stop()
+async def stop():
+    """
+    Stop the stat tracker and write any buffered records to the database. The record that is being fetched is
+    buffered before the final flush.
+    """
     _update_online.stop()
+    _flush_records.stop()
+    await _worker.stop_gracefully()
+    try:
+        await common.storage.playerTrackerData.flush_records()
+    except Exception as ex:
+        common.logging.error("Failed to flush buffered player records on shutdown.", exc_info=ex)
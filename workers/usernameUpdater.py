@@ -1,4 +1,7 @@
 from abc import ABC, abstractmethod
+from collections.abc import Iterable
+
+from discord.ext import tasks
 
 import common.api.minecraft
 import common.api.rateLimit
@@ -16,11 +19,27 @@ _worker = QueueWorker(delay=0.5)
 _queued_names: set[str] = set()
 
 
+# Names are written once this many are queued or every FLUSH_INTERVAL seconds.
+MAX_BUFFERED_NAMES = 200
+FLUSH_INTERVAL = 10
+
+_name_buffer: dict[str, str] = {}
+
+
 class NameChangeSubscriber(ABC):
     @abstractmethod
     async def name_changed(self, uuid: str, prev_name: str, new_name: str):
         pass
 
+    async def names_changed(self, changes: list[tuple[str, str, str]]):
+        """
+        Called once with all name changes of a batch. Calls name_changed for every change by default.
+
+        :param changes: A list of (uuid, previous name, new name) tuples.
+        """
+        for uuid, prev_name, new_name in changes:
+            await self.name_changed(uuid, prev_name, new_name)
+
 
 _subscribers: list[NameChangeSubscriber] = []
 
@@ -32,9 +51,73 @@ def subscribe(subscriber: NameChangeSubscriber):
     _subscribers.append(subscriber)
 
 
+async def update_usernames(players: Iterable[MinecraftPlayer]):
+    """
+    Store the names of many players in a single transaction and notify the subscribers of all name changes at once.
+    """
+    changes = await common.storage.usernameData.update_many(players)
+    if len(changes) == 0:
+        return
+
+    for subscriber in _subscribers:
+        try:
+            await subscriber.names_changed(changes)
+        except Exception as e:
+            common.logging.error(f"Name change subscriber {subscriber.__class__.__name__} failed.", exc_info=e)
+
+
 async def update_username(player: MinecraftPlayer):
-    prev_p = await common.storage.usernameData.update(player.uuid, player.name)
+    await update_usernames((player,))
+
+
+async def queue_username(player: MinecraftPlayer):
+    """
+    Queue the name of a player to be stored with the next batch (see :func:`flush_usernames`).
+    """
+    _name_buffer[player.uuid.replace("-", "").lower()] = player.name
+    if len(_name_buffer) >= MAX_BUFFERED_NAMES:
+        await flush_usernames()
 
-    if prev_p is not None and prev_p.name != player.name:
-        for subscriber in _subscribers:
-            await subscriber.name_changed(player.uuid, prev_p.name, player.name)
+
+async def flush_usernames():
+    """
+    Store all queued names. If the write fails the names are queued again and the exception is re-raised.
+    """
+    global _name_buffer
+    if len(_name_buffer) == 0:
+        return
+
+    batch = _name_buffer
+    _name_buffer = {}
+    try:
+        await update_usernames(batch.items())
+    except Exception:
+        _name_buffer = batch | _name_buffer
+        raise
+
+
+@tasks.loop(seconds=FLUSH_INTERVAL, reconnect=True)
+async def _flush_usernames():
+    try:
+        await flush_usernames()
+    except Exception as ex:
+        common.logging.error("Failed to store queued usernames.", exc_info=ex)
+        raise ex
+
+
+_flush_usernames.add_exception_type(Exception)
+
+
+def start():
+    _flush_usernames.start()
+
+
+async def stop():
+    """
+    Stop the username updater and store any queued names.
+    """
+    _flush_usernames.stop()
+    try:
+        await flush_usernames()
+    except Exception as ex:
+        common.logging.error("Failed to store queued usernames on shutdown.", exc_info=ex)
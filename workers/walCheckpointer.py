@@ -0,0 +1,23 @@
+from discord.ext import tasks
+
+import common.logging
+from common.storage import manager
+
+
+@tasks.loop(seconds=max(1, manager.CHECKPOINT_INTERVAL), reconnect=True)
+async def checkpoint():
+    try:
+        busy, wal_pages, checkpointed = await manager.checkpoint()
+        if busy:
+            common.logging.debug(f"WAL checkpoint was blocked ({checkpointed}/{wal_pages} pages checkpointed)")
+    except Exception as e:
+        common.logging.error(exc_info=e)
+
+
+def start():
+    if manager.CHECKPOINT_INTERVAL > 0:
+        checkpoint.start()
+
+
+def stop():
+    checkpoint.stop()